@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import math
+import tarkistussumma
 
 
 class Luottokerros:
@@ -29,7 +30,7 @@ class Luottokerros:
     #   'wait_call1'  # Odotetaan lähetettävää viestiä nro 1.
     #   'wait_ack1'   # Odotetaan paketin nro 1 kuittausta.
     
-    def __init__(self, soketti, puskurin_koko):
+    def __init__(self, soketti, puskurin_koko, tarkistus='crc8'):
         # Koska sekä vastaanottaja että lähettäjä luovat oman Luottokerros-
         # olionsa, ei ole järkevää asettaa ensimmäistä tilaa vielä tässä.
         # Tila asetetaan metodissa lahett_aseta_alkutila() tai
@@ -38,7 +39,9 @@ class Luottokerros:
                              
         self.soketti = soketti
         self.puskurin_koko = puskurin_koko
-        self.rek = 0  # Siirtorekisterin sisältö.
+        # Tarkistussumma-algoritmi, oletuksena CRC 8. Vaihtoehdot
+        # löytyvät moduulista tarkistussumma.
+        self.tarkistus = tarkistussumma.hae(tarkistus)
 
 
     ############################################################
@@ -88,7 +91,8 @@ class Luottokerros:
     def pura(self, paketti):
         '''Palauttaa sekvenssinumeron ja datakentän dekoodattuina.'''
         sekvno = paketti[0]  # Kokonaisluku, ei tarvitse enää dekoodata.
-        data = paketti[1:-1]  # Bittijono, pitää dekoodata.
+        loppu = len(paketti) - self.tarkistus.pituus  # Tarkistussumma pois.
+        data = paketti[1:loppu]  # Bittijono, pitää dekoodata.
         data = data.decode('utf8', errors='ignore')
         return (sekvno, data)
                 
@@ -239,59 +243,17 @@ class Luottokerros:
             return (False, None)
 
         
-    ###############################
-    # CRC 8:aan liittyvät metodit #
-    ###############################
+    ######################################
+    # Tarkistussummaan liittyvät metodit #
+    ######################################
 
     def tarkasta(self, data, testaus=False):
-        '''Suorittaa CRC 8 -tarkastuksen vastaanotetulle datalle.'''
-        data = int.from_bytes(data, byteorder='big')
-        self.crc8(data, testaus)
-        return self.rek == 0
+        '''Tarkastaa vastaanotetun datan valitulla
+        tarkistussumma-algoritmilla.'''
+        return self.tarkistus.tarkasta(data, testaus)
         
         
     def laske_tark(self, data, testaus=False):
-        '''Palauttaa CRC 8 -tarkistussumman bittijonona.'''
-        data = int.from_bytes(data, byteorder='big')
-        data = data << 8  # Kahdeksan nollaa perään.
-        self.crc8(data, testaus)  # Lasketaan tarkistussumma.
-        return self.rek.to_bytes(length=1, byteorder='big')
-        
-
-    def crc8(self, data, testaus=False):
-        '''CRC 8 -algoritmin toteutus kokonaislukumuotoiselle datalle.'''
-        self.rek = 0
-
-        # Annetaan jokainen bitti erikseen siirtorekisterille.
-        pituus = data.bit_length()
-        for i in range(pituus, 0, -1):
-            bitti = ((1 << i-1) & data) >> i-1  # Bitti kohdassa i-1.
-            self.siirtorek(bitti, testaus)
-    
-
-    def siirtorek(self, bitti, testaus):
-        '''Suorittaa yhden siirtorekisterin askeleen.'''
-        if testaus:
-            print('Rekisteri ensin: {}\ntuleva bitti: {}'.\
-                  format(bin(self.rek), bitti))
-
-        # Bitit.
-        bitti7 = (self.rek & 0b10000000) >> 7  # Bitti kohdassa 7.
-        bitti1 = (self.rek & 0b10) >> 1  # Bitti kohdassa 1.
-        bitti0 = self.rek & 0b1  # Bitti kohdassa 0.
-
-        # Uudet arvot.
-        bitti2 = bitti7 ^ bitti1
-        bitti1 = bitti7 ^ bitti0
-        bitti0 = bitti7 ^ bitti
-        uudet = (bitti2 << 2) | (bitti1 << 1) | bitti0  # Yhdistelmä.
-
-        # Laitetaan uudet arvot rekisteriin.
-        self.rek = self.rek << 1  # Siirretään bittejä yksi vasemmalle.
-        self.rek = self.rek & 0b11111000  # Nollataan vanhat.
-        self.rek = self.rek | uudet  # Uudet arvot tilalle.
-
-        if testaus:
-            print('Rekisteri jälkeen: {}\n'.format(bin(self.rek)))
-        
-    
+        '''Palauttaa valitun algoritmin mukaisen tarkistussumman
+        bittijonona.'''
+        return self.tarkistus.laske(data, testaus)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import math
+import tarkistussumma
 
 
 class Luottokerros:
@@ -15,13 +16,15 @@ class Luottokerros:
     '''
 
     
-    def __init__(self, soketti, puskurin_koko):
+    def __init__(self, soketti, puskurin_koko, tarkistus='crc8'):
         self.soketti = soketti
         self.puskurin_koko = puskurin_koko
         self.sekv = 0  # Sekvenssinumero. Lähettäjällä lähetettävän paketin
                        # numero, vastaanottajalla se numero, jota
                        # tulevassa paketissa odotetaan.
-        self.rek = 0  # Siirtorekisterin sisältö.
+        # Tarkistussumma-algoritmi, oletuksena CRC 8. Vaihtoehdot
+        # löytyvät moduulista tarkistussumma.
+        self.tarkistus = tarkistussumma.hae(tarkistus)
 
         
     def vaihda_sekv(self):
@@ -59,7 +62,8 @@ class Luottokerros:
         kuittaus, _ = self.soketti.recvfrom(self.puskurin_koko)
         # Jos kuittauksessa on bittivirhe, palautetaan false.
         kuittaus_ok = self.tarkasta(kuittaus)
-        kuittaus_teksti = kuittaus[0:-1].decode('utf8', errors='ignore')
+        loppu = len(kuittaus) - self.tarkistus.pituus  # Tarkistussumma pois.
+        kuittaus_teksti = kuittaus[0:loppu].decode('utf8', errors='ignore')
 
         # Toimitaan tilanteen mukaan:
         if not kuittaus_ok:
@@ -144,7 +148,8 @@ class Luottokerros:
     def pura(self, paketti):
         '''Palauttaa sekvenssinumeron ja datakentän dekoodattuina.'''
         sekvno = paketti[0]  # Kokonaisluku, ei tarvitse enää dekoodata.
-        data = paketti[1:-1]  # Bittijono, pitää dekoodata.
+        loppu = len(paketti) - self.tarkistus.pituus  # Tarkistussumma pois.
+        data = paketti[1:loppu]  # Bittijono, pitää dekoodata.
         data = data.decode('utf8', errors='ignore')
         return (sekvno, data)
                 
@@ -164,59 +169,17 @@ class Luottokerros:
         self.laheta(viesti, vastott)
 
         
-    ###############################
-    # CRC 8:aan liittyvät metodit #
-    ###############################
+    ######################################
+    # Tarkistussummaan liittyvät metodit #
+    ######################################
 
     def tarkasta(self, data, testaus=False):
-        '''Suorittaa CRC 8 -tarkastuksen vastaanotetulle datalle.'''
-        data = int.from_bytes(data, byteorder='big')
-        self.crc8(data, testaus)
-        return self.rek == 0
+        '''Tarkastaa vastaanotetun datan valitulla
+        tarkistussumma-algoritmilla.'''
+        return self.tarkistus.tarkasta(data, testaus)
         
         
     def laske_tark(self, data, testaus=False):
-        '''Palauttaa CRC 8 -tarkistussumman bittijonona.'''
-        data = int.from_bytes(data, byteorder='big')
-        data = data << 8  # Kahdeksan nollaa perään.
-        self.crc8(data, testaus)  # Lasketaan tarkistussumma.
-        return self.rek.to_bytes(length=1, byteorder='big')
-        
-
-    def crc8(self, data, testaus=False):
-        '''CRC 8 -algoritmin toteutus kokonaislukumuotoiselle datalle.'''
-        self.rek = 0
-
-        # Annetaan jokainen bitti erikseen siirtorekisterille.
-        pituus = data.bit_length()
-        for i in range(pituus, 0, -1):
-            bitti = ((1 << i-1) & data) >> i-1  # Bitti kohdassa i-1.
-            self.siirtorek(bitti, testaus)
-    
-
-    def siirtorek(self, bitti, testaus):
-        '''Suorittaa yhden siirtorekisterin askeleen.'''
-        if testaus:
-            print('Rekisteri ensin: {}\ntuleva bitti: {}'.\
-                  format(bin(self.rek), bitti))
-
-        # Bitit.
-        bitti7 = (self.rek & 0b10000000) >> 7  # Bitti kohdassa 7.
-        bitti1 = (self.rek & 0b10) >> 1  # Bitti kohdassa 1.
-        bitti0 = self.rek & 0b1  # Bitti kohdassa 0.
-
-        # Uudet arvot.
-        bitti2 = bitti7 ^ bitti1
-        bitti1 = bitti7 ^ bitti0
-        bitti0 = bitti7 ^ bitti
-        uudet = (bitti2 << 2) | (bitti1 << 1) | bitti0  # Yhdistelmä.
-
-        # Laitetaan uudet arvot rekisteriin.
-        self.rek = self.rek << 1  # Siirretään bittejä yksi vasemmalle.
-        self.rek = self.rek & 0b11111000  # Nollataan vanhat.
-        self.rek = self.rek | uudet  # Uudet arvot tilalle.
-
-        if testaus:
-            print('Rekisteri jälkeen: {}\n'.format(bin(self.rek)))
-        
-    
+        '''Palauttaa valitun algoritmin mukaisen tarkistussumman
+        bittijonona.'''
+        return self.tarkistus.laske(data, testaus)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+
+class Ajastin:
+    '''Yksittäinen ajastus. Tapahtumasilmukka.ajasta() (moduuli
+    tapahtumasilmukka.py) palauttaa tällaisen olion, jonka avulla
+    ajastuksen voi perua.'''
+
+    def __init__(self, palvelu, hetki, funktio, args):
+        self.palvelu = palvelu
+        self.hetki = hetki  # time.monotonic()-aika, jolloin funktiota
+                            # kutsutaan.
+        self.funktio = funktio
+        self.args = args
+        self.peruttu = False
+
+
+    def peru(self):
+        '''Peruu ajastuksen. Ajastusta ei poisteta keosta heti, vaan
+        tapahtumasilmukka ohittaa sen, joten peruminen vie vakioajan.
+        Laskuria päivitetään palvelun lukon alla, koska peru()-metodia
+        kutsutaan myös muista säikeistä kuin silmukan säikeestä.'''
+        with self.palvelu.lukko:
+            if not self.peruttu:
+                self.peruttu = True
+                self.palvelu.perutut += 1
+
+
+    # Sama nimi kuin threading.Timer-luokassa, jotta ajastimen voi perua
+    # samalla tavalla kuin ennenkin.
+    cancel = peru
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import luotettavuus
+import tarkistussumma
+import timeit
+
+
+def mittaa(funktio, toistot):
+    '''Palauttaa yhden kutsun keston mikrosekunteina.'''
+    return timeit.timeit(funktio, number=toistot) / toistot * 1e6
+
+
+def main():
+    '''Pääohjelma. Vertailee pakettien valmistelua ja tarkastamista
+    yksitellen ja eränä eri ikkunan kokoisilla paketti-
+    joukoilla.'''
+    ikkunat = [4, 64, 1024]
+    viesti = 'x' * 100  # Hyötykuorman koko tavuina.
+
+    print('Erän käsittelyaika, µs (yksitellen / eränä).')
+    if tarkistussumma.np is None:
+        print('(NumPyä ei ole asennettu, joten erätkin käsitellään '
+              'silmukassa.)')
+    for nimi in ['crc8', 'crc32']:
+        krs = luotettavuus.Luottokerros(None, 256, nimi)
+        krs.max = 256
+        print('\n{}:'.format(nimi))
+        print('{:>8}{:>24}{:>24}'.format('ikkuna', 'valmistelu',
+                                          'tarkastus'))
+        for ikkuna in ikkunat:
+            toistot = max(1, 4096 // ikkuna)
+            viestit = ikkuna * [viesti]
+            paketit = krs.valm_paketit(0, viestit)
+
+            valm_yks = mittaa(lambda: [krs.valm_paketti(i % krs.max, v)
+                                       for i, v in enumerate(viestit)],
+                              toistot)
+            valm_era = mittaa(lambda: krs.valm_paketit(0, viestit), toistot)
+            tark_yks = mittaa(lambda: [krs.tarkasta(p) for p in paketit],
+                              toistot)
+            tark_era = mittaa(lambda: krs.tarkasta_monta(paketit), toistot)
+            print('{:>8}{:>12.0f} /{:>9.0f}{:>14.0f} /{:>9.0f}'.format(
+                ikkuna, valm_yks, valm_era, tark_yks, tark_era))
+
+
+main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket as s
+import struct
+import sys
+import weakref
+
+# Eräsiirto: useita paketteja yhdellä sendmmsg- tai recvmmsg-kutsulla.
+# Ne ovat Linuxin järjestelmäkutsuja, joita kutsutaan ctypesin avulla.
+# Muualla eräsiirto ei ole käytettävissä (libc on None), ja kutsujat
+# käyttävät soketin tavallisia metodeja paketti kerrallaan.
+libc = None
+if sys.platform.startswith('linux'):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.sendmmsg
+        libc.recvmmsg
+    except (OSError, AttributeError):
+        libc = None
+
+ERA = 32  # Kerralla luettavien pakettien oletusmäärä.
+SOCKADDR_KOKO = 128  # sizeof(struct sockaddr_storage)
+
+# UDP-segmentoinnin siirto (Linux). GSO:ssa (UDP_SEGMENT) yksi
+# sendmsg-kutsu kuljettaa monta samankokoista pakettia, jotka ydin tai
+# verkkokortti jakaa erillisiksi paketeiksi. GRO:ssa (UDP_GRO) ydin
+# yhdistää saapuvat samankokoiset paketit, ja recvmsg palauttaa ne
+# yhtenä puskurina segmentin koon kanssa. socket-moduulissa ei ole
+# vakioita, joten arvot ovat Linuxin otsaketiedostosta linux/udp.h.
+SOL_UDP = getattr(s, 'SOL_UDP', 17)
+UDP_SEGMENT = 103
+UDP_GRO = 104
+GSO_SEGMENTTEJA = 64  # Yhden kutsun segmenttien enimmäismäärä
+                      # (UDP_MAX_SEGMENTS).
+GSO_TAVUJA = 65507  # Yhden kutsun hyötykuorman enimmäiskoko.
+GRO_PUSKURI = 65535  # Yhdistetyn paketin lukemiseen tarvittava puskuri.
+
+
+class Iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class Msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(Iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class Mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', Msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+# Lähetysosoitteet sockaddr-muodossa, jotta nimeä ei tarvitse selvittää
+# jokaisella kutsulla.
+_osoitteet = {}
+
+# Soketit, joiden GSO-tuki on jo selvitetty (ks. tukee_gso()). Tuki
+# selvitetään järjestelmäkutsulla, joten tulos tallennetaan sokettia
+# kohti. Heikot viittaukset poistavat tuloksen, kun soketti vapautetaan.
+_gso_tuki = weakref.WeakKeyDictionary()
+
+
+def tukee(soketti, metodi):
+    '''Palauttaa True, jos soketin metodin (sendto tai recvfrom_into)
+    sijasta voi käyttää eräsiirtoa. Aliluokkien korvaamia metodeja (esim.
+    virtsoketti.Virtuaalisoketti.recvfrom_into) ei ohiteta, jotta niiden
+    toiminta, kuten pakettien hukkaaminen, säilyy.'''
+    return (libc is not None and tukee_perhe(soketti) and
+            getattr(type(soketti), metodi) is getattr(s.socket, metodi))
+
+
+def laheta_monta(soketti, paketit, osoite):
+    '''Lähettää paketit osoitteeseen yhdellä sendmmsg-kutsulla (tai
+    useammalla, jos ydin ei ota kaikkia kerralla). Palauttaa lähetettyjen
+    pakettien määrän. Jos yhtäkään pakettia ei voitu lähettää, aiheutuu
+    sama poikkeus kuin sendto-metodissa (esim. BlockingIOError).'''
+    maara = len(paketit)
+    if maara == 0:
+        return 0
+    nimi = sockaddr(soketti.family, osoite)
+    datat = [_ctypes_puskuri(paketti) for paketti in paketit]
+    iovecit = (Iovec * maara)()
+    viestit = (Mmsghdr * maara)()
+    for i, data in enumerate(datat):
+        iovecit[i].iov_base = ctypes.addressof(data)
+        iovecit[i].iov_len = len(data)
+        otsake = viestit[i].msg_hdr
+        otsake.msg_name = ctypes.addressof(nimi)
+        otsake.msg_namelen = len(nimi)
+        otsake.msg_iov = ctypes.pointer(iovecit[i])
+        otsake.msg_iovlen = 1
+    lahetetty = 0
+    while lahetetty < maara:
+        tulos = libc.sendmmsg(soketti.fileno(),
+                              ctypes.byref(viestit, lahetetty *
+                                           ctypes.sizeof(Mmsghdr)),
+                              maara - lahetetty, 0)
+        if tulos >= 0:
+            lahetetty += tulos
+            continue
+        virhe = ctypes.get_errno()
+        if virhe == errno.EINTR:
+            continue
+        if lahetetty and virhe in (errno.EAGAIN, errno.EWOULDBLOCK):
+            break
+        raise OSError(virhe, os.strerror(virhe))
+    return lahetetty
+
+
+def vastaanota_monta(soketti, puskurit, nbytes=0):
+    '''Lukee estämättä yhdellä recvmmsg-kutsulla jo saapuneet paketit
+    puskureihin, enintään yhden kuhunkin. Palauttaa listan
+    (pituus, lähettäjä)-pareja samassa muodossa kuin recvfrom_into.
+    Paketit ovat puskurien alussa järjestyksessä. Jos paketteja ei ole,
+    palauttaa tyhjän listan.'''
+    maara = len(puskurit)
+    if maara == 0:
+        return []
+    nimet = bytearray(maara * SOCKADDR_KOKO)
+    nimet_c = (ctypes.c_char * len(nimet)).from_buffer(nimet)
+    datat = [_ctypes_puskuri(puskuri) for puskuri in puskurit]
+    iovecit = (Iovec * maara)()
+    viestit = (Mmsghdr * maara)()
+    for i, data in enumerate(datat):
+        iovecit[i].iov_base = ctypes.addressof(data)
+        iovecit[i].iov_len = min(nbytes, len(data)) if nbytes else len(data)
+        otsake = viestit[i].msg_hdr
+        otsake.msg_name = ctypes.addressof(nimet_c) + i * SOCKADDR_KOKO
+        otsake.msg_namelen = SOCKADDR_KOKO
+        otsake.msg_iov = ctypes.pointer(iovecit[i])
+        otsake.msg_iovlen = 1
+    while True:
+        tulos = libc.recvmmsg(soketti.fileno(), viestit, maara,
+                              s.MSG_DONTWAIT, None)
+        if tulos >= 0:
+            break
+        virhe = ctypes.get_errno()
+        if virhe == errno.EINTR:
+            continue
+        if virhe in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return []
+        raise OSError(virhe, os.strerror(virhe))
+    return [(viestit[i].msg_len, _lue_sockaddr(nimet, i * SOCKADDR_KOKO))
+            for i in range(tulos)]
+
+
+def lue_altaaseen(soketti, allas, maara=ERA):
+    '''Lukee vastaanota_monta()-funktiolla enintään maara pakettia
+    altaan (puskuriallas.Puskuriallas) puskureihin. Palauttaa listan
+    (puskuri, pituus, lähettäjä)-monikoita. Käyttämättä jääneet
+    puskurit palautetaan altaaseen.'''
+    puskurit = [allas.varaa() for _ in range(maara)]
+    try:
+        tulokset = vastaanota_monta(soketti, puskurit, allas.koko)
+    except OSError:
+        for puskuri in puskurit:
+            allas.vapauta(puskuri)
+        raise
+    for puskuri in puskurit[len(tulokset):]:
+        allas.vapauta(puskuri)
+    return [(puskuri, pituus, lahettaja) for puskuri, (pituus, lahettaja)
+            in zip(puskurit, tulokset)]
+
+
+def tukee_gso(soketti):
+    '''Palauttaa True, jos soketilla voi lähettää GSO:lla. Tulos
+    selvitetään vain soketin ensimmäisellä kutsulla.'''
+    if not (sys.platform.startswith('linux') and tukee_perhe(soketti) and
+            type(soketti).sendto is s.socket.sendto):
+        return False
+    tuki = _gso_tuki.get(soketti)
+    if tuki is None:
+        try:
+            soketti.getsockopt(SOL_UDP, UDP_SEGMENT)
+            tuki = True
+        except OSError:
+            tuki = False
+        _gso_tuki[soketti] = tuki
+    return tuki
+
+
+def laheta_gso(soketti, paketit, osoite):
+    '''Lähettää paketit GSO:lla. Peräkkäiset samankokoiset paketit
+    lähetetään yhdellä sendmsg-kutsulla, ja sarjan viimeinen paketti saa
+    olla muita lyhyempi. Paketteja ei kopioida yhteen, vaan ne annetaan
+    sendmsg-kutsulle puskurilistana. Palauttaa järjestelmäkutsujen
+    määrän.'''
+    kutsut = 0
+    i = 0
+    while i < len(paketit):
+        koko = len(paketit[i])
+        j = i + 1
+        tavuja = koko
+        while (j < len(paketit) and j - i < GSO_SEGMENTTEJA and
+               len(paketit[j]) <= koko and
+               tavuja + len(paketit[j]) <= GSO_TAVUJA):
+            tavuja += len(paketit[j])
+            j += 1
+            if len(paketit[j - 1]) < koko:
+                break
+        if j - i == 1:
+            soketti.sendto(paketit[i], osoite)
+        else:
+            soketti.sendmsg(paketit[i:j],
+                            [(SOL_UDP, UDP_SEGMENT, struct.pack('=H', koko))],
+                            0, osoite)
+        kutsut += 1
+        i = j
+    return kutsut
+
+
+def kayta_gro(soketti):
+    '''Ottaa soketissa käyttöön GRO:n. Palauttaa False, jos se ei ole
+    mahdollista. Tämän jälkeen soketista on luettava funktiolla
+    vastaanota_gro() vähintään GRO_PUSKURI-tavuiseen puskuriin, koska
+    yhdistetty paketti katkeaisi pienempään puskuriin.'''
+    if not (sys.platform.startswith('linux') and tukee_perhe(soketti) and
+            type(soketti).recvfrom_into is s.socket.recvfrom_into):
+        return False
+    try:
+        soketti.setsockopt(SOL_UDP, UDP_GRO, 1)
+    except OSError:
+        return False
+    return True
+
+
+def vastaanota_gro(soketti, puskuri, liput=0):
+    '''Lukee puskuriin yhden, mahdollisesti yhdistetyn paketin ja
+    palauttaa listan (alku, pituus)-pareja, yhden kutakin alkuperäistä
+    pakettia kohti, sekä lähettäjän. Estää kuten recvfrom_into, ellei
+    liput sisällä lippua MSG_DONTWAIT.'''
+    pituus, oheisdata, _, lahettaja = soketti.recvmsg_into(
+        [puskuri], s.CMSG_SPACE(4), liput)
+    segmentti = pituus
+    for taso, tyyppi, data in oheisdata:
+        if taso == SOL_UDP and tyyppi == UDP_GRO:
+            segmentti, = struct.unpack('=H' if len(data) < 4 else '=i',
+                                       data[:4])
+    segmentti = max(1, segmentti)
+    return ([(alku, min(segmentti, pituus - alku))
+             for alku in range(0, pituus, segmentti)] or [(0, 0)],
+            lahettaja)
+
+
+def tukee_perhe(soketti):
+    '''Palauttaa True, jos soketti on IPv4- tai IPv6-UDP-soketti.'''
+    return (isinstance(soketti, s.socket) and
+            soketti.family in (s.AF_INET, s.AF_INET6) and
+            soketti.type == s.SOCK_DGRAM)
+
+
+def sockaddr(perhe, osoite):
+    '''Palauttaa osoitteen (isäntä, portti) sockaddr-rakenteena.'''
+    avain = (perhe, osoite)
+    try:
+        return _osoitteet[avain]
+    except KeyError:
+        pass
+    tiedot = s.getaddrinfo(osoite[0], osoite[1], perhe, s.SOCK_DGRAM)[0][4]
+    if perhe == s.AF_INET:
+        tavut = (struct.pack('=H', perhe) + struct.pack('!H', tiedot[1]) +
+                 s.inet_pton(perhe, tiedot[0]) + bytes(8))
+    else:
+        tavut = (struct.pack('=H', perhe) +
+                 struct.pack('!HI', tiedot[1], tiedot[2]) +
+                 s.inet_pton(perhe, tiedot[0]) + struct.pack('=I', tiedot[3]))
+    if len(_osoitteet) >= 1024:
+        _osoitteet.clear()
+    nimi = _osoitteet[avain] = ctypes.create_string_buffer(tavut, len(tavut))
+    return nimi
+
+
+def _lue_sockaddr(nimet, kohta):
+    '''Palauttaa kohdassa olevan sockaddr-rakenteen osoitteen samassa
+    muodossa kuin socket-moduuli.'''
+    perhe, = struct.unpack_from('=H', nimet, kohta)
+    if perhe == s.AF_INET:
+        portti, = struct.unpack_from('!H', nimet, kohta + 2)
+        return (s.inet_ntop(perhe, bytes(nimet[kohta + 4:kohta + 8])),
+                portti)
+    if perhe == s.AF_INET6:
+        portti, virta = struct.unpack_from('!HI', nimet, kohta + 2)
+        alue, = struct.unpack_from('=I', nimet, kohta + 24)
+        return (s.inet_ntop(perhe, bytes(nimet[kohta + 8:kohta + 24])),
+                portti, virta, alue)
+    return None
+
+
+def _ctypes_puskuri(puskuri):
+    '''Palauttaa puskurin ctypes-taulukkona. Vain luettavasta puskurista
+    (esim. bytes) tehdään kopio.'''
+    try:
+        return (ctypes.c_char * len(puskuri)).from_buffer(puskuri)
+    except TypeError:
+        return (ctypes.c_char * len(puskuri)).from_buffer_copy(puskuri)
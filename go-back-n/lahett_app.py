@@ -4,7 +4,6 @@ import luotettavuus_lah as luotto
 import socket as s
 import virtsoketti as v
 import sys
-import time
 
 
 def lopeta():
@@ -34,52 +33,38 @@ def main():
         lopeta()
 
     # Luodaan luotettavuuskerros-olio.
-    puskurin_koko = 256  # Sama kuin ohjevideossa.
+    puskurin_koko = 1472  # Mahtuu juuri Ethernet-kehykseen. Pidemmät
+                          # viestit jaetaan useaan pakettiin.
     luottokrs = luotto.Luottolahettaja(soketti, puskurin_koko, vastott)
+    # Kuinka monta sekuntia viestiä saa enintään pidättää, jotta
+    # peräkkäiset pienet viestit ehditään koota samaan pakettiin. Arvolla 0
+    # jokainen viesti lähetetään heti.
+    luottokrs.kokoamisaika = 0.0
     luottokrs.aloita()
 
     print('Tämä on lähettäjäsovellus.' +\
           '\nLähetysikkunan koko on {}.'.format(luottokrs.ikkuna) +\
-          '\nKun annat lähetettävän merkkijonon, välilyönneillä erotetut ' +\
-          'kokonaisuudet lähetetään eri paketteina.' +\
+          '\nAnnettu merkkijono lähetetään yhtenä viestinä. Pitkä ' +\
+          'viesti jaetaan tarvittaessa useaan pakettiin.' +\
           '\nPaina Ctrl-C lopettaaksesi.\n')
 
-    odotusaika = 0.5  # Jos luotettavuuskerros on ruuhkautunut, odotetaan
-                      # tämän verran.
     # Silmukka, jossa kysytään lähetettävää ja lähetetään.
     while True:
         try:
             lahteva = input('Anna lähetettävä teksti: ')
-            osat = lahteva.split()
-            # Välitetään osa kerrallaan luotettavuuskerrokselle.
-            for osa in osat:
-                # Silmukka, jossa lähetetään. Jos lähettäminen
-                # ei onnistu, odotetaan niin kauan, että se
-                # onnistuu.
-                print('Yritetään lähettää "{}".'.format(osa))
-                while True:
-                    # Lähetetään, jos luottokerros ei ole ruuhkautunut.
-                    if luottokrs.voiko_lahettaa():
-                        print('Lähetetään "{}".'.format(osa))
-                        luottokrs.laheta_gbn(osa)
-                        break
-                    # Muussa tapauksessa odotetaan.
-                    else:
-                        print('Ei voida lähettää, odotetaan...')
-                        time.sleep(odotusaika)
+            # Luotettavuuskerros jakaa viestin tarvittaessa osiin ja
+            # odottaa ennen kunkin osan lähettämistä niin kauan, että
+            # lähetysikkunassa on tilaa.
+            print('Lähetetään "{}".'.format(lahteva))
+            luottokrs.laheta_koottuna(lahteva)
         except KeyboardInterrupt:  # Käyttäjä painoi Ctrl-C.
-            # Jos luottokerroksen ajastin ei ole None, kutsutaan sen
-            # cancel-metodia, ts. lopetetaan säikeen suoritus.
-            if luottokrs.ajastin:
-                luottokrs.ajastin.cancel()
-            # Lopetetaan säie, joka kuuntelee tulevia kuittauksia:
-            luottokrs.loppu = True
+            # Lopetetaan säie, joka kuuntelee tulevia kuittauksia, ja
+            # pysäytetään ajastimet.
+            luottokrs.lopeta()
             break
-        except:
-            if luottokrs.ajastin:
-                luottokrs.ajastin.cancel()
-            luottokrs.loppu = True
-            lopeta()  # Jokin muu meni pieleen.
+        except:  # Jokin muu meni pieleen.
+            luottokrs.lopeta()
+            lopeta()
 
     soketti.close()
     input('\n------------' +\
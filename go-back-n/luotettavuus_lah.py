@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 
+import eraio
+import lahetysikkuna
 import luotettavuus
-import socket as s
+import rtt
+import ruuhka
+import tapahtumasilmukka
 import threading as thrd
+import time
 
 
 class Luottolahettaja(luotettavuus.Luottokerros):
@@ -11,22 +16,27 @@ class Luottolahettaja(luotettavuus.Luottokerros):
     Luottolahettaja vastaa pakettien lähettämisestä Go back N -algoritmia
     käyttäen.
 
-    Bittivirheiden tarkastamisessa käytetään CRC 8 -algoritmia.
+    Bittivirheiden tarkastamisessa käytetään oletuksena CRC 8 -algoritmia.
     Polynomina on x**8 + x**3 + x**2 + x + 1, 
     bittimuodossa 100000111.
     '''
 
     
-    def __init__(self, soketti, puskurin_koko, vastott):
-        super().__init__(soketti, puskurin_koko)
+    def __init__(self, soketti, puskurin_koko, vastott, tarkistus='crc8',
+                 ikkuna=4, maksimi=16, ruuhkanhallinta='newreno',
+                 silmukka=None):
+        super().__init__(soketti, puskurin_koko, tarkistus)
+        # Go back N toimii vain, jos ikkuna on aidosti pienempi kuin
+        # sekvenssinumeroiden lukumäärä.
+        if not 0 < ikkuna < maksimi <= luotettavuus.MAKSIMI:
+            raise ValueError('Pitää olla 0 < ikkuna < maksimi <= {}.'.\
+                             format(luotettavuus.MAKSIMI))
         # Koska vastaanottaja on koko ajan sama, se voi
         # ihan hyvin olla attribuutti.
         self.vastott = vastott
         
-        self.lukuaika = 0.5  # Aika, joka kertoo, kuinka kauan kuittausta
-                             # yritetään lukea.
         # Varsinaiset GBN-muuttujat:
-        self.ikkuna = 4   # Lähetysikkunan koko.
+        self.ikkuna = ikkuna   # Lähetysikkunan koko.
         self.vanhin = 1  # Vanhin kuittaamaton sekvenssinumero. Tämä voi olla
                          # välillä [0, self.max-1]. 
         self.seur = 1   # Seuraavan lähetettävän paketin sekvenssinumero. Tämä
@@ -35,150 +45,558 @@ class Luottolahettaja(luotettavuus.Luottokerros):
                         # menee perille virheellisenä, vastaanottaja
                         # voi ilmoittaa asiasta lähettämällä kuittauksen,
                         # jonka sekvenssinumero on 0.
-        self.max = 16  # Sekvenssinumeroiden lukumäärä. Suurin sekvenssinumero
-                       # on siis self.max - 1. Tässä voisi olla 256, mutta
-                       # käytetään pienempää numeroa harjoituksen vuoksi,
-                       # jotta nähdään, miten modulo-aritmetiikka toimii.
+        self.max = maksimi  # Sekvenssinumeroiden lukumäärä. Suurin
+                            # sekvenssinumero on siis self.max - 1. Otsakkeen
+                            # 32-bittinen kenttä sallisi suurenkin arvon,
+                            # mutta oletuksena käytetään pientä numeroa
+                            # harjoituksen vuoksi, jotta nähdään, miten
+                            # modulo-aritmetiikka toimii.
 
-        # Kun paketti lähtee, se tallentuu tähän listaan, jotta se olisi
-        # helpompi lähettää uudelleen. Indeksi vastaa sekvenssinumeroa.
-        self.kuittaamattomat = self.max*[None]
+        # Kun paketti lähtee, se tallentuu lähetysikkunaan (moduuli
+        # lahetysikkuna.py), jotta se olisi helpompi lähettää uudelleen.
+        # Ikkuna on rengaspuskuri, jossa on paikka ja valmiiksi varattu
+        # puskuri jokaista ikkunan pakettia kohti, ja sen indeksi on
+        # etäisyys sekvenssinumerosta self.vanhin. Paikkaan tallentuu myös
+        # paketin lähetyshetki kiertoviiveen mittaamista varten.
+        self.kuittaamattomat = lahetysikkuna.Lahetysikkuna(
+            self.ikkuna, self.max, puskurin_koko)
+        self.lahetetyt = 0  # Lähetettyjen (uusien) pakettien lukumäärä.
+
+        # Jos kootut viestit eivät mahdu ikkunaan kokoamisajan
+        # päättyessä, lähettämistä yritetään uudelleen tämän ajan kuluttua.
+        self.odotusaika = 0.05
+
+        # Pienten viestien kokoaminen samaan pakettiin (ks.
+        # laheta_koottuna()). Kokoamisaika on pisin aika sekunteina, jonka
+        # viestiä pidätetään ennen lähettämistä. Arvolla 0 viestit
+        # lähetetään heti, mikä sopii vuorovaikutteiseen liikenteeseen.
+        self.kokoamisaika = 0.0
+        self.kootut = bytearray()  # Kootut, vielä lähettämättömät viestit.
+        self.kokoamisajastin = None
+        # Kokoamisen lukko on eri kuin self.lukko, koska sitä pidetään
+        # myös silloin, kun odotetaan tilaa ikkunassa.
+        self.kokoamislukko = thrd.Lock()
 
         # Ajastimen aikakatkaisun jälkeen tapahtuu uudelleenlähetys.
         self.ajastin = None
-        self.aika = 2.0
+        # Ajastimen aika (RTO) lasketaan mitatusta kiertoviiveestä.
+        # Nykyiset arvot näkyvät attribuuteista self.rtt.srtt ja
+        # self.rtt.rto.
+        self.rtt = rtt.Rttarvio()
+
+        # Ruuhkanhallinta (moduuli ruuhka.py) rajoittaa lähetysikkunaa
+        # verkon tilanteen mukaan. self.ikkuna on ikkunan yläraja, ja
+        # lähettämiseen käytetään pienempää luvuista self.ikkuna ja
+        # self.ruuhka.ikkuna. Arvolla ruuhkanhallinta='vakio' ikkuna on
+        # aina self.ikkuna.
+        self.ruuhka = ruuhka.hae(ruuhkanhallinta, self.ikkuna)
+
+        # Vuonohjaus: vastaanottaja ilmoittaa kuittauksissa, kuinka monta
+        # uutta pakettia se ottaa vastaan (ks. LIPPU_IKKUNA). Ennen
+        # ensimmäistä kuittausta oletetaan, että koko ikkuna on käytössä.
+        # Kun ikkuna on nolla eikä kuittaamattomia paketteja ole,
+        # vastaanottajaa koetellaan ajoittain (ks. koettele()), jotta
+        # ikkunan avautuminen huomataan, vaikka sitä ilmoittava kuittaus
+        # katoaisi.
+        self.vastott_ikkuna = self.ikkuna
+        self.koetin = None
+        self.koettelut = 0  # Peräkkäisten koettelujen määrä.
+
+        # Peräkkäisten samanlaisten kuittausten (tuplakuittausten) määrä ja
+        # määrä, jonka jälkeen vanhin kuittaamaton paketti lähetetään
+        # uudelleen odottamatta aikakatkaisua.
+        self.tuplakuittaukset = 0
+        self.tuplaraja = 3
 
         # Lukitusta käytetään, jotta yksi säie ei muuttaisi attribuutteja
         # sillä välin kun toinen säie lukee niitä.
         self.lukko = thrd.Lock()
 
-        # Metodi odota_kuittauksia() lopetetaan asettamalla tämän
-        # attribuutin arvoksi True. Tämä tapahtuu, kun lahett_app-ohjelman
-        # main()-metodi käsittelee KeyboardInterruptia tai muuta poikkeusta.
-        # Ratkaisu on kömpelö, mutta esim. poikkeuskäsittelyn lisääminen
-        # odota_kuittauksia()-metodiin ei toimi halutulla tavalla.
+        # Ehtomuuttuja, jolla odotetaan tilaa lähetysikkunassa (ks.
+        # odota_tilaa()). Se käyttää samaa lukkoa kuin muu tila, ja
+        # kuittausten käsittely herättää odottajat.
+        self.tilaa = thrd.Condition(self.lukko)
+
+        # Lähettäjä on lopetettu (ks. lopeta()).
         self.loppu = False
 
+        # Kuittausten vastaanotto ja kaikki ajastimet hoidetaan yhdessä
+        # tapahtumasilmukan säikeessä (moduuli tapahtumasilmukka.py).
+        # Ajastimen käynnistäminen ei siis luo uutta säiettä, eikä
+        # sokettia tarvitse lukea aikakatkaisun kanssa. Silmukan tilalle
+        # voi antaa muun olion, jolla on metodit ajasta() ja lopeta()
+        # (ks. luotettavuus_async.py).
+        if silmukka is None:
+            silmukka = tapahtumasilmukka.Tapahtumasilmukka()
+        self.silmukka = silmukka
+        # Kuittaukset luetaan aina samaan puskuriin, sillä kuittaus on
+        # käsitelty loppuun ennen seuraavan lukemista.
+        self.kuittauspuskuri = bytearray(puskurin_koko)
+        self.kuittauspuskurit = None  # Eräsiirron puskurit luodaan
+                                      # tarvittaessa.
+
         
     def aloita(self):
         '''Alkaa kuunnella sokettia kuittausten varalta.
         Huom.! Tätä metodia on tarkoitus kutsua vain yhden kerran.'''
-        # Luodaan ja käynnistetään säie, joka odottaa kuittauksia.
-        odotus = thrd.Thread(target=self.odota_kuittauksia)
-        odotus.start()
-
-
-    def odota_kuittauksia(self):
-        kuittaus = ''
-        self.soketti.settimeout(self.lukuaika)
-        # Yritetään lukea sokettia. Sokettia yritetään lukea vain tietyn aikaa
-        # kerrallaan ja suorituskertojen välissä tarkastetaan self_loppu.
-        # Kun self_loppu == True, metodin suoritus päättyy. Näin tehdään,
-        # koska metodin suoritusta (ja sitä kautta säikeen suoritusta)
-        # ei saada muuten KeyboardInterruptilla lopetetuksi.
+        # Tapahtumasilmukka lukee sokettia vain, kun siinä on luettavaa,
+        # ja lukee kerralla kaiken saapuneen. Siksi soketti asetetaan
+        # estämättömäksi.
+        self.soketti.setblocking(False)
+        self.silmukka.rekisteroi(self.soketti, self.lue_kuittaukset)
+
+
+    def lopeta(self):
+        '''Lopettaa kuittausten odottamisen ja pysäyttää ajastimet.
+        Tapahtumasilmukka herätetään, joten lopettaminen on välitöntä.'''
+        self.loppu = True
+        self.silmukka.lopeta()
+        with self.tilaa:
+            self.tilaa.notify_all()
+
+
+    def lue_kuittaukset(self):
+        '''Tapahtumasilmukka kutsuu tätä, kun soketista voi lukea. Lukee
+        ja käsittelee kaikki saapuneet kuittaukset. Muut kuin
+        estämättömän soketin tavalliset poikkeukset välitetään
+        tapahtumasilmukalle, joka tulostaa ne.'''
+        if self.erasiirto and eraio.tukee(self.soketti, 'recvfrom_into'):
+            self.lue_kuittaukset_erissa()
+            return
+        nakyma = memoryview(self.kuittauspuskuri)
         while not self.loppu:
             try:
-                kuittaus, _ = self.soketti.recvfrom(self.puskurin_koko)
-                self.kasittele_kuittaus(kuittaus)
-            except s.timeout:
-                pass
-            # lahett_appin main()-metodi on saattanut jo sulkea soketin.
-            # Siinä tapauksessa pitäisi olla self.loppu == True.
-            except:   
-                continue
+                pituus, _ = self.soketti.recvfrom_into(self.kuittauspuskuri,
+                                                      self.puskurin_koko)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.kasittele_kuittaus(nakyma[:pituus])
 
 
-    def kasittele_kuittaus(self, kuittaus):
+    def lue_kuittaukset_erissa(self):
+        '''Kuten lue_kuittaukset(), mutta kuittauksia luetaan useita
+        yhdellä recvmmsg-kutsulla (moduuli eraio).'''
+        if self.kuittauspuskurit is None:
+            self.kuittauspuskurit = [bytearray(self.puskurin_koko)
+                                     for _ in range(eraio.ERA)]
+        while not self.loppu:
+            saapuneet = eraio.vastaanota_monta(self.soketti,
+                                               self.kuittauspuskurit,
+                                               self.puskurin_koko)
+            kuittaukset = [memoryview(puskuri)[:pituus]
+                           for puskuri, (pituus, _) in
+                           zip(self.kuittauspuskurit, saapuneet)]
+            # Koko erä tarkastetaan yhdellä kutsulla.
+            for kuittaus, oikea in zip(kuittaukset,
+                                       self.tarkasta_monta(kuittaukset)):
+                self.kasittele_kuittaus(kuittaus, oikea)
+            # Vajaa erä tarkoittaa, että soketti on tyhjä.
+            if len(saapuneet) < len(self.kuittauspuskurit):
+                return
+
+
+    def kasittele_kuittaus(self, kuittaus, oikea=None):
         '''Lukee tavujonomuotoisen kuittauksen, tarkastaa sen ja
-        huolehtii kuittauksen aiheuttamista jatkotoimista.'''
+        huolehtii kuittauksen aiheuttamista jatkotoimista. Jos kuittaus
+        on jo tarkastettu (esim. tarkasta_monta()), tulos annetaan
+        parametrina oikea.'''
+        if oikea is None:
+            oikea = self.tarkasta(kuittaus)
         # Jos kuittauksessa on bittivirhe, ei jatketa.
-        if not self.tarkasta(kuittaus):
+        if not oikea:
             print('(Bittivirheellinen kuittaus.)')
             return
 
+        # Jos paketti ei ole kuittaus, ei jatketa.
+        _, liput, _, sekvno, _ = self.lue_otsake(kuittaus)
+        if not liput & luotettavuus.LIPPU_ACK:
+            print('(Vastaanotettiin paketti, joka ei ole kuittaus.)')
+            return
+
         # Muuten:
         # Kuittaus tulkitaan kumulatiivisena, joten vanhimman
         # kuittaamattoman paketin numero päivittyy.
-        sekvno, _ = self.pura(kuittaus)
         print('(Vastaanotettiin bittivirheetön kuittaus, jonka ' +\
               'sekvenssinumero on {}.)'.format(sekvno))
         
+        # Vastaanottajan ilmoittama ikkuna, jos kuittauksessa on sellainen.
+        ikkuna = None
+        if liput & luotettavuus.LIPPU_IKKUNA:
+            data = self.pura(kuittaus)[1]
+            # Liian lyhyestä kuittauksesta ikkunaa ei voi lukea, joten
+            # ikkunan päivitys ohitetaan.
+            if len(data) >= luotettavuus.IKKUNA.size:
+                ikkuna = luotettavuus.IKKUNA.unpack_from(data)[0]
+            else:
+                print('(Kuittauksen ikkuna puuttuu. Ikkunaa ei päivitetä.)')
+
+        nopea_uudelleenlahetys = False
         with self.lukko:
-            self.vanhin = (sekvno + 1) % self.max
+            # Pelkkä ikkunan muutos ei ole tuplakuittaus.
+            paivitys = ikkuna is not None and ikkuna != self.vastott_ikkuna
+            if ikkuna is not None:
+                self.vastott_ikkuna = ikkuna
+            # Kuittaus kuittaa uusia paketteja, jos sekvno on välillä
+            # [self.vanhin, self.seur[. Silloin saadaan myös mittaus
+            # kiertoviiveestä.
+            uudet = (sekvno - self.vanhin) % self.max + 1
+            if uudet <= (self.seur - self.vanhin) % self.max:
+                lahetetty = self.kuittaamattomat[uudet - 1].lahetetty
+                if lahetetty is not None:
+                    self.rtt.mittaus(time.monotonic() - lahetetty)
+                else:
+                    self.rtt.kuitattu()
+                self.kuittaamattomat.poista(uudet)
+                self.vanhin = (sekvno + 1) % self.max
+                self.tuplakuittaukset = 0
+                self.ruuhka.kuitattu(uudet)
 
-            # Jos kaikki on jo kuitattu, pysäytetään ajastin. Muussa
-            # tapauksessa käynnistetään se uudelleen.
-        
-            if self.vanhin == self.seur:
-                self.ajastin.cancel()
-            else:
-                self.kaynnista_ajastin()
+                # Jos kaikki on jo kuitattu, pysäytetään ajastin. Muussa
+                # tapauksessa käynnistetään se uudelleen.
+                if self.vanhin == self.seur:
+                    self.ajastin.cancel()
+                else:
+                    self.kaynnista_ajastin()
+
+            # Jos kuittaus on sama kuin edellinen ja paketteja on vielä
+            # kuittaamatta, vastaanottaja on saanut paketin väärässä
+            # järjestyksessä. Tällöin vanhin kuittaamaton paketti on
+            # luultavasti kadonnut, joten kuittaamattomat paketit
+            # lähetetään uudelleen heti self.tuplaraja tuplakuittauksen
+            # jälkeen (fast retransmit) eikä vasta ajastimen
+            # aikakatkaisussa. Vastaanottaja on hylännyt vanhimman jälkeen
+            # tulleet paketit, joten Go back N -periaatteen mukaisesti
+            # nekin lähetetään uudelleen.
+            elif (sekvno == (self.vanhin - 1) % self.max and
+                  self.vanhin != self.seur and not paivitys):
+                self.tuplakuittaukset += 1
+                if self.tuplakuittaukset == self.tuplaraja:
+                    self.ruuhka.menetys((self.seur - self.vanhin) % self.max,
+                                        self.lahetetyt)
+                    print('(Tuplakuittauksia {}. Ruuhkaikkuna on nyt {}.)'.\
+                          format(self.tuplakuittaukset, self.ruuhka.ikkuna))
+                    self.kaynnista_ajastin()
+                    nopea_uudelleenlahetys = True
+
+            self.paivita_koetin()
+            # Herätetään lähettämistä odottavat, sillä ikkunassa voi olla
+            # nyt tilaa.
+            self.tilaa.notify_all()
+
+        # Uudelleenlähetys tehdään lukon ulkopuolella, koska
+        # laheta_uudestaan() ottaa lukon itse.
+        if nopea_uudelleenlahetys:
+            self.laheta_uudestaan()
 
             
     def voiko_lahettaa(self):
         '''Palauttaa tiedon, onko lähettäminen mahdollista.'''
+        with self.lukko:
+            return self.mahtuuko()
+
+
+    def mahtuuko(self):
+        '''Kuten voiko_lahettaa(), mutta kutsujalla on oltava self.lukko.'''
         # Periaatteessa vertailuoperaatio on
-        # self.seur < self.vanhin + self.ikkuna, mutta
+        # self.seur < self.vanhin + ikkuna, mutta
         # modulo-aritmetiikka on otettava huomioon.
-        with self.lukko:
-            if self.seur < self.vanhin:
-                return self.seur + self.max < self.vanhin + self.ikkuna
-            else:
-                return self.seur < self.vanhin + self.ikkuna
+        ikkuna = min(self.ikkuna, self.ruuhka.ikkuna, self.vastott_ikkuna)
+        if self.seur < self.vanhin:
+            return self.seur + self.max < self.vanhin + ikkuna
+        else:
+            return self.seur < self.vanhin + ikkuna
+
+
+    def vapaat_paikat(self):
+        '''Palauttaa, montako pakettia ikkunaan vielä mahtuu. Kutsujalla
+        on oltava self.lukko.'''
+        ikkuna = min(self.ikkuna, self.ruuhka.ikkuna, self.vastott_ikkuna)
+        return max(0, ikkuna - (self.seur - self.vanhin) % self.max)
+
+
+    def odota_tilaa(self, aikaraja=None):
+        '''Odottaa, kunnes lähetysikkunassa on tilaa, kuitenkin enintään
+        aikaraja sekuntia (None: rajatta). Palauttaa True, jos tilaa on.
+        Metodi palaa heti, jos tilaa on jo, ja muuten heti, kun kuittaus
+        vapauttaa ikkunasta tilaa. Myös lopeta() herättää odottajan.'''
+        with self.tilaa:
+            self.tilaa.wait_for(lambda: self.loppu or self.mahtuuko(),
+                                aikaraja)
+            return not self.loppu and self.mahtuuko()
+
+
+    def laheta_odottaen(self, data, aikaraja=None):
+        '''Lähettää merkkijonon tai tavumuotoisen viestin kuten
+        laheta_koottuna(), mutta odottaa tilaa ikkunassa enintään
+        aikaraja sekuntia (None: rajatta). Palauttaa True, kun viesti on
+        lähetetty, ja False, jos tilaa ei tullut ajoissa. Silloin mitään
+        ei lähetetty. Kun viestin ensimmäinen osa on lähetetty, muille
+        osille odotetaan tilaa rajatta, jotta viesti ei jää kesken.'''
+        if isinstance(data, str):
+            data = data.encode('utf8')
+        with self.kokoamislukko:
+            if not self.odota_tilaa(aikaraja):
+                return False
+            self.laheta_kootut()
+            self.laheta_viesti(data)
+        return True
+
+
+    # Englanninkielinen nimi sokettien send()-metodin tapaan.
+    send = laheta_odottaen
         
     
     def laheta_gbn(self, mjono):
         '''Merkkijonon lähettäminen Go-back-N-protokollan mukaisesti.'''
-        # Ennen lähettämistä varaudutaan mahdollisiin uudelleenlähetyksiin:
-        # valmistellaan paketti (sekvenssinumero ja tarkistussumma mukaan)
-        # ja lisätään se kuittaamattomien joukkoon.
+        self.laheta_bytes(mjono.encode('utf8'))
+
+
+    def laheta_viesti(self, viesti):
+        '''Lähettää merkkijonon tai tavumuotoisen viestin, joka voi olla
+        pidempi kuin yhteen pakettiin mahtuu. Viesti jaetaan osiin, ja
+        muissa kuin viimeisessä osassa on lippu LIPPU_JATKUU.
+        Vastaanottaja kokoaa osat takaisin yhdeksi viestiksi. Metodi
+        odottaa tarvittaessa, että ikkunassa on tilaa.'''
+        if isinstance(viesti, str):
+            viesti = viesti.encode('utf8')
+        osat = self.pilko(viesti)
+        if self.gso and len(osat) > 1:
+            self.laheta_erina(osat)
+            return
+        for i, osa in enumerate(osat):
+            liput = luotettavuus.LIPPU_JATKUU if i < len(osat)-1 else 0
+            self.odota_tilaa()
+            self.laheta_bytes(osa, liput)
+
+
+    def laheta_erina(self, osat):
+        '''Lähettää viestin osat kuten laheta_viesti(), mutta kerralla niin
+        monta kuin ikkunaan mahtuu. Erän paketit kirjoitetaan ikkunan
+        paikkoihin ja lähetetään yhdellä laheta_monta()-kutsulla, joten
+        GSO:ta käytettäessä (self.gso) ne kulkevat ytimeen yhtenä
+        puskurina. Kaikki paitsi viimeinen osa ovat täysiä, joten erän
+        paketit ovat yhtä suuria viimeistä lukuun ottamatta.'''
+        i = 0
+        while i < len(osat):
+            if not self.odota_tilaa():
+                return
+            # Sekvenssinumerot ja lähetysikkunan paikat varataan lukon alla
+            # kuten laheta_bytes()-metodissa, ja paketit valmistellaan
+            # varattuihin paikkoihin lukon ulkopuolella.
+            with self.lukko:
+                varatut = []
+                for _ in range(min(self.vapaat_paikat(), len(osat) - i)):
+                    varatut.append(self.kuittaamattomat.varaa(self.seur))
+                    self.seur = (self.seur + 1) % self.max
+                    self.lahetetyt += 1
+            if not varatut:
+                continue
+            # Erän tarkistussummat lasketaan yhdellä kutsulla.
+            liput = [luotettavuus.LIPPU_JATKUU if i + k < len(osat)-1 else 0
+                     for k in range(len(varatut))]
+            era = self.kirjoita_paketit(
+                [lahetys.puskuri for lahetys in varatut],
+                [lahetys.sekvno for lahetys in varatut],
+                osat[i:i+len(varatut)], liput)
+            with self.lukko:
+                nyt = time.monotonic()
+                for lahetys, lahteva in zip(varatut, era):
+                    lahetys.paketti = lahteva
+                    lahetys.lahetetty = nyt
+                self.laheta_monta(era, self.vastott)
+                print('(Lähetetty erä, sekvenssinumerot {}-{}.)\n'.format(
+                    varatut[0].sekvno, varatut[-1].sekvno))
+                # Jos erän ensimmäinen paketti on samalla vanhin
+                # kuittaamaton paketti, käynnistetään ajastin.
+                if self.vanhin == varatut[0].sekvno:
+                    self.kaynnista_ajastin()
+            i += len(era)
+
+
+    def laheta_koottuna(self, viesti):
+        '''Lähettää merkkijonon tai tavumuotoisen viestin niin, että
+        peräkkäiset pienet viestit kootaan samaan pakettiin. Paketti
+        lähetetään, kun se on täynnä tai kun ensimmäistä viestiä on
+        pidätetty self.kokoamisaika sekuntia. Kokoamista käytettäessä
+        kaikki viestit on lähetettävä tämän metodin kautta, jotta niiden
+        järjestys säilyy.'''
+        if isinstance(viesti, str):
+            viesti = viesti.encode('utf8')
+        tietue = luotettavuus.TIETUE.size + len(viesti)
+        with self.kokoamislukko:
+            # Jos kokoaminen ei ole käytössä tai viesti ei mahdu yhteen
+            # pakettiin, lähetetään ensin jo kootut ja sitten viesti.
+            if not self.kokoamisaika or tietue > self.kuorman_koko():
+                self.laheta_kootut()
+                self.laheta_viesti(viesti)
+                return
+            if len(self.kootut) + tietue > self.kuorman_koko():
+                self.laheta_kootut()
+            self.kootut += luotettavuus.TIETUE.pack(len(viesti))
+            self.kootut += viesti
+            if self.kokoamisajastin is None:
+                self.kokoamisajastin = self.silmukka.ajasta(
+                    self.kokoamisaika, self.kokoamisaika_kulunut)
+
+
+    def kokoamisaika_kulunut(self):
+        '''Tapahtumasilmukka kutsuu tätä, kun kootut viestit on
+        lähetettävä. Silmukan säie ei saa jäädä odottamaan lukkoa eikä
+        tilaa ikkunassa, koska sama säie käsittelee kuittaukset, jotka
+        vapauttavat ikkunaa. Jos lähettäminen ei juuri nyt onnistu,
+        yritetään hetken päästä uudestaan.'''
+        if self.kokoamislukko.acquire(blocking=False):
+            try:
+                with self.lukko:
+                    mahtuu = self.mahtuuko()
+                if not self.kootut or mahtuu:
+                    self.laheta_kootut()
+                    return
+            finally:
+                self.kokoamislukko.release()
+        self.kokoamisajastin = self.silmukka.ajasta(
+            self.odotusaika, self.kokoamisaika_kulunut)
+
+
+    def tyhjenna(self):
+        '''Lähettää kootut viestit odottamatta kokoamisajan päättymistä.'''
+        with self.kokoamislukko:
+            self.laheta_kootut()
+
+
+    def laheta_kootut(self):
+        '''Lähettää kootut viestit yhtenä pakettina. Kutsujalla on oltava
+        self.kokoamislukko.'''
+        if self.kokoamisajastin:
+            self.kokoamisajastin.cancel()
+            self.kokoamisajastin = None
+        if not self.kootut:
+            return
+        self.odota_tilaa()
+        self.laheta_bytes(self.kootut, luotettavuus.LIPPU_KOOTTU)
+        self.kootut = bytearray()
+
+
+    def laheta_bytes(self, data, liput=0):
+        '''Tavumuotoisen datan (bytes, bytearray, memoryview) lähettäminen
+        Go-back-N-protokollan mukaisesti. Data kopioidaan pakettiin, joten
+        kutsuja voi käyttää puskuriaan uudelleen heti
+        paluun jälkeen. Jos ikkunassa ei ole tilaa, odotetaan kuten
+        metodissa odota_tilaa(). Jos lähettäjä lopetetaan odotuksen
+        aikana, mitään ei lähetetä.'''
+        # Ennen lähettämistä varaudutaan mahdollisiin uudelleenlähetyksiin.
+        # Ensin varataan lukon alla sekvenssinumero ja lähetysikkunan
+        # paikka, ja vasta sitten paketti valmistellaan (sekvenssinumero
+        # ja tarkistussumma mukaan) paikan puskuriin. Näin täyden ikkunan
+        # vanhinta, ehkä vielä uudelleen lähetettävää pakettia ei
+        # kirjoiteta yli. Valmistelu tehdään lukon ulkopuolella, sillä
+        # varattua paikkaa ei käytä kukaan muu.
+        while True:
+            with self.lukko:
+                if self.loppu:
+                    return
+                if self.mahtuuko():
+                    sekvno = self.seur
+                    lahetys = self.kuittaamattomat.varaa(sekvno)
+                    self.seur = (self.seur + 1) % self.max
+                    self.lahetetyt += 1
+                    break
+            self.odota_tilaa()
+        lahteva = self.kirjoita_paketti(lahetys.puskuri, sekvno, data, liput)
         with self.lukko:
-            lahteva = self.valm_paketti(self.seur, mjono)
-            self.kuittaamattomat[self.seur] = lahteva
+            lahetys.paketti = lahteva
+            lahetys.lahetetty = time.monotonic()
             # Sitten lähetetään.
             self.laheta(lahteva, self.vastott)
-            print('(Lähetetty, sekvenssinumero {}.)\n'.format(self.seur))
-            self.seur = (self.seur + 1) % self.max
+            print('(Lähetetty, sekvenssinumero {}.)\n'.format(sekvno))
 
             # Jos juuri lähetetty paketti on samalla vanhin kuittaamaton
             # paketti, käynnistetään ajastin.
-            if self.vanhin == self.seur-1:
+            if self.vanhin == sekvno:
                 self.kaynnista_ajastin()
 
         
     def kaynnista_ajastin(self):
-        '''Nollaa ja käynnistää ajastimen uudestaan.'''
+        '''Nollaa ja käynnistää ajastimen uudestaan. Kutsujalla on oltava
+        self.lukko.'''
         # Otetaan huomioon, että ensimmäisellä kerralla ajastin on None,
         # jolloin sillä ei ole cancel()-metodia.
         if self.ajastin:
             self.ajastin.cancel()
-        self.ajastin = thrd.Timer(self.aika, function=self.timeout)
-        self.ajastin.start()
+        self.ajastin = self.silmukka.ajasta(self.rtt.rto, self.timeout)
 
         
     def timeout(self):
         '''Ajastimen aikakatkaisu: ajastin uudelleen käyntiin
         ja kuittaamattomien pakettien uudelleenlähetys.'''
-        print('(Aikakatkaisu!)')
-        self.kaynnista_ajastin()
+        with self.lukko:
+            # Viimeinenkin paketti on voitu kuitata sen jälkeen, kun
+            # ajastin laukesi mutta ennen kuin lukko saatiin. Silloin
+            # mitään ei ole kadonnut, joten ajastimen aikaa ei
+            # kaksinkertaisteta eikä ajastinta käynnistetä uudelleen.
+            if self.vanhin == self.seur:
+                return
+            self.rtt.aikakatkaisu()
+            self.ruuhka.aikakatkaisu((self.seur - self.vanhin) % self.max,
+                                     self.lahetetyt)
+            self.kaynnista_ajastin()
+            rto, ikkuna = self.rtt.rto, self.ruuhka.ikkuna
+        print('(Aikakatkaisu! Ajastimen aika on nyt {:.3f} s. '.\
+              format(rto) + 'Ruuhkaikkuna on nyt {}.)'.format(ikkuna))
         self.laheta_uudestaan()
 
     
     def laheta_uudestaan(self):
         '''Lähettää kuittaamattomat paketit uudestaan.'''
-        # Määritetään indeksien joukko. Periaatteessa kyseessä on
-        # välillä [self.vanhin, self.seur[ olevien kokonaislukujen
-        # joukko, mutta lisäksi täytyy ottaa huomioon modulo-
-        # aritmetiikka.
+        # Lähetysikkunan paketit ovat valmiiksi järjestyksessä
+        # sekvenssinumerosta self.vanhin alkaen, joten modulo-aritmetiikkaa
+        # ei tarvita.
         with self.lukko:
-            if self.seur < self.vanhin:
-                indeksit = list(range(self.vanhin, self.max))  # Alkuosa.
-                # Liitetään loput (nollasta alkavat) yksitellen.
-                for x in range(0, self.seur):
-                    indeksit.append(x)    
-            else:
-                indeksit = list(range(self.vanhin, self.seur))
+            indeksit = []
+            paketit = []
+            for lahetys in self.kuittaamattomat:
+                # Varattua mutta vielä lähettämätöntä pakettia ei lähetetä.
+                if lahetys.paketti is None:
+                    continue
+                lahetys.lahetetty = None
+                lahetys.uudelleen += 1
+                indeksit.append(lahetys.sekvno)
+                paketit.append(lahetys.paketti)
 
         print('(Lähetetään uudelleen paketit {}.)'.format(indeksit))
-        for i in indeksit:
-            self.laheta(self.kuittaamattomat[i], self.vastott)    
+        # Koko ikkuna lähetetään tarvittaessa yhdellä kutsulla.
+        self.laheta_monta(paketit, self.vastott)
+
+
+    def paivita_koetin(self):
+        '''Käynnistää koettelun, jos vastaanottajan ikkuna on nolla eikä
+        kuittaamattomia paketteja ole, ja muuten pysäyttää sen.
+        Kutsujalla on oltava self.lukko.'''
+        if self.vastott_ikkuna == 0 and self.vanhin == self.seur:
+            if self.koetin is None:
+                self.koetin = self.silmukka.ajasta(self.rtt.rto,
+                                                   self.koettele)
+        elif self.koetin is not None:
+            self.koetin.cancel()
+            self.koetin = None
+            self.koettelut = 0
+
+
+    def koettele(self):
+        '''Lähettää ikkunakoettimen: tyhjän paketin, jonka sekvenssinumero
+        on jo kuitattu. Vastaanottaja kuittaa sen, joten kuittauksesta
+        saadaan ikkunan nykyinen koko. Koettelujen väli kaksinkertaistuu
+        kuten ajastimen aika aikakatkaisuissa.'''
+        with self.lukko:
+            if (self.loppu or self.vastott_ikkuna != 0 or
+                self.vanhin != self.seur):
+                self.koetin = None
+                self.koettelut = 0
+                return
+            koetin = self.valm_paketti((self.vanhin - 1) % self.max, b'')
+            self.koettelut += 1
+            self.koetin = self.silmukka.ajasta(
+                self.rtt.rajaa(self.rtt.rto * 2**self.koettelut),
+                self.koettele)
+        print('(Vastaanottajan ikkuna on nolla. Lähetetään ikkunakoetin.)')
+        self.laheta(koetin, self.vastott)
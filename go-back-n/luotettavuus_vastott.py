@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 
+import collections
+import eraio
 import luotettavuus
+import puskuriallas
+import socket as s
+import time
 
 
 class Luottovastaanottaja(luotettavuus.Luottokerros):
@@ -9,50 +14,269 @@ class Luottovastaanottaja(luotettavuus.Luottokerros):
     Luottovastaanottaja vastaa pakettien vastaanottamisesta
     Go back N -algoritmin mukaisesti.
 
-    Bittivirheiden tarkastamisessa käytetään CRC 8 -algoritmia.
+    Bittivirheiden tarkastamisessa käytetään oletuksena CRC 8 -algoritmia.
     Polynomina on x**8 + x**3 + x**2 + x + 1, 
     bittimuodossa 100000111.
     '''
 
     
-    def __init__(self, soketti, puskurin_koko):
-        super().__init__(soketti, puskurin_koko)
+    def __init__(self, soketti, puskurin_koko, tarkistus='crc8',
+                 maksimi=16, kuittausvali=1, kuittausviive=0.05,
+                 jonon_koko=8, allas=None):
+        super().__init__(soketti, puskurin_koko, tarkistus)
         self.odotettu_sekvno = 1  # Tämä on aluksi 1. Jos nimittäin
                                   # ensimmäinen paketti on virheellinen,
                                   # lähetetään kuittaus, jossa on
                                   # sekvenssinumero 0.
-        self.max = 16  # Sekvenssinumeroiden lukumäärä. Suurin sekvenssinumero
-                       # on siis self.max - 1. Tässä voisi olla 256, mutta
-                       # käytetään pienempää numeroa harjoituksen vuoksi,
-                       # jotta nähdään, miten modulo-aritmetiikka toimii.
-        self.kuittaus = self.valm_paketti(0, 'ACK')
+        self.max = maksimi  # Sekvenssinumeroiden lukumäärä. Tämän on
+                            # oltava sama kuin lähettäjällä.
+        # Paketit luetaan altaasta otettuihin puskureihin. Hyväksytyn
+        # paketin puskuri palautetaan altaaseen vasta, kun sovellus kutsuu
+        # metodia vapauta(). Useat vastaanottajat voivat käyttää yhteistä
+        # allasta (ks. luotettavuus_palvelin.py).
+        if allas is None:
+            allas = puskuriallas.Puskuriallas(puskurin_koko, jonon_koko)
+        self.allas = allas
+        # Vuonohjaus: jokaisessa kuittauksessa ilmoitetaan lähettäjälle,
+        # kuinka monta pakettia vielä mahtuu jonoon. Jonossa ovat
+        # viestit, jotka on palautettu sovellukselle mutta joita se ei ole
+        # vielä vapauttanut, ja kootusta paketista puretut viestit, joita
+        # ei ole vielä palautettu.
+        self.jonon_koko = jonon_koko
+        self.sovelluksella = 0  # Vapauttamattomien viestien määrä.
+        self.ilmoitettu = None  # Viimeksi ilmoitettu ikkuna.
+        self.vastapuoli = None  # Viimeksi kuitattu lähettäjä.
+        # Osissa saapuvan viestin jo vastaanotetut osat.
+        self.kokoamaton = bytearray()
+        # Kootusta paketista puretut viestit, joita ei ole vielä palautettu
+        # sovellukselle.
+        self.valmiit = collections.deque()
+        # Viivästetyt kuittaukset: kuittaus lähetetään vasta joka
+        # self.kuittausvali. järjestyksessä saapuneesta paketista tai
+        # viimeistään self.kuittausviive sekunnin kuluttua. Väärässä
+        # järjestyksessä saapunut paketti kuitataan aina heti. Arvolla
+        # kuittausvali=1 jokainen paketti kuitataan heti.
+        self.kuittausvali = kuittausvali
+        self.kuittausviive = kuittausviive
+        self.kuittaamatta = 0  # Kuittaamattomien pakettien määrä.
+        self.kuittaushetki = None  # Hetki (time.monotonic()), jolloin
+                                   # odottava kuittaus on lähetettävä.
+        self.kuittauksen_vastott = None
+        # Eräsiirrolla luetut paketit, joita ei ole vielä käsitelty.
+        self.saapuneet = collections.deque()
+        # Vastaanoton yhdistäminen (GRO), ks. kayta_gro().
+        self.gro = False
+        self.gro_puskuri = None
 
         
     def ota_vastaan(self):
         '''Palauttaa viestin merkkijonona, jos viestillä on oikea
-        sekvenssinumero eikä siinä ole bittivirheitä. Muussa tapauksessa
-        paluuarvo on None.'''
-        saapunut, lahettaja = self.soketti.recvfrom(self.puskurin_koko)
-        crc_ok = self.tarkasta(saapunut)
-        sekvno, data = self.pura(saapunut)
+        sekvenssinumero eikä siinä ole bittivirheitä ja viesti on
+        kokonaan vastaanotettu. Muussa tapauksessa paluuarvo on None.'''
+        data = self.ota_vastaan_bytes()
+        if data is None:
+            return None
+        mjono = self.dekoodaa(data)
+        self.vapauta(data)
+        return mjono
+
+
+    def ota_vastaan_bytes(self):
+        '''Kuten ota_vastaan(), mutta palauttaa viestin memoryview-
+        näkymänä altaan puskuriin. Kun viestiä ei enää tarvita, se
+        palautetaan metodilla vapauta().'''
+        if self.valmiit:
+            self.sovelluksella += 1
+            return self.valmiit.popleft()
+        if not self.saapuneet:
+            if self.gro:
+                self.lue_gro()
+            else:
+                puskuri = self.allas.varaa()
+                pituus, lahettaja = self.lue_paketti(puskuri)
+                self.saapuneet.append((puskuri, pituus, lahettaja))
+                self.lue_lisaa()
+            self.tarkasta_saapuneet()
+        return self.kasittele_paketti(*self.saapuneet.popleft())
+
+
+    def kayta_gro(self):
+        '''Ottaa käyttöön vastaanoton yhdistämisen (GRO, ks.
+        eraio.kayta_gro()): ydin voi yhdistää saman lähettäjän peräkkäiset
+        paketit, jotka luetaan silloin yhdellä järjestelmäkutsulla.
+        Hyödyllinen lähinnä, kun lähettäjä käyttää GSO:ta. Palauttaa
+        False, jos GRO ei ole käytettävissä.'''
+        if not eraio.kayta_gro(self.soketti):
+            return False
+        self.gro_puskuri = memoryview(bytearray(eraio.GRO_PUSKURI))
+        self.gro = True
+        return True
+
+
+    def lue_gro(self):
+        '''Lukee GRO-tilassa soketista yhden, mahdollisesti useasta
+        paketista yhdistetyn puskurillisen ja kopioi sen paketit altaan
+        puskureihin jonoon self.saapuneet. Eräsiirtoa (lue_lisaa()) ei
+        käytetä, koska yhdistetty paketti katkeaisi altaan puskuriin.'''
+        segmentit, lahettaja = self.lue_paketti(
+            self.gro_puskuri,
+            lambda puskuri: eraio.vastaanota_gro(self.soketti, puskuri))
+        for alku, pituus in segmentit:
+            puskuri = self.allas.varaa()
+            pituus = min(pituus, len(puskuri))
+            puskuri[:pituus] = self.gro_puskuri[alku:alku+pituus]
+            self.saapuneet.append((puskuri, pituus, lahettaja))
+
+
+    def lue_lisaa(self):
+        '''Lukee eräsiirrolla (moduuli eraio) soketista jo saapuneet
+        paketit jonoon self.saapuneet, jotta seuraavat
+        ota_vastaan_bytes()-kutsut eivät tarvitse järjestelmäkutsua.
+        Paketteja luetaan enintään niin monta kuin altaassa on vapaita
+        puskureita.'''
+        if self.erasiirto and eraio.tukee(self.soketti, 'recvfrom_into'):
+            maara = min(eraio.ERA, len(self.allas.vapaat))
+            if maara:
+                self.saapuneet.extend(
+                    eraio.lue_altaaseen(self.soketti, self.allas, maara))
+
+
+    def tarkasta_saapuneet(self):
+        '''Tarkastaa kaikki jonossa self.saapuneet olevat paketit yhdellä
+        tarkasta_monta()-kutsulla ja liittää tuloksen jokaisen paketin
+        tietoihin (ks. kasittele_paketti()).'''
+        paketit = [memoryview(puskuri)[:pituus]
+                   for puskuri, pituus, _ in self.saapuneet]
+        oikeat = self.tarkasta_monta(paketit)
+        self.saapuneet = collections.deque(
+            (puskuri, pituus, lahettaja, oikea)
+            for (puskuri, pituus, lahettaja), oikea
+            in zip(self.saapuneet, oikeat))
+
+
+    def kasittele_paketti(self, puskuri, pituus, lahettaja, oikea=None):
+        '''Käsittelee altaan puskuriin luetun paketin, jonka pituus on
+        pituus, ja palauttaa ota_vastaan_bytes()-metodin tavoin viestin
+        tai None. Tämä on erotettu lukemisesta, jotta paketteja voi
+        syöttää myös muualta kuin soketista (esim. asyncio). Jos
+        paketti on jo tarkastettu (ks. tarkasta_saapuneet()), tulos
+        annetaan parametrina oikea.'''
+        saapunut = memoryview(puskuri)[:pituus]
+        if oikea is None:
+            oikea = self.tarkasta(saapunut)
+        crc_ok = (oikea and
+                  not self.lue_otsake(saapunut)[1] & luotettavuus.LIPPU_ACK)
+        sekvno, data = self.pura(saapunut) if crc_ok else (None, None)
         if crc_ok and sekvno == self.odotettu_sekvno:
-            self.kuittaus = self.valm_paketti(self.odotettu_sekvno, \
-                                              'ACK')
+            # Kuitataan samalla tarkistussumma-algoritmilla, jota
+            # lähettäjä käyttää.
+            self.sovi_tarkistus(saapunut)
             print('(Vastaanotettu virheetön paketti, jossa odotettu ' +\
                   'sekvenssinumero.)')
-            self.kuittaa(lahettaja)
             self.odotettu_sekvno = (self.odotettu_sekvno + 1) % self.max
-            return data
+            liput = self.lue_otsake(saapunut)[1]
+            viesti = self.kokoa(data, liput)
+            # Kootun paketin viestit palautetaan yksi kerrallaan.
+            if viesti is not None and liput & luotettavuus.LIPPU_KOOTTU:
+                self.valmiit.extend(self.pura_kootut(viesti))
+                self.allas.vapauta(viesti.obj)
+                viesti = self.valmiit.popleft() if self.valmiit else None
+            if viesti is not None:
+                self.sovelluksella += 1
+            # Kuitataan vasta nyt, jotta ilmoitettu ikkuna on ajan tasalla.
+            self.kuittaa_viivastetysti(lahettaja)
+            return viesti
         else:
             print('(Vastaanotettu virheellinen paketti: bittivirhe tai ' +\
                   'väärä sekvenssinumero.)')
             self.kuittaa(lahettaja)
+            self.allas.vapauta(puskuri)
             return None
 
         
+    def lue_paketti(self, puskuri, lue=None):
+        '''Lukee paketin puskuriin ja palauttaa paketin pituuden ja
+        lähettäjän. Jos kuittaus odottaa lähettämistä, pakettia odotetaan
+        enintään kuittausviiveen loppuun asti. Sen jälkeen kuittaus
+        lähetetään ja pakettia odotetaan edelleen. Paketti luetaan
+        funktiolla lue(puskuri), jonka paluuarvo palautetaan; oletuksena
+        käytetään soketin recvfrom_into()-metodia.'''
+        if lue is None:
+            lue = lambda puskuri: self.soketti.recvfrom_into(
+                puskuri, self.puskurin_koko)
+        while self.kuittaushetki is not None:
+            odotus = self.kuittaushetki - time.monotonic()
+            if odotus <= 0:
+                self.kuittaa(self.kuittauksen_vastott)
+                break
+            aikaraja = self.soketti.gettimeout()
+            self.soketti.settimeout(odotus)
+            try:
+                return lue(puskuri)
+            except s.timeout:
+                self.kuittaa(self.kuittauksen_vastott)
+            finally:
+                self.soketti.settimeout(aikaraja)
+        return lue(puskuri)
+
+
+    def kuittaa_viivastetysti(self, vastott):
+        '''Kuittaa järjestyksessä saapuneen paketin joko heti tai
+        myöhemmin (ks. self.kuittausvali ja self.kuittausviive).'''
+        self.kuittaamatta += 1
+        if self.kuittaamatta >= self.kuittausvali:
+            self.kuittaa(vastott)
+        elif self.kuittaushetki is None:
+            self.kuittaushetki = time.monotonic() + self.kuittausviive
+            self.kuittauksen_vastott = vastott
+
+
+    def kokoa(self, data, liput):
+        '''Liittää viestin osan koottavaan viestiin. Palauttaa valmiin
+        viestin tai None, jos viestistä puuttuu vielä osia. Yhdessä
+        paketissa tullut viesti palautetaan sellaisenaan, joten sitä ei
+        kopioida.'''
+        if liput & luotettavuus.LIPPU_JATKUU:
+            self.kokoamaton += data
+            self.allas.vapauta(data.obj)
+            return None
+        if not self.kokoamaton:
+            return data
+        self.kokoamaton += data
+        self.allas.vapauta(data.obj)
+        viesti = memoryview(self.kokoamaton)
+        self.kokoamaton = bytearray()
+        return viesti
+
+
+    def vapauta(self, data):
+        '''Palauttaa metodin ota_vastaan_bytes() palauttaman viestin
+        puskurin altaaseen. Jos lähettäjälle on ilmoitettu, että jono on
+        täynnä, ilmoitetaan samalla, että tilaa on taas.'''
+        self.allas.vapauta(data.obj)
+        self.sovelluksella = max(0, self.sovelluksella - 1)
+        if (self.ilmoitettu == 0 and self.ilmoitettava_ikkuna() > 0 and
+            self.vastapuoli is not None):
+            self.kuittaa(self.vastapuoli)
+
+
+    def ilmoitettava_ikkuna(self):
+        '''Palauttaa lähettäjälle ilmoitettavan ikkunan.'''
+        return max(0, min(self.jonon_koko - self.sovelluksella -
+                          len(self.valmiit), 2**16 - 1))
+
+
     def kuittaa(self, vastott):
-        '''Lähettää kuittauksen. Metodin kutsujan on huolehdittava
-        siitä, että attribuuttina oleva kuittaus on päivitetty.'''
-        self.laheta(self.kuittaus, vastott)
-        print('(Lähetetty kuittaus, sekvenssinumero {}.)'.\
-              format(self.kuittaus[0]))
+        '''Lähettää kuittauksen viimeisimmästä järjestyksessä saapuneesta
+        paketista. Kuittauksessa on myös vastaanottajan ikkuna.'''
+        self.kuittaamatta = 0
+        self.kuittaushetki = None
+        sekvno = (self.odotettu_sekvno - 1) % self.max
+        self.ilmoitettu = self.ilmoitettava_ikkuna()
+        self.vastapuoli = vastott
+        kuittaus = self.valm_paketti(
+            sekvno, luotettavuus.IKKUNA.pack(self.ilmoitettu),
+            luotettavuus.LIPPU_ACK | luotettavuus.LIPPU_IKKUNA)
+        self.laheta(kuittaus, vastott)
+        print('(Lähetetty kuittaus, sekvenssinumero {}, ikkuna {}.)'.\
+              format(sekvno, self.ilmoitettu))
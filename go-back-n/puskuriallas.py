@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+
+class Puskuriallas:
+    '''Uudelleenkäytettävien vastaanottopuskurien allas.
+
+    Kun paketti luetaan soketin recvfrom-metodilla, jokaista pakettia varten
+    luodaan uusi bytes-olio. Altaasta otetaan sen sijaan valmiiksi varattu
+    bytearray, johon paketti luetaan recvfrom_into-metodilla. Kun sovellus
+    ei enää tarvitse pakettia, puskuri palautetaan altaaseen.
+
+    Jos allas on tyhjä, varataan uusi puskuri. Altaaseen palautetaan
+    kuitenkin enintään alkuperäinen määrä puskureita, joten allas ei kasva
+    rajatta.
+
+    Lista-operaatiot append ja pop ovat CPythonissa atomisia, joten
+    puskurin voi palauttaa eri säikeestä kuin mistä se otettiin.
+    '''
+
+    def __init__(self, koko, maara):
+        self.koko = koko  # Yhden puskurin koko tavuina.
+        self.maara = maara  # Altaassa säilytettävien puskurien enimmäismäärä.
+        self.vapaat = [bytearray(koko) for _ in range(maara)]
+        self.lainassa = 0  # Varattujen ja vapauttamattomien puskurien
+                           # määrä (likimääräinen, koska vapauta() ei
+                           # tunnista, onko puskuri otettu tästä altaasta).
+
+
+    def varaa(self):
+        '''Palauttaa vapaan puskurin.'''
+        self.lainassa += 1
+        try:
+            return self.vapaat.pop()
+        except IndexError:
+            return bytearray(self.koko)
+
+
+    def vapauta(self, puskuri):
+        '''Palauttaa puskurin altaaseen. Puskurin sisältöön ei saa enää
+        viitata, koska se voidaan täyttää seuraavalla paketilla.'''
+        if len(puskuri) != self.koko:
+            return
+        self.lainassa = max(0, self.lainassa - 1)
+        if len(self.vapaat) < self.maara:
+            self.vapaat.append(puskuri)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import ajastin
+import heapq
+import itertools
+import selectors
+import socket as s
+import threading as thrd
+import time
+import traceback
+
+
+class Tapahtumasilmukka:
+    '''Tapahtumasilmukka odottaa samassa säikeessä sekä sokettien
+    luettavuutta (selectors) että ajastusten laukeamista.
+
+    Ajastukset ovat keossa (heapq) laukeamishetken mukaan
+    järjestettyinä, ja silmukka odottaa select()-kutsussa enintään
+    seuraavaan laukeamishetkeen asti. Muut säikeet herättävät silmukan
+    kirjoittamalla tavun herätyssokettiin (socketpair), kun ne lisäävät
+    ajastuksen, joka laukeaa ennen kaikkia aiempia, tai pysäyttävät
+    silmukan. Silmukka ei siis koskaan odota turhaan eikä kysele
+    tilaa määräajoin.
+
+    Takaisinkutsut suoritetaan silmukan säikeessä yksi kerrallaan,
+    joten ne eivät saa jäädä odottamaan pitkäksi aikaa. Muuten muutkin
+    tapahtumat myöhästyvät.
+    '''
+
+    def __init__(self):
+        self.valitsin = selectors.DefaultSelector()
+        self.keko = []
+        self.jarjestys = itertools.count()  # Samanaikaiset ajastukset
+                                            # suoritetaan lisäysjärjestyksessä.
+        self.perutut = 0  # Keossa olevien peruttujen ajastusten määrä
+                          # (likimääräinen).
+        self.lukko = thrd.Lock()
+        self.loppu = False
+        # Herätyssokettipari: silmukka lukee toista päätä, ja muut säikeet
+        # kirjoittavat toiseen.
+        self.herate_luku, self.herate_kirj = s.socketpair()
+        self.herate_luku.setblocking(False)
+        self.herate_kirj.setblocking(False)
+        self.valitsin.register(self.herate_luku, selectors.EVENT_READ,
+                               self.tyhjenna_herate)
+        self.saie = thrd.Thread(target=self.suorita, daemon=True)
+        self.saie.start()
+
+
+    def ajasta(self, aika, funktio, args=()):
+        '''Kutsuu funktiota argumenteilla args, kun aika sekuntia on
+        kulunut. Palauttaa ajastin.Ajastin-olion.'''
+        uusi = ajastin.Ajastin(self, time.monotonic() + aika, funktio, args)
+        with self.lukko:
+            # Jos perutut ajastukset ovat kasvattaneet keon suureksi,
+            # poistetaan ne kerralla.
+            if self.perutut > 64 and self.perutut > len(self.keko) // 2:
+                self.keko = [alkio for alkio in self.keko
+                             if not alkio[2].peruttu]
+                heapq.heapify(self.keko)
+                self.perutut = 0
+            heapq.heappush(self.keko,
+                           (uusi.hetki, next(self.jarjestys), uusi))
+            ensimmainen = self.keko[0][2] is uusi
+        # Silmukka herätetään vain, jos uusi ajastus laukeaa ennen kaikkia
+        # aiempia. Silmukan omasta säikeestä ei tarvitse herättää, koska
+        # odotusaika lasketaan uudelleen ennen seuraavaa odotusta.
+        if ensimmainen and thrd.current_thread() is not self.saie:
+            self.herata()
+        return uusi
+
+
+    def rekisteroi(self, tiedosto, funktio):
+        '''Kutsuu funktiota aina, kun tiedostosta (esim. soketista) voi
+        lukea. Rekisteröinti tehdään silmukan säikeessä.'''
+        self.ajasta(0, self.valitsin.register,
+                    (tiedosto, selectors.EVENT_READ, funktio))
+
+
+    def lopeta(self):
+        '''Pysäyttää silmukan. Ajastuksia, jotka eivät ole vielä
+        lauenneet, ei suoriteta. Rekisteröityjä sokettejä ei suljeta.'''
+        with self.lukko:
+            self.loppu = True
+        self.herata()
+
+
+    def herata(self):
+        '''Herättää silmukan select()-kutsusta.'''
+        try:
+            self.herate_kirj.send(b'\0')
+        # Jos puskuri on täynnä, herätys on jo tulossa. Jos silmukka on
+        # jo pysähtynyt, soketti on suljettu eikä herättämistä tarvita.
+        except (BlockingIOError, OSError):
+            pass
+
+
+    def tyhjenna_herate(self):
+        '''Lukee herätyssokettiin kirjoitetut tavut.'''
+        try:
+            while self.herate_luku.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+
+    def suorita(self):
+        '''Silmukan säikeen pääsilmukka.'''
+        while True:
+            with self.lukko:
+                if self.loppu:
+                    break
+                # Perutut ajastukset ohitetaan.
+                while self.keko and self.keko[0][2].peruttu:
+                    heapq.heappop(self.keko)
+                    self.perutut -= 1
+                if self.keko:
+                    odotus = max(0, self.keko[0][0] - time.monotonic())
+                else:
+                    odotus = None
+            for avain, _ in self.valitsin.select(odotus):
+                self.kutsu(avain.data)
+            for lauennut in self.lauenneet():
+                # Ajastus on voitu perua sen jälkeen, kun se otettiin
+                # keosta.
+                if not lauennut.peruttu:
+                    self.kutsu(lauennut.funktio, *lauennut.args)
+        self.valitsin.close()
+        self.herate_luku.close()
+        self.herate_kirj.close()
+
+
+    def lauenneet(self):
+        '''Poistaa keosta ja palauttaa listan ajastuksista, joiden
+        laukeamishetki on jo mennyt.'''
+        nyt = time.monotonic()
+        lauenneet = []
+        with self.lukko:
+            while self.keko and self.keko[0][0] <= nyt:
+                lauennut = heapq.heappop(self.keko)[2]
+                if lauennut.peruttu:
+                    self.perutut -= 1
+                else:
+                    lauenneet.append(lauennut)
+        return lauenneet
+
+
+    def kutsu(self, funktio, *args):
+        '''Kutsuu takaisinkutsua. Poikkeus tulostetaan, mutta silmukka
+        jatkaa toimintaansa.'''
+        try:
+            funktio(*args)
+        except Exception:
+            traceback.print_exc()
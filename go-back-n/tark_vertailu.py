@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import os
+import tarkistussumma
+import timeit
+
+
+def mittaa(tarkistus, data, toistot):
+    '''Palauttaa yhden tavun käsittelyyn kuluneen ajan nanosekunteina.'''
+    aika = timeit.timeit(lambda: tarkistus.laske(data), number=toistot)
+    return aika / toistot / len(data) * 1e9
+
+
+def main():
+    '''Pääohjelma. Vertailee tarkistussumma-algoritmien nopeutta
+    eri pakettikoilla.'''
+    koot = [64, 256, 1472]  # 1472 tavua mahtuu juuri Ethernet-kehykseen.
+    toistot = 2000
+
+    print('Tarkistussummien hinta, ns/tavu.\n')
+    print('{:>10}'.format('') + ''.join('{:>12}'.format(koko)
+                                         for koko in koot))
+    for nimi in tarkistussumma.TARKISTUKSET:
+        tarkistus = tarkistussumma.hae(nimi)
+        tulokset = []
+        for koko in koot:
+            data = os.urandom(koko)
+            tulokset.append(mittaa(tarkistus, data, toistot))
+        print('{:>10}'.format(nimi) + ''.join('{:>12.2f}'.format(tulos)
+                                               for tulos in tulokset))
+    if not tarkistussumma.crc32c_c:
+        print('\n(crc32c-pakettia ei ole asennettu, joten CRC-32C '
+              'laskettiin Pythonilla.)')
+
+
+main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+import eraio
+import puskuriallas
+import socket as s
+import unittest
+
+
+class Hukkaava(s.socket):
+    '''Soketti, jonka korvattua metodia eräsiirto ei saa ohittaa.'''
+
+    def sendto(self, *args):
+        return 0
+
+
+@unittest.skipUnless(eraio.libc is not None,
+                     'sendmmsg ja recvmmsg eivät ole käytettävissä.')
+class EraTesti(unittest.TestCase):
+    '''Eräsiirto sendmmsg- ja recvmmsg-kutsuilla paikallisten sokettien
+    välillä.'''
+
+    def setUp(self):
+        self.lahettaja = self.soketti(s.AF_INET, '127.0.0.1')
+        self.vastott = self.soketti(s.AF_INET, '127.0.0.1')
+
+
+    def soketti(self, perhe, osoite):
+        soketti = s.socket(perhe, s.SOCK_DGRAM)
+        self.addCleanup(soketti.close)
+        soketti.bind((osoite, 0))
+        return soketti
+
+
+    def test_tukee(self):
+        self.assertTrue(eraio.tukee(self.lahettaja, 'sendto'))
+        self.assertTrue(eraio.tukee(self.lahettaja, 'recvfrom_into'))
+        hukkaava = Hukkaava(s.AF_INET, s.SOCK_DGRAM)
+        self.addCleanup(hukkaava.close)
+        self.assertFalse(eraio.tukee(hukkaava, 'sendto'))
+        self.assertTrue(eraio.tukee(hukkaava, 'recvfrom_into'))
+        tcp = s.socket(s.AF_INET, s.SOCK_STREAM)
+        self.addCleanup(tcp.close)
+        self.assertFalse(eraio.tukee(tcp, 'sendto'))
+
+
+    def test_era_perille(self):
+        # Paketit tulevat järjestyksessä ja eripituisina, ja lähettäjän
+        # osoite on sama kuin recvfrom_into-metodilla.
+        paketit = [bytes([i]) * (i + 1) for i in range(10)]
+        paketit[3] = bytearray(paketit[3])
+        paketit[4] = memoryview(paketit[4])
+        maara = eraio.laheta_monta(self.lahettaja, paketit,
+                                   self.vastott.getsockname())
+        self.assertEqual(maara, len(paketit))
+        puskurit = [bytearray(64) for _ in range(eraio.ERA)]
+        tulokset = eraio.vastaanota_monta(self.vastott, puskurit)
+        self.assertEqual(len(tulokset), len(paketit))
+        for puskuri, (pituus, lahettaja), paketti in zip(puskurit, tulokset,
+                                                         paketit):
+            self.assertEqual(lahettaja, self.lahettaja.getsockname())
+            self.assertEqual(bytes(puskuri[:pituus]), bytes(paketti))
+
+
+    def test_puskureita_vahemman_kuin_paketteja(self):
+        # Ylimääräiset paketit jäävät seuraavaan kutsuun.
+        paketit = [str(i).encode() for i in range(5)]
+        eraio.laheta_monta(self.lahettaja, paketit,
+                           self.vastott.getsockname())
+        puskurit = [bytearray(8) for _ in range(3)]
+        tulokset = eraio.vastaanota_monta(self.vastott, puskurit)
+        self.assertEqual([bytes(puskuri[:pituus]) for puskuri, (pituus, _)
+                          in zip(puskurit, tulokset)], paketit[:3])
+        tulokset = eraio.vastaanota_monta(self.vastott, puskurit)
+        self.assertEqual([bytes(puskuri[:pituus]) for puskuri, (pituus, _)
+                          in zip(puskurit, tulokset)], paketit[3:])
+
+
+    def test_nbytes_rajaa(self):
+        # Paketti katkeaa nbytes-tavun kohdalta kuten recvfrom_into.
+        eraio.laheta_monta(self.lahettaja, [b'abcdefgh'],
+                           self.vastott.getsockname())
+        puskuri = bytearray(8)
+        (pituus, _), = eraio.vastaanota_monta(self.vastott, [puskuri], 4)
+        self.assertEqual(pituus, 4)
+        self.assertEqual(bytes(puskuri[:pituus]), b'abcd')
+
+
+    def test_tyhja(self):
+        # Kumpikaan ei estä, jos lähetettävää tai luettavaa ei ole.
+        self.assertEqual(eraio.laheta_monta(self.lahettaja, [],
+                                            self.vastott.getsockname()), 0)
+        self.assertEqual(eraio.vastaanota_monta(self.vastott, []), [])
+        self.assertEqual(eraio.vastaanota_monta(self.vastott,
+                                                [bytearray(8)]), [])
+
+
+    def test_suljettu_soketti(self):
+        self.lahettaja.close()
+        with self.assertRaises(OSError):
+            eraio.laheta_monta(self.lahettaja, [b'x'],
+                               self.vastott.getsockname())
+
+
+    def test_lue_altaaseen(self):
+        # Käyttämättömät puskurit palautetaan altaaseen.
+        allas = puskuriallas.Puskuriallas(64, eraio.ERA)
+        paketit = [b'eka', b'toka', b'kolmas']
+        eraio.laheta_monta(self.lahettaja, paketit,
+                           self.vastott.getsockname())
+        tulokset = eraio.lue_altaaseen(self.vastott, allas)
+        self.assertEqual([bytes(puskuri[:pituus]) for puskuri, pituus, _
+                          in tulokset], paketit)
+        self.assertEqual(allas.lainassa, len(paketit))
+        self.assertEqual(len(allas.vapaat), eraio.ERA - len(paketit))
+        for puskuri, _, _ in tulokset:
+            allas.vapauta(puskuri)
+        self.assertEqual(allas.lainassa, 0)
+        self.assertEqual(eraio.lue_altaaseen(self.vastott, allas), [])
+        self.assertEqual(len(allas.vapaat), eraio.ERA)
+
+
+    @unittest.skipUnless(s.has_ipv6, 'IPv6 ei ole käytettävissä.')
+    def test_ipv6(self):
+        try:
+            lahettaja = self.soketti(s.AF_INET6, '::1')
+            vastott = self.soketti(s.AF_INET6, '::1')
+        except OSError:
+            self.skipTest('IPv6-silmukkaosoite ei ole käytettävissä.')
+        eraio.laheta_monta(lahettaja, [b'eka', b'toka'],
+                           vastott.getsockname())
+        puskurit = [bytearray(8) for _ in range(4)]
+        tulokset = eraio.vastaanota_monta(vastott, puskurit)
+        self.assertEqual([bytes(puskuri[:pituus]) for puskuri, (pituus, _)
+                          in zip(puskurit, tulokset)], [b'eka', b'toka'])
+        for _, osoite in tulokset:
+            self.assertEqual(osoite, lahettaja.getsockname())
+
+
+class GsoTesti(unittest.TestCase):
+    '''UDP-segmentoinnin siirto (GSO ja GRO) paikallisten sokettien
+    välillä. Testit ohitetaan, jos käyttöjärjestelmä ei tue niitä.'''
+
+    def setUp(self):
+        self.lahettaja = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        self.addCleanup(self.lahettaja.close)
+        self.lahettaja.bind(('127.0.0.1', 0))
+        self.vastott = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        self.addCleanup(self.vastott.close)
+        self.vastott.bind(('127.0.0.1', 0))
+        self.vastott.settimeout(5)
+        if not eraio.tukee_gso(self.lahettaja):
+            self.skipTest('GSO ei ole käytettävissä.')
+
+
+    def test_ei_tukea(self):
+        hukkaava = Hukkaava(s.AF_INET, s.SOCK_DGRAM)
+        self.addCleanup(hukkaava.close)
+        self.assertFalse(eraio.tukee_gso(hukkaava))
+        tcp = s.socket(s.AF_INET, s.SOCK_STREAM)
+        self.addCleanup(tcp.close)
+        self.assertFalse(eraio.tukee_gso(tcp))
+        self.assertFalse(eraio.kayta_gro(tcp))
+
+
+    def test_gso_kutsut(self):
+        # Samankokoiset paketit ja lyhyempi viimeinen lähtevät yhdellä
+        # kutsulla, ja pidempi paketti aloittaa uuden kutsun.
+        paketit = [bytes([i]) * 100 for i in range(5)] + [b'x' * 40]
+        self.assertEqual(eraio.laheta_gso(self.lahettaja, paketit,
+                                          self.vastott.getsockname()), 1)
+        # Ilman GRO:ta vastaanottaja saa paketit erikseen.
+        for paketti in paketit:
+            self.assertEqual(self.vastott.recv(eraio.GRO_PUSKURI), paketti)
+        paketit = [b'a' * 10, b'b' * 20, b'c' * 20, b'd' * 5, b'e' * 5]
+        self.assertEqual(eraio.laheta_gso(self.lahettaja, paketit,
+                                          self.vastott.getsockname()), 3)
+        for paketti in paketit:
+            self.assertEqual(self.vastott.recv(eraio.GRO_PUSKURI), paketti)
+
+
+    def test_gso_yksi_paketti(self):
+        self.assertEqual(eraio.laheta_gso(self.lahettaja, [b'yksi'],
+                                          self.vastott.getsockname()), 1)
+        self.assertEqual(self.vastott.recv(64), b'yksi')
+        self.assertEqual(eraio.laheta_gso(self.lahettaja, [],
+                                          self.vastott.getsockname()), 0)
+
+
+    def test_gro(self):
+        # Ydin voi yhdistää paketit tai jättää ne erilleen, mutta
+        # vastaanota_gro() palauttaa aina alkuperäiset paketit.
+        if not eraio.kayta_gro(self.vastott):
+            self.skipTest('GRO ei ole käytettävissä.')
+        paketit = [bytes([i]) * 100 for i in range(5)] + [b'x' * 40]
+        eraio.laheta_gso(self.lahettaja, paketit, self.vastott.getsockname())
+        puskuri = bytearray(eraio.GRO_PUSKURI)
+        saapuneet = []
+        while len(saapuneet) < len(paketit):
+            osat, lahettaja = eraio.vastaanota_gro(self.vastott, puskuri)
+            self.assertEqual(lahettaja, self.lahettaja.getsockname())
+            saapuneet.extend(bytes(puskuri[alku:alku + pituus])
+                             for alku, pituus in osat)
+        self.assertEqual(saapuneet, paketit)
+
+
+if __name__ == '__main__':
+    unittest.main()
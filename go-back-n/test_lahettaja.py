@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+import contextlib
+import eraio
+import io
+import luotettavuus
+import luotettavuus_lah
+import socket as s
+import threading as thrd
+import time
+import unittest
+import unittest.mock
+
+
+class LahettajaTesti(unittest.TestCase):
+    '''Lähettäjän testit. Vastaanottajana on pelkkä soketti, ja kuittaukset
+    syötetään lähettäjälle suoraan.'''
+
+    def setUp(self):
+        self.tuloste = contextlib.redirect_stdout(io.StringIO())
+        self.tuloste.__enter__()
+        # Vastaanottaja on pelkkä soketti, joka ei kuittaa mitään.
+        self.vastott = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        self.vastott.bind(('127.0.0.1', 0))
+        self.vastott.settimeout(5)
+        self.luottokrs = luotettavuus_lah.Luottolahettaja(
+            s.socket(s.AF_INET, s.SOCK_DGRAM), 64,
+            self.vastott.getsockname(), ikkuna=2, maksimi=16,
+            ruuhkanhallinta='vakio')
+
+
+    def tearDown(self):
+        self.luottokrs.lopeta()
+        self.luottokrs.soketti.close()
+        self.vastott.close()
+        self.tuloste.__exit__(None, None, None)
+
+
+    def lue(self):
+        '''Palauttaa seuraavan saapuneen paketin sekvenssinumeron ja
+        datan.'''
+        paketti = memoryview(self.vastott.recv(64))
+        sekvno, data = self.luottokrs.pura(paketti)
+        return sekvno, bytes(data)
+
+
+    def test_ikkuna_plus_yksi(self):
+        # Lähettäminen täyteen lähetysikkunaan ei saa kirjoittaa yli
+        # kuittaamatonta pakettia, joka voidaan vielä lähettää uudelleen.
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.luottokrs.laheta_bytes(b'BBBB')
+        self.assertEqual(self.lue(), (1, b'AAAA'))
+        self.assertEqual(self.lue(), (2, b'BBBB'))
+
+        # Ikkuna on täynnä, joten kolmas lähetys jää odottamaan.
+        kolmas = thrd.Thread(target=self.luottokrs.laheta_bytes,
+                             args=(b'OVER',))
+        kolmas.start()
+        kolmas.join(0.2)
+        self.assertTrue(kolmas.is_alive())
+
+        # Uudelleenlähetyksessä ovat alkuperäiset paketit.
+        self.luottokrs.laheta_uudestaan()
+        self.assertEqual(self.lue(), (1, b'AAAA'))
+        self.assertEqual(self.lue(), (2, b'BBBB'))
+
+        # Kuittaus vapauttaa paikan, jolloin kolmas paketti lähtee.
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, b'', luotettavuus.LIPPU_ACK))
+        kolmas.join(5)
+        self.assertFalse(kolmas.is_alive())
+        self.assertEqual(self.lue(), (3, b'OVER'))
+        self.luottokrs.laheta_uudestaan()
+        self.assertEqual(self.lue(), (2, b'BBBB'))
+        self.assertEqual(self.lue(), (3, b'OVER'))
+
+
+    def test_pitka_viesti_osina(self):
+        # Pakettiin mahtumaton viesti lähetetään osina, ja kaikissa paitsi
+        # viimeisessä osassa on lippu LIPPU_JATKUU.
+        koko = self.luottokrs.kuorman_koko()
+        viesti = bytes(range(koko + 10))
+        self.luottokrs.laheta_viesti(viesti)
+        osat = []
+        for _ in range(2):
+            paketti = self.vastott.recv(64)
+            sekvno, data = self.luottokrs.pura(paketti)
+            osat.append((sekvno, self.luottokrs.lue_otsake(paketti)[1],
+                         bytes(data)))
+        self.assertEqual(osat, [(1, luotettavuus.LIPPU_JATKUU, viesti[:koko]),
+                                (2, 0, viesti[koko:])])
+
+
+    def test_pienet_viestit_koottuna(self):
+        # Peräkkäiset pienet viestit lähtevät yhtenä pakettina, kun
+        # kokoamisaika päättyy.
+        self.luottokrs.kokoamisaika = 0.05
+        for viesti in (b'eka', 'toka', b''):
+            self.luottokrs.laheta_koottuna(viesti)
+        paketti = self.vastott.recv(64)
+        sekvno, data = self.luottokrs.pura(paketti)
+        self.assertEqual(sekvno, 1)
+        self.assertEqual(self.luottokrs.lue_otsake(paketti)[1],
+                         luotettavuus.LIPPU_KOOTTU)
+        self.assertEqual([bytes(v) for v in self.luottokrs.pura_kootut(data)],
+                         [b'eka', b'toka', b''])
+
+
+    def test_taysi_kooste_lahtee(self):
+        # Kun seuraava viesti ei enää mahdu pakettiin, kootut lähtevät
+        # heti. Pakettiin mahtumaton viesti lähtee omana pakettinaan.
+        self.luottokrs.kokoamisaika = 60
+        koko = self.luottokrs.kuorman_koko()
+        puolikas = (koko // 2 - luotettavuus.TIETUE.size) * b'x'
+        self.luottokrs.laheta_koottuna(puolikas)
+        self.luottokrs.laheta_koottuna(puolikas)
+        self.luottokrs.laheta_koottuna(b'y')
+        paketti = self.vastott.recv(64)
+        self.assertEqual(len(self.luottokrs.pura_kootut(
+            self.luottokrs.pura(paketti)[1])), 2)
+        # Kuitataan ensimmäinen paketti, jotta kaksi seuraavaa mahtuu
+        # ikkunaan.
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, b'', luotettavuus.LIPPU_ACK))
+        self.luottokrs.laheta_koottuna(koko * b'z')
+        paketti = self.vastott.recv(64)
+        self.assertEqual(self.luottokrs.pura(paketti)[0], 2)
+        self.assertEqual([bytes(v) for v in self.luottokrs.pura_kootut(
+            self.luottokrs.pura(paketti)[1])], [b'y'])
+        paketti = self.vastott.recv(64)
+        self.assertEqual(self.luottokrs.lue_otsake(paketti)[1], 0)
+        self.assertEqual(bytes(self.luottokrs.pura(paketti)[1]), koko * b'z')
+
+
+    def test_tyhjenna(self):
+        # tyhjenna() lähettää kootut odottamatta kokoamisaikaa.
+        self.luottokrs.kokoamisaika = 60
+        self.luottokrs.laheta_koottuna(b'heti')
+        self.vastott.settimeout(0.1)
+        with self.assertRaises(s.timeout):
+            self.vastott.recv(64)
+        self.luottokrs.tyhjenna()
+        self.assertIsNone(self.luottokrs.kokoamisajastin)
+        paketti = self.vastott.recv(64)
+        self.assertEqual([bytes(v) for v in self.luottokrs.pura_kootut(
+            self.luottokrs.pura(paketti)[1])], [b'heti'])
+
+
+    def test_lyhyt_ikkuna(self):
+        # Kuittaus, jossa on ikkunan lippu mutta ei ikkunaa, kuittaa
+        # paketin mutta ei muuta ikkunaa.
+        self.luottokrs.laheta_bytes(b'AAAA')
+        sekvno, _ = self.lue()
+        liput = luotettavuus.LIPPU_ACK | luotettavuus.LIPPU_IKKUNA
+        for data in (b'', b'\x01'):
+            self.luottokrs.kasittele_kuittaus(
+                self.luottokrs.valm_paketti(sekvno, data, liput))
+        self.assertEqual(self.luottokrs.vastott_ikkuna, 2)
+        self.assertEqual(self.luottokrs.vanhin, self.luottokrs.seur)
+
+
+    def tuplakuittaus(self, maara):
+        for _ in range(maara):
+            self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+                0, b'', luotettavuus.LIPPU_ACK))
+
+
+    def test_nopea_uudelleenlahetys(self):
+        # Kolmas tuplakuittaus lähettää kaikki kuittaamattomat paketit
+        # uudelleen odottamatta aikakatkaisua.
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.luottokrs.laheta_bytes(b'BBBB')
+        self.lue()
+        self.lue()
+        self.tuplakuittaus(2)
+        self.vastott.settimeout(0.1)
+        with self.assertRaises(s.timeout):
+            self.lue()
+        self.tuplakuittaus(1)
+        self.assertEqual(self.lue(), (1, b'AAAA'))
+        self.assertEqual(self.lue(), (2, b'BBBB'))
+        self.assertEqual(self.luottokrs.tuplakuittaukset, 3)
+        # Seuraavat tuplakuittaukset eivät aiheuta uutta lähetystä.
+        self.tuplakuittaus(2)
+        with self.assertRaises(s.timeout):
+            self.lue()
+
+
+    def test_ikkunan_paivitys_ei_ole_tuplakuittaus(self):
+        # Kuittaus, joka vain muuttaa ilmoitettua ikkunaa, ei ole
+        # tuplakuittaus.
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.lue()
+        liput = luotettavuus.LIPPU_ACK | luotettavuus.LIPPU_IKKUNA
+        for ikkuna in (5, 6, 7):
+            self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+                0, luotettavuus.IKKUNA.pack(ikkuna), liput))
+        self.assertEqual(self.luottokrs.tuplakuittaukset, 0)
+        self.assertEqual(self.luottokrs.vastott_ikkuna, 7)
+
+
+    def test_uusi_kuittaus_nollaa_tuplakuittaukset(self):
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.luottokrs.laheta_bytes(b'BBBB')
+        self.lue()
+        self.lue()
+        self.tuplakuittaus(2)
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, b'', luotettavuus.LIPPU_ACK))
+        self.assertEqual(self.luottokrs.tuplakuittaukset, 0)
+        # Laskenta alkaa alusta, joten kaksi tuplakuittausta ei riitä.
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, b'', luotettavuus.LIPPU_ACK))
+        self.assertEqual(self.luottokrs.tuplakuittaukset, 1)
+
+
+    def test_ruuhkaikkuna_rajoittaa(self):
+        # Hitaan aloituksen ruuhkaikkuna on aluksi yksi paketti, vaikka
+        # lähetysikkuna on suurempi. Kuittaus kasvattaa ikkunaa.
+        aimd = luotettavuus_lah.Luottolahettaja(
+            s.socket(s.AF_INET, s.SOCK_DGRAM), 64,
+            self.vastott.getsockname(), ikkuna=2, maksimi=16,
+            ruuhkanhallinta='aimd')
+        self.addCleanup(aimd.soketti.close)
+        self.addCleanup(aimd.lopeta)
+        self.assertEqual(aimd.ruuhka.ikkuna, 1)
+        aimd.laheta_bytes(b'AAAA')
+        self.assertFalse(aimd.voiko_lahettaa())
+        aimd.kasittele_kuittaus(aimd.valm_paketti(1, b'',
+                                                  luotettavuus.LIPPU_ACK))
+        self.assertEqual(aimd.ruuhka.ikkuna, 2)
+        aimd.laheta_bytes(b'BBBB')
+        self.assertTrue(aimd.voiko_lahettaa())
+
+
+    def test_nollaikkuna(self):
+        # Vastaanottajan nollaikkuna pysäyttää lähettämisen, ja
+        # ikkunan avaava kuittaus päästää odottavan lähetyksen läpi.
+        # Ikkunakoetin ei ehdi lähteä testin aikana.
+        liput = luotettavuus.LIPPU_ACK | luotettavuus.LIPPU_IKKUNA
+        self.luottokrs.rtt.minimi = 30
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.lue()
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, luotettavuus.IKKUNA.pack(0), liput))
+        self.assertEqual(self.luottokrs.vastott_ikkuna, 0)
+        self.assertFalse(self.luottokrs.voiko_lahettaa())
+        toinen = thrd.Thread(target=self.luottokrs.laheta_bytes,
+                             args=(b'BBBB',))
+        toinen.start()
+        toinen.join(0.2)
+        self.assertTrue(toinen.is_alive())
+        # Ikkunan päivitys tulee saman sekvenssinumeron kuittauksessa.
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, luotettavuus.IKKUNA.pack(2), liput))
+        toinen.join(5)
+        self.assertFalse(toinen.is_alive())
+        self.assertEqual(self.lue(), (2, b'BBBB'))
+
+
+    def test_ikkunakoetin(self):
+        # Kun ikkuna on nolla eikä kuittaamattomia paketteja ole,
+        # lähettäjä koettelee ikkunaa jo kuitatulla sekvenssinumerolla.
+        liput = luotettavuus.LIPPU_ACK | luotettavuus.LIPPU_IKKUNA
+        self.luottokrs.rtt.minimi = 0.01
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.lue()
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, luotettavuus.IKKUNA.pack(0), liput))
+        self.assertIsNotNone(self.luottokrs.koetin)
+        self.assertEqual(self.lue(), (1, b''))
+        # Ikkunan avautuminen pysäyttää koettelun.
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, luotettavuus.IKKUNA.pack(2), liput))
+        self.assertIsNone(self.luottokrs.koetin)
+        self.assertEqual(self.luottokrs.koettelut, 0)
+
+
+    def test_aikakatkaisu(self):
+        # Aikakatkaisu kaksinkertaistaa ajastimen ajan ja lähettää
+        # kuittaamattomat paketit uudelleen.
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.lue()
+        rto = self.luottokrs.rtt.rto
+        self.luottokrs.timeout()
+        self.assertEqual(self.luottokrs.rtt.rto, 2 * rto)
+        self.assertEqual(self.lue(), (1, b'AAAA'))
+
+
+    def test_myohastynyt_aikakatkaisu(self):
+        # Jos kaikki on kuitattu ennen kuin laukeava ajastin saa lukon,
+        # aikakatkaisu ei tee mitään.
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.lue()
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, b'', luotettavuus.LIPPU_ACK))
+        rto = self.luottokrs.rtt.rto
+        ajastin = self.luottokrs.ajastin
+        self.assertTrue(ajastin.peruttu)
+        self.luottokrs.timeout()
+        self.assertEqual(self.luottokrs.rtt.rto, rto)
+        self.assertIs(self.luottokrs.ajastin, ajastin)
+        self.vastott.settimeout(0.1)
+        with self.assertRaises(s.timeout):
+            self.lue()
+
+
+    def test_karnin_saanto(self):
+        # Kiertoviive mitataan vain kerran lähetetystä paketista.
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.lue()
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            1, b'', luotettavuus.LIPPU_ACK))
+        srtt = self.luottokrs.rtt.srtt
+        self.assertIsNotNone(srtt)
+        self.luottokrs.laheta_bytes(b'BBBB')
+        self.lue()
+        self.luottokrs.laheta_uudestaan()
+        self.lue()
+        self.luottokrs.kasittele_kuittaus(self.luottokrs.valm_paketti(
+            2, b'', luotettavuus.LIPPU_ACK))
+        self.assertEqual(self.luottokrs.rtt.srtt, srtt)
+        self.assertEqual(self.luottokrs.vanhin, self.luottokrs.seur)
+
+
+    def test_kuittaukset_erana(self):
+        # Eräsiirrolla luetut kuittaukset tarkastetaan yhdellä
+        # tarkasta_monta()-kutsulla eikä yksitellen.
+        if not eraio.tukee(self.luottokrs.soketti, 'recvfrom_into'):
+            self.skipTest('Eräsiirto ei ole käytettävissä.')
+        self.luottokrs.laheta_bytes(b'AAAA')
+        self.luottokrs.laheta_bytes(b'BBBB')
+        self.lue()
+        self.lue()
+        kuittaukset = [self.luottokrs.valm_paketti(sekvno, b'',
+                                                   luotettavuus.LIPPU_ACK)
+                       for sekvno in (1, 2, 2)]
+        kuittaukset[1][-1] ^= 1
+        for kuittaus in kuittaukset:
+            self.vastott.sendto(kuittaus, self.luottokrs.soketti.getsockname())
+        time.sleep(0.1)
+        self.luottokrs.soketti.setblocking(False)
+        with unittest.mock.patch.object(self.luottokrs, 'tarkasta') as \
+             tarkasta:
+            self.luottokrs.lue_kuittaukset()
+        tarkasta.assert_not_called()
+        self.assertEqual(self.luottokrs.vanhin, self.luottokrs.seur)
+
+
+if __name__ == '__main__':
+    unittest.main()
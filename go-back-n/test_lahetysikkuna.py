@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import lahetysikkuna
+import unittest
+
+
+class LahetysikkunaTesti(unittest.TestCase):
+    '''Kuittaamattomien pakettien rengaspuskuri.'''
+
+    def setUp(self):
+        # Kapasiteetti 4 ja sekvenssinumerot 0-9.
+        self.ikkuna = lahetysikkuna.Lahetysikkuna(4, 10, 16)
+
+
+    def lisaa(self, sekvno):
+        '''Kirjoittaa paketin seuraavan paikan puskuriin ja lisää sen.'''
+        lahetys = self.ikkuna.seuraava()
+        lahetys.puskuri[0] = sekvno
+        return self.ikkuna.lisaa(sekvno, memoryview(lahetys.puskuri)[:1],
+                                 1.0)
+
+
+    def test_tyhja(self):
+        self.assertEqual(len(self.ikkuna), 0)
+        self.assertEqual(list(self.ikkuna), [])
+        self.assertIsNone(self.ikkuna.hae(0))
+        with self.assertRaises(IndexError):
+            self.ikkuna[0]
+
+
+    def test_lisaa(self):
+        lahetys = self.lisaa(3)
+        self.assertIs(self.ikkuna[0], lahetys)
+        self.assertEqual(lahetys.sekvno, 3)
+        self.assertEqual(bytes(lahetys.paketti), bytes([3]))
+        self.assertEqual(lahetys.lahetetty, 1.0)
+        self.assertEqual(lahetys.uudelleen, 0)
+        self.assertFalse(lahetys.kuitattu)
+
+
+    def test_varaa(self):
+        lahetys = self.ikkuna.varaa(3)
+        self.assertIsNone(lahetys.paketti)
+        self.assertIs(self.ikkuna.hae(3), lahetys)
+
+
+    def test_taysi(self):
+        # Täyteen renkaaseen lisääminen ei kirjoita vanhimman päälle.
+        for sekvno in range(4):
+            self.lisaa(sekvno)
+        vanhin = self.ikkuna[0]
+        with self.assertRaises(IndexError):
+            self.ikkuna.seuraava()
+        with self.assertRaises(IndexError):
+            self.ikkuna.varaa(4)
+        self.assertEqual(len(self.ikkuna), 4)
+        self.assertEqual(bytes(vanhin.paketti), bytes([0]))
+        self.assertEqual([lahetys.sekvno for lahetys in self.ikkuna],
+                         [0, 1, 2, 3])
+
+
+    def test_seuraava_ennakkoon(self):
+        # seuraava(i) ei varaa paikkaa, mutta kertoo, mahtuuko i+1 pakettia.
+        self.lisaa(0)
+        self.assertIs(self.ikkuna.seuraava(2), self.ikkuna.paikat[3])
+        with self.assertRaises(IndexError):
+            self.ikkuna.seuraava(3)
+
+
+    def test_poista_vapauttaa(self):
+        for sekvno in range(4):
+            self.lisaa(sekvno)
+        poistettavat = [self.ikkuna[0], self.ikkuna[1]]
+        for lahetys in poistettavat:
+            lahetys.ajastin = object()
+        self.ikkuna.poista(2)
+        self.assertEqual(len(self.ikkuna), 2)
+        self.assertEqual([lahetys.sekvno for lahetys in self.ikkuna], [2, 3])
+        self.assertIsNone(self.ikkuna.hae(0))
+        for lahetys in poistettavat:
+            self.assertIsNone(lahetys.paketti)
+            self.assertIsNone(lahetys.ajastin)
+        # Vapautuneet paikat ja niiden puskurit käytetään uudelleen.
+        self.assertIs(self.lisaa(4), poistettavat[0])
+        self.assertIs(self.lisaa(5), poistettavat[1])
+        with self.assertRaises(IndexError):
+            self.ikkuna.seuraava()
+
+
+    def test_poista_enemman_kuin_ikkunassa(self):
+        self.lisaa(0)
+        self.ikkuna.poista(3)
+        self.assertEqual(len(self.ikkuna), 0)
+        self.lisaa(1)
+        self.assertEqual([lahetys.sekvno for lahetys in self.ikkuna], [1])
+
+
+    def test_kierto(self):
+        # Sekä renkaan paikat että sekvenssinumerot kiertävät alusta.
+        # Paketit pysyvät lähetysjärjestyksessä, ja hae() löytää ne myös
+        # sekvenssinumeron pyörähdettyä ympäri.
+        for sekvno in range(12):
+            if len(self.ikkuna) == 4:
+                self.ikkuna.poista(3)
+            self.lisaa(sekvno % 10)
+        self.assertEqual(len(self.ikkuna), 3)
+        odotetut = [9, 0, 1]
+        self.assertEqual([lahetys.sekvno for lahetys in self.ikkuna],
+                         odotetut)
+        for i, sekvno in enumerate(odotetut):
+            self.assertIs(self.ikkuna.hae(sekvno), self.ikkuna[i])
+            self.assertEqual(bytes(self.ikkuna[i].paketti), bytes([sekvno]))
+        self.assertIsNone(self.ikkuna.hae(2))
+        self.assertIsNone(self.ikkuna.hae(8))
+        self.lisaa(2)
+        self.assertEqual(self.ikkuna.hae(2).sekvno, 2)
+        with self.assertRaises(IndexError):
+            self.ikkuna.seuraava()
+
+
+    def test_lisaa_nollaa_paikan(self):
+        # Uudelleenkäytetty paikka ei peri edellisen paketin tilaa.
+        lahetys = self.lisaa(0)
+        lahetys.uudelleen = 2
+        lahetys.kuitattu = True
+        self.ikkuna.poista(1)
+        for sekvno in range(1, 5):
+            uusi = self.lisaa(sekvno)
+        self.assertIs(uusi, lahetys)
+        self.assertEqual(uusi.uudelleen, 0)
+        self.assertFalse(uusi.kuitattu)
+        self.assertIsNone(uusi.ajastin)
+
+
+if __name__ == '__main__':
+    unittest.main()
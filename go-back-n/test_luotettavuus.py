@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+import luotettavuus
+import random
+import struct
+import tarkistussumma
+import unittest
+
+
+class OtsakeTesti(unittest.TestCase):
+    '''Paketin otsake (luotettavuus.OTSAKE).'''
+
+    def setUp(self):
+        self.krs = luotettavuus.Luottokerros(None, 64)
+        self.krs.max = luotettavuus.MAKSIMI
+
+
+    def test_kentat(self):
+        self.assertEqual(luotettavuus.OTSAKE.size, 9)
+        liput = (luotettavuus.LIPPU_ACK | luotettavuus.LIPPU_JATKUU |
+                 luotettavuus.LIPPU_KOOTTU | luotettavuus.LIPPU_IKKUNA)
+        paketti = self.krs.valm_paketti(7, b'data', liput)
+        self.assertEqual(self.krs.lue_otsake(paketti),
+                         (luotettavuus.VERSIO, liput,
+                          self.krs.tarkistus.tunnus, 7, 4))
+        self.assertEqual(len(paketti), luotettavuus.OTSAKE.size + 4 +
+                         self.krs.tarkistus.pituus)
+        self.assertTrue(self.krs.tarkasta(paketti))
+
+
+    def test_liput_erillaan(self):
+        # Jokainen lippu on oma bittinsä.
+        liput = [luotettavuus.LIPPU_ACK, luotettavuus.LIPPU_JATKUU,
+                 luotettavuus.LIPPU_KOOTTU, luotettavuus.LIPPU_IKKUNA]
+        for i, lippu in enumerate(liput):
+            self.assertEqual(bin(lippu).count('1'), 1)
+            for toinen in liput[i+1:]:
+                self.assertFalse(lippu & toinen)
+            paketti = self.krs.valm_paketti(1, b'', lippu)
+            self.assertEqual(self.krs.lue_otsake(paketti)[1], lippu)
+
+
+    def test_suuret_sekvenssinumerot(self):
+        # Sekvenssinumero ei mahdu yhteen tavuun, mutta mahtuu otsakkeen
+        # 32-bittiseen kenttään.
+        for sekvno in (255, 256, 2**16 + 1, luotettavuus.MAKSIMI - 1):
+            paketti = self.krs.valm_paketti(sekvno, b'x')
+            self.assertTrue(self.krs.tarkasta(paketti))
+            purettu, data = self.krs.pura(paketti)
+            self.assertEqual((purettu, bytes(data)), (sekvno, b'x'))
+        with self.assertRaises(struct.error):
+            self.krs.valm_paketti(luotettavuus.MAKSIMI, b'x')
+
+
+    def test_sekvenssinumerot_kiertavat(self):
+        paketit = self.krs.valm_paketit(luotettavuus.MAKSIMI - 1,
+                                        [b'a', b'b'])
+        self.assertEqual([self.krs.pura(p)[0] for p in paketit],
+                         [luotettavuus.MAKSIMI - 1, 0])
+
+
+    def test_lyhyet_hylataan(self):
+        paketti = bytes(self.krs.valm_paketti(3, b'kokonainen'))
+        lyhyet = [b'', paketti[:luotettavuus.OTSAKE.size - 1],
+                  paketti[:luotettavuus.OTSAKE.size],
+                  paketti[:-1], paketti + b'\x00']
+        for lyhyt in lyhyet:
+            with self.subTest(pituus=len(lyhyt)):
+                self.assertIsNone(self.krs.tarkasta_otsake(lyhyt))
+                self.assertFalse(self.krs.tarkasta(lyhyt))
+
+
+    def test_tuntematon_algoritmi_hylataan(self):
+        paketti = self.krs.valm_paketti(3, b'data')
+        paketti[2] = 255
+        self.assertFalse(self.krs.tarkasta(paketti))
+        # Tarkistamatonta algoritmia ei hyväksytä, ellei sitä ole
+        # valittu itse.
+        paketti = self.krs.valm_paketti(3, b'data')
+        paketti[2] = tarkistussumma.EiTarkistusta.tunnus
+        self.assertFalse(self.krs.tarkasta(paketti[:-1]))
+
+
+class PilkontaTesti(unittest.TestCase):
+    '''Pitkän viestin jakaminen pakettien kokoisiin osiin.'''
+
+    def setUp(self):
+        self.krs = luotettavuus.Luottokerros(None, 64)
+        self.krs.max = 16
+        self.koko = self.krs.kuorman_koko()
+
+
+    def test_kuorman_koko(self):
+        self.assertEqual(self.koko, 64 - luotettavuus.OTSAKE.size -
+                         self.krs.tarkistus.pituus)
+        # Täysi osa mahtuu pakettina puskuriin.
+        paketti = self.krs.valm_paketti(1, self.koko * b'x')
+        self.assertEqual(len(paketti), 64)
+
+
+    def test_pilko(self):
+        data = bytes(range(256)) * 3
+        osat = self.krs.pilko(data)
+        self.assertEqual(len(osat), -(-len(data) // self.koko))
+        for osa in osat[:-1]:
+            self.assertEqual(len(osa), self.koko)
+        self.assertEqual(b''.join(osat), data)
+
+
+    def test_pilko_rajatapaukset(self):
+        self.assertEqual([bytes(osa) for osa in self.krs.pilko(b'')], [b''])
+        self.assertEqual(len(self.krs.pilko(self.koko * b'x')), 1)
+        self.assertEqual(len(self.krs.pilko((self.koko + 1) * b'x')), 2)
+
+
+class KokoamisTesti(unittest.TestCase):
+    '''Pienten viestien kokoaminen samaan pakettiin tietueina.'''
+
+    def setUp(self):
+        self.krs = luotettavuus.Luottokerros(None, 64)
+        self.krs.max = 16
+
+
+    def kokoa(self, viestit):
+        return b''.join(luotettavuus.TIETUE.pack(len(viesti)) + viesti
+                        for viesti in viestit)
+
+
+    def test_pura_kootut(self):
+        viestit = [b'eka', b'', b'kolmas', bytes(range(20))]
+        data = bytearray(self.kokoa(viestit))
+        purettu = self.krs.pura_kootut(data)
+        self.assertEqual([bytes(viesti) for viesti in purettu], viestit)
+        # Viestit ovat kopiossa, joten alkuperäisen datan voi käyttää
+        # uudelleen.
+        data[:] = bytes(len(data))
+        self.assertEqual([bytes(viesti) for viesti in purettu], viestit)
+
+
+    def test_pura_kootut_tyhja(self):
+        self.assertEqual(self.krs.pura_kootut(b''), [])
+
+
+    def test_pura_kootut_katkennut(self):
+        # Kesken loppuva tietue katkeaa datan loppuun, ja tietueen
+        # pituuskenttää lyhyempi loppu ohitetaan.
+        data = self.kokoa([b'eka', b'toka'])
+        self.assertEqual([bytes(v) for v in self.krs.pura_kootut(data[:-2])],
+                         [b'eka', b'to'])
+        self.assertEqual([bytes(v) for v in self.krs.pura_kootut(data[:6])],
+                         [b'eka'])
+
+
+class EraTesti(unittest.TestCase):
+    '''Pakettien valmistelu ja tarkastus erissä.'''
+
+    def setUp(self):
+        self.krs = luotettavuus.Luottokerros(None, 64)
+        self.krs.max = 16
+        self.viestit = [b'', b'a', 'merkkijono', bytes(range(40))]
+
+
+    def test_valm_paketit_sama_kuin_yksitellen(self):
+        for nimi in tarkistussumma.TARKISTUKSET:
+            krs = luotettavuus.Luottokerros(None, 64, nimi)
+            krs.max = 16
+            with self.subTest(nimi=nimi):
+                # Sekvenssinumerot kiertävät ympäri: 14, 15, 0, 1.
+                paketit = krs.valm_paketit(14, self.viestit,
+                                           luotettavuus.LIPPU_JATKUU)
+                odotetut = [krs.valm_paketti((14 + i) % 16, viesti,
+                                             luotettavuus.LIPPU_JATKUU)
+                            for i, viesti in enumerate(self.viestit)]
+                self.assertEqual([bytes(p) for p in paketit],
+                                 [bytes(p) for p in odotetut])
+
+
+    def test_kirjoita_paketit_paikkoihin(self):
+        paikat = [bytearray(64) for _ in range(3)]
+        liput = [luotettavuus.LIPPU_JATKUU, luotettavuus.LIPPU_JATKUU, 0]
+        paketit = self.krs.kirjoita_paketit(paikat, [15, 0, 1],
+                                            [b'x', b'yy', 'zzz'], liput)
+        for paketti, paikka, sekvno, data, lippu in zip(
+                paketit, paikat, [15, 0, 1], [b'x', b'yy', b'zzz'], liput):
+            # Paketti on näkymä annettuun puskuriin eikä kopio.
+            self.assertIs(paketti.obj, paikka)
+            self.assertTrue(self.krs.tarkasta(paketti))
+            self.assertEqual(self.krs.lue_otsake(paketti)[1], lippu)
+            purettu_sekvno, purettu = self.krs.pura(paketti)
+            self.assertEqual((purettu_sekvno, bytes(purettu)), (sekvno, data))
+
+
+    def test_kirjoita_paketit_liian_pitka(self):
+        with self.assertRaises(ValueError):
+            self.krs.kirjoita_paketit([bytearray(64), bytearray(16)],
+                                      [1, 2], [b'a', 16*b'b'], [0, 0])
+
+
+    def test_tarkasta_monta(self):
+        crc32 = luotettavuus.Luottokerros(None, 64, 'crc32')
+        virheellinen = self.krs.valm_paketti(3, b'bittivirhe')
+        virheellinen[luotettavuus.OTSAKE.size] ^= 0b1000
+        vaara_versio = self.krs.valm_paketti(4, b'versio')
+        vaara_versio[0] = luotettavuus.VERSIO + 1
+        paketit = [self.krs.valm_paketti(1, b'crc8'),
+                   crc32.valm_paketti(2, b'crc32'),
+                   virheellinen,
+                   vaara_versio,
+                   self.krs.valm_paketti(5, b'katkaistu')[:-3],
+                   b'\x01']
+        odotetut = [True, True, False, False, False, False]
+        self.assertEqual(self.krs.tarkasta_monta(paketit), odotetut)
+        self.assertEqual([self.krs.tarkasta(p) for p in paketit], odotetut)
+        self.assertEqual(self.krs.tarkasta_monta([]), [])
+
+
+    def test_crc8_monta(self):
+        satunnainen = random.Random(2)
+        datat = [bytes(satunnainen.getrandbits(8)
+                       for _ in range(satunnainen.randrange(50)))
+                 for _ in range(20)]
+        self.assertEqual(tarkistussumma.crc8_monta(datat),
+                         [tarkistussumma.crc8(data) for data in datat])
+
+
+    @unittest.skipIf(tarkistussumma.np is None, 'NumPyä ei ole asennettu.')
+    def test_crc8_monta_numpy(self):
+        # Erän on oltava riittävän suuri, jotta NumPyä käytetään.
+        satunnainen = random.Random(3)
+        datat = [bytes(satunnainen.getrandbits(8)
+                       for _ in range(satunnainen.randrange(50)))
+                 for _ in range(tarkistussumma.NUMPY_RAJA + 1)]
+        self.assertEqual(tarkistussumma.crc8_monta(datat),
+                         [tarkistussumma.crc8(data) for data in datat])
+
+
+if __name__ == '__main__':
+    unittest.main()
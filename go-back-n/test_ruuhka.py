@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import ruuhka
+import unittest
+
+
+class RekisteriTesti(unittest.TestCase):
+    '''Algoritmien haku nimen perusteella.'''
+
+    def test_hae(self):
+        for nimi, luokka in ruuhka.RUUHKANHALLINNAT.items():
+            olio = ruuhka.hae(nimi, 8)
+            self.assertIs(type(olio), luokka)
+            self.assertEqual(olio.ylaraja, 8)
+
+
+    def test_tuntematon(self):
+        with self.assertRaises(ValueError):
+            ruuhka.hae('cubic', 8)
+
+
+    def test_keskenerainen_algoritmi(self):
+        # Aliluokasta, jolta puuttuu abstrakti metodi, ei voi luoda oliota.
+        class Puutteellinen(ruuhka.Ruuhkanhallinta):
+            nimi = 'puutteellinen'
+
+            def kuitattu(self, maara):
+                pass
+        with self.assertRaises(TypeError):
+            Puutteellinen(8)
+
+
+class VakioTesti(unittest.TestCase):
+
+    def test_ikkuna_ei_muutu(self):
+        vakio = ruuhka.Vakio(8)
+        self.assertEqual(vakio.ikkuna, 8)
+        vakio.kuitattu(5)
+        vakio.menetys(8, 100)
+        vakio.aikakatkaisu(8, 100)
+        self.assertEqual(vakio.ikkuna, 8)
+
+
+class AimdTesti(unittest.TestCase):
+
+    def setUp(self):
+        self.aimd = ruuhka.Aimd(64)
+
+
+    def test_hidas_aloitus(self):
+        # Ikkuna kasvaa yhdellä jokaista kuitattua pakettia kohti eli
+        # kaksinkertaistuu kierroksittain.
+        self.assertEqual(self.aimd.ikkuna, 1)
+        for odotettu in (2, 4, 8, 16):
+            self.aimd.kuitattu(self.aimd.ikkuna)
+            self.assertEqual(self.aimd.ikkuna, odotettu)
+
+
+    def test_ylaraja(self):
+        self.aimd.kuitattu(1000)
+        self.assertEqual(self.aimd.ikkuna, 64)
+
+
+    def test_ruuhkan_valttely(self):
+        # Kynnyksen jälkeen ikkuna kasvaa noin yhdellä kierrosta kohti.
+        self.aimd.kynnys = 8
+        self.aimd.cwnd = 8.0
+        self.aimd.kuitattu(8)
+        self.assertEqual(self.aimd.ikkuna, 8)
+        self.assertAlmostEqual(self.aimd.cwnd, 9, delta=0.1)
+        self.aimd.kuitattu(9)
+        self.assertEqual(self.aimd.ikkuna, 9)
+
+
+    def test_menetys_puolittaa(self):
+        self.aimd.cwnd = 20.0
+        self.aimd.menetys(20, 100)
+        self.assertEqual(self.aimd.kynnys, 10)
+        self.assertEqual(self.aimd.ikkuna, 10)
+        # Kynnys on vähintään 2.
+        self.aimd.menetys(1, 101)
+        self.assertEqual(self.aimd.kynnys, 2)
+        self.assertEqual(self.aimd.ikkuna, 2)
+
+
+    def test_aikakatkaisu_aloittaa_alusta(self):
+        self.aimd.cwnd = 20.0
+        self.aimd.aikakatkaisu(20, 100)
+        self.assertEqual(self.aimd.kynnys, 10)
+        self.assertEqual(self.aimd.ikkuna, 1)
+        # Hidas aloitus jatkuu kynnykseen asti.
+        self.aimd.kuitattu(9)
+        self.assertEqual(self.aimd.ikkuna, 10)
+        self.aimd.kuitattu(1)
+        self.assertEqual(self.aimd.ikkuna, 10)
+
+
+class NewRenoTesti(unittest.TestCase):
+
+    def setUp(self):
+        self.reno = ruuhka.NewReno(64)
+        self.reno.cwnd = 20.0
+
+
+    def test_yksi_ruuhkatapahtuma(self):
+        # Saman ikkunallisen katoamiset pienentävät ikkunaa vain kerran.
+        self.reno.menetys(20, 100)
+        self.assertEqual(self.reno.ikkuna, 10)
+        self.reno.kuitattu(50)
+        self.reno.menetys(10, 110)
+        self.assertEqual(self.reno.ikkuna, 10)
+        # Kun palautuspisteeseen asti on kuitattu, uusi katoaminen on
+        # uusi ruuhkatapahtuma.
+        self.reno.kuitattu(50)
+        self.assertFalse(self.reno.palautumassa())
+        self.reno.menetys(10, 120)
+        self.assertEqual(self.reno.ikkuna, 5)
+
+
+    def test_nopea_palautus_ei_kasvata(self):
+        self.reno.menetys(20, 100)
+        self.reno.kuitattu(99)
+        self.assertEqual(self.reno.cwnd, 10)
+        # Palautuspisteen jälkeen ikkuna kasvaa taas.
+        self.reno.kuitattu(1)
+        self.reno.kuitattu(1)
+        self.assertGreater(self.reno.cwnd, 10)
+
+
+    def test_aikakatkaisu(self):
+        # Aikakatkaisu pienentää ikkunan myös palautumisen aikana, ja
+        # sen jälkeen jatketaan heti hitaalla aloituksella.
+        self.reno.menetys(20, 100)
+        self.reno.aikakatkaisu(10, 105)
+        self.assertEqual(self.reno.ikkuna, 1)
+        self.assertEqual(self.reno.kynnys, 5)
+        self.reno.kuitattu(1)
+        self.assertEqual(self.reno.ikkuna, 2)
+        # Saman ikkunallisen katoaminen ei enää pienennä ikkunaa.
+        self.reno.menetys(2, 106)
+        self.assertEqual(self.reno.ikkuna, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import luotettavuus
+import luotettavuus_vastott
+import socket as s
+import time
+import unittest
+import unittest.mock
+
+
+class VastaanottajaTesti(unittest.TestCase):
+    '''Vastaanottajan testit. Lähettäjänä on pelkkä soketti, jolla
+    valmistellut paketit lähetetään.'''
+
+    def setUp(self):
+        self.tuloste = contextlib.redirect_stdout(io.StringIO())
+        self.tuloste.__enter__()
+        soketti = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        soketti.bind(('127.0.0.1', 0))
+        soketti.settimeout(5)
+        self.vastott = luotettavuus_vastott.Luottovastaanottaja(soketti, 64)
+        self.lahettaja = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        self.lahettaja.bind(('127.0.0.1', 0))
+        self.lahettaja.settimeout(5)
+        self.krs = luotettavuus.Luottokerros(None, 64)
+        self.krs.max = self.vastott.max
+
+
+    def tearDown(self):
+        self.vastott.soketti.close()
+        self.lahettaja.close()
+        self.tuloste.__exit__(None, None, None)
+
+
+    def laheta(self, *paketit):
+        for paketti in paketit:
+            self.lahettaja.sendto(paketti, self.vastott.soketti.getsockname())
+
+
+    def ota_vastaan(self):
+        '''Palauttaa seuraavan viestin tavujonona tai None.'''
+        viesti = self.vastott.ota_vastaan_bytes()
+        if viesti is None:
+            return None
+        tulos = bytes(viesti)
+        self.vastott.vapauta(viesti)
+        return tulos
+
+
+    def test_era_tarkastetaan_kerralla(self):
+        # Saman erän paketit tarkastetaan tarkasta_monta()-metodilla eikä
+        # yksitellen.
+        virheellinen = self.krs.valm_paketti(2, b'toka')
+        virheellinen[-1] ^= 1
+        self.laheta(self.krs.valm_paketti(1, b'eka'), virheellinen,
+                    self.krs.valm_paketti(2, b'toka'))
+        with unittest.mock.patch.object(self.vastott, 'tarkasta') as tarkasta:
+            self.assertEqual(self.ota_vastaan(), b'eka')
+            self.assertIsNone(self.ota_vastaan())
+            self.assertEqual(self.ota_vastaan(), b'toka')
+        tarkasta.assert_not_called()
+
+
+    def test_osat_kootaan(self):
+        # Osat palautetaan yhtenä viestinä vasta, kun viimeinen osa on
+        # saapunut. Väärässä järjestyksessä saapunut osa hylätään.
+        jatkuu = luotettavuus.LIPPU_JATKUU
+        self.laheta(self.krs.valm_paketti(1, b'AAA', jatkuu))
+        self.assertIsNone(self.ota_vastaan())
+        self.laheta(self.krs.valm_paketti(3, b'CCC'))
+        self.assertIsNone(self.ota_vastaan())
+        self.laheta(self.krs.valm_paketti(2, b'BBB', jatkuu))
+        self.assertIsNone(self.ota_vastaan())
+        self.laheta(self.krs.valm_paketti(3, b'CCC'))
+        self.assertEqual(self.ota_vastaan(), b'AAABBBCCC')
+        # Seuraava yhden paketin viesti ei sisällä edellisen osia.
+        self.laheta(self.krs.valm_paketti(4, b'DDD'))
+        self.assertEqual(self.ota_vastaan(), b'DDD')
+
+
+    def test_kootut_erikseen(self):
+        # Kootun paketin viestit palautetaan yksi kerrallaan.
+        kootut = b''.join(luotettavuus.TIETUE.pack(len(viesti)) + viesti
+                          for viesti in (b'eka', b'', b'kolmas'))
+        self.laheta(self.krs.valm_paketti(1, kootut,
+                                          luotettavuus.LIPPU_KOOTTU),
+                    self.krs.valm_paketti(2, b'erillinen'))
+        for odotettu in (b'eka', b'', b'kolmas', b'erillinen'):
+            self.assertEqual(self.ota_vastaan(), odotettu)
+
+
+    def lue_kuittaus(self):
+        '''Palauttaa lähettäjän sokettiin tulleen kuittauksen
+        sekvenssinumeron ja ikkunan.'''
+        kuittaus = memoryview(self.lahettaja.recv(64))
+        self.assertTrue(self.krs.tarkasta(kuittaus))
+        self.assertEqual(self.krs.lue_otsake(kuittaus)[1],
+                         luotettavuus.LIPPU_ACK | luotettavuus.LIPPU_IKKUNA)
+        sekvno, data = self.krs.pura(kuittaus)
+        return sekvno, luotettavuus.IKKUNA.unpack_from(data)[0]
+
+
+    def ei_kuittausta(self):
+        aikaraja = self.lahettaja.gettimeout()
+        self.lahettaja.settimeout(0.05)
+        try:
+            with self.assertRaises(s.timeout):
+                self.lahettaja.recv(64)
+        finally:
+            self.lahettaja.settimeout(aikaraja)
+
+
+    def test_viivastettu_kuittaus_kuittausvali(self):
+        # Joka toinen järjestyksessä saapunut paketti kuitataan heti.
+        self.vastott.kuittausvali = 2
+        self.vastott.kuittausviive = 60
+        self.laheta(self.krs.valm_paketti(1, b'eka'))
+        self.ota_vastaan()
+        self.ei_kuittausta()
+        self.laheta(self.krs.valm_paketti(2, b'toka'))
+        self.ota_vastaan()
+        self.assertEqual(self.lue_kuittaus()[0], 2)
+        self.assertIsNone(self.vastott.kuittaushetki)
+
+
+    def test_viivastettu_kuittaus_kuittausviive(self):
+        # Yksittäinen paketti kuitataan kuittausviiveen kuluttua, vaikka
+        # uutta pakettia ei tule.
+        self.vastott.kuittausvali = 2
+        self.vastott.kuittausviive = 0.05
+        self.laheta(self.krs.valm_paketti(1, b'eka'))
+        self.ota_vastaan()
+        self.ei_kuittausta()
+        self.vastott.soketti.settimeout(0.2)
+        alku = time.monotonic()
+        with self.assertRaises(s.timeout):
+            self.ota_vastaan()
+        self.assertEqual(self.lue_kuittaus()[0], 1)
+        self.assertLess(time.monotonic() - alku, 5)
+        # Lukemisen aikaraja palautetaan ennalleen.
+        self.assertEqual(self.vastott.soketti.gettimeout(), 0.2)
+
+
+    def test_vaara_jarjestys_kuitataan_heti(self):
+        # Väärässä järjestyksessä saapunut paketti kuitataan heti, ja
+        # kuittaus kattaa myös viivästetyn kuittauksen.
+        self.vastott.kuittausvali = 2
+        self.vastott.kuittausviive = 60
+        self.laheta(self.krs.valm_paketti(1, b'eka'))
+        self.ota_vastaan()
+        self.ei_kuittausta()
+        self.laheta(self.krs.valm_paketti(3, b'kolmas'))
+        self.assertFalse(self.ota_vastaan())
+        self.assertEqual(self.lue_kuittaus()[0], 1)
+        self.assertIsNone(self.vastott.kuittaushetki)
+
+
+    def test_ikkuna_avautuu(self):
+        # Kun sovelluksen jono on täynnä, ilmoitetaan nollaikkuna. Kun
+        # sovellus vapauttaa viestin, ikkunan avautumisesta kuitataan
+        # heti.
+        self.vastott.jonon_koko = 1
+        self.laheta(self.krs.valm_paketti(1, b'eka'))
+        viesti = self.vastott.ota_vastaan_bytes()
+        self.assertEqual(self.lue_kuittaus()[1], 0)
+        self.vastott.vapauta(viesti)
+        self.assertEqual(self.lue_kuittaus()[:2], (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import luotettavuus_palvelin as palv
 import luotettavuus_vastott as luotto
 import socket as s
 import virtsoketti as v
@@ -37,9 +38,15 @@ def main():
         soketti.close()
         lopeta()
 
-    # Luodaan luotettavuuskerros-olio.
-    puskurin_koko = 256  # Sama kuin ohjevideossa.
-    luottokrs = luotto.Luottovastaanottaja(soketti, puskurin_koko)
+    # Luodaan luotettavuuskerros-olio. Palvelintilassa jokaisella
+    # lähettäjällä on oma yhteytensä, joten samaan porttiin voi lähettää
+    # usea lähettäjä yhtä aikaa.
+    puskurin_koko = 1472  # Oltava sama kuin lähettäjällä.
+    palvelintila = True
+    if palvelintila:
+        luottokrs = palv.Luottopalvelin(soketti, puskurin_koko)
+    else:
+        luottokrs = luotto.Luottovastaanottaja(soketti, puskurin_koko)
     
     print('Palvelin valmiina portissa {}.'.format(portti))
     print('Paina Ctrl-C lopettaaksesi.\n')
@@ -50,7 +57,12 @@ def main():
             # Kysytään lähettäjältä tullutta viestiä ja tulostetaan
             # se, jos se ei ole None.
             saapunut = luottokrs.ota_vastaan()
-            if saapunut:
+            if saapunut and palvelintila:
+                lahettaja, viestit = saapunut
+                for viesti in viestit:
+                    print('Saapunut viesti osoitteesta {}: "{}".\n'.\
+                          format(lahettaja, viesti))
+            elif saapunut:
                 print('Saapunut viesti: "{}".\n'.format(saapunut))
 
         except KeyboardInterrupt:  # Käyttäjä painoi Ctrl-C.
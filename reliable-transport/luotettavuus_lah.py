@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import luotettavuus
+import rtt
 import socket as s
+import time
 
 
 class Luottolahettaja(luotettavuus.Luottokerros):
@@ -12,7 +14,7 @@ class Luottolahettaja(luotettavuus.Luottokerros):
 
     Toiminta vastaa Kurosen & Rossin protokollaa rdt3.0.
 
-    Bittivirheiden tarkastamisessa käytetään CRC 8 -algoritmia.
+    Bittivirheiden tarkastamisessa käytetään oletuksena CRC 8 -algoritmia.
     Polynomina on x**8 + x**3 + x**2 + x + 1, 
     bittimuodossa 100000111.
     '''
@@ -23,11 +25,16 @@ class Luottolahettaja(luotettavuus.Luottokerros):
     #   'wait_call1'  # Odotetaan lähetettävää viestiä nro 1.
     #   'wait_ack1'   # Odotetaan paketin nro 1 kuittausta.
     
-    def __init__(self, soketti, puskurin_koko):
-        super().__init__(soketti, puskurin_koko)
+    def __init__(self, soketti, puskurin_koko, tarkistus='crc8'):
+        super().__init__(soketti, puskurin_koko, tarkistus)
         self.tila = None
-        self.odotusaika = 0.6  # Aika, joka kertoo, kuinka kauan kuittausta
-                               # odotetaan.
+        # Aika, joka kertoo, kuinka kauan kuittausta odotetaan, lasketaan
+        # mitatusta kiertoviiveestä. Nykyiset arvot näkyvät attribuuteista
+        # self.rtt.srtt ja self.rtt.rto.
+        self.rtt = rtt.Rttarvio()
+        self.lahetysaika = None  # Viimeisimmän paketin lähetyshetki. None,
+                                 # jos paketti on lähetetty uudelleen
+                                 # (Karnin sääntö).
 
 
     def aseta_alkutila(self):
@@ -66,6 +73,7 @@ class Luottolahettaja(luotettavuus.Luottokerros):
     def wait_call(self, sekvno, mjono, vastott):
         '''wait_call-tilojen toteutus.'''
         self.laheta_mjono(sekvno, mjono, vastott)
+        self.lahetysaika = time.monotonic()
         self.tila = 'wait_ack{}'.format(sekvno)
         return
 
@@ -75,15 +83,19 @@ class Luottolahettaja(luotettavuus.Luottokerros):
         tuli virheetön ja oikealla sekvenssinumerolla varustettu kuittaus, 
         muuten False. Jos tapahtuu ajastimen aikakatkaisu, palautetaan 
         False. '''
-        self.soketti.settimeout(self.odotusaika)
+        self.soketti.settimeout(self.rtt.rto)
 
         # Yritetään lukea soketin sisältö.
         kuittaus_ok = False
         try:
             while not kuittaus_ok:
                 kuittaus_ok = self.lue_kuittaus(sekvno)
-            # Jos silmukka päättyy, vaihdetaan tilaa ja palautetaan
-            # True.
+            # Jos silmukka päättyy, päivitetään kiertoviiveen arvio,
+            # vaihdetaan tilaa ja palautetaan True.
+            if self.lahetysaika is not None:
+                self.rtt.mittaus(time.monotonic() - self.lahetysaika)
+            else:
+                self.rtt.kuitattu()
             toinen_nro = (sekvno + 1) % 2  # Toinen sekvenssinumero.
             self.tila = 'wait_call{}'.format(toinen_nro)
             self.soketti.settimeout(None)
@@ -91,8 +103,11 @@ class Luottolahettaja(luotettavuus.Luottokerros):
         except s.timeout:
             # Lähetetään uudelleen, pysytään samassa tilassa ja
             # palautetaan False.
-            print('Ajastimen aikakatkaisu. Lähetetään uudestaan.\n')
+            self.rtt.aikakatkaisu()
+            print('Ajastimen aikakatkaisu. Lähetetään uudestaan. ' +\
+                  'Ajastimen aika on nyt {:.3f} s.\n'.format(self.rtt.rto))
             self.laheta_mjono(sekvno, mjono, vastott)
+            self.lahetysaika = None
             self.soketti.settimeout(None)
             return False
 
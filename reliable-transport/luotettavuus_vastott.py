@@ -11,7 +11,7 @@ class Luottovastaanottaja(luotettavuus.Luottokerros):
 
     Toiminta vastaa Kurosen & Rossin protokollaa rdt3.0.
 
-    Bittivirheiden tarkastamisessa käytetään CRC 8 -algoritmia.
+    Bittivirheiden tarkastamisessa käytetään oletuksena CRC 8 -algoritmia.
     Polynomina on x**8 + x**3 + x**2 + x + 1, 
     bittimuodossa 100000111.
     '''
@@ -20,8 +20,8 @@ class Luottovastaanottaja(luotettavuus.Luottokerros):
     #   'wait_0'   # Odotetaan pakettia 0.
     #   'wait_1'   # Odotetaan pakettia 1.
 
-    def __init__(self, soketti, puskurin_koko):
-        super().__init__(soketti, puskurin_koko)
+    def __init__(self, soketti, puskurin_koko, tarkistus='crc8'):
+        super().__init__(soketti, puskurin_koko, tarkistus)
         self.tila = None
 
 
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+
+class Rttarvio:
+    '''Kiertoviiveen (RTT) arvio ja sen perusteella laskettava
+    uudelleenlähetysajastimen aika (RTO).
+
+    Laskenta noudattaa RFC 6298:aa. Ensimmäisestä mittauksesta R
+    asetetaan SRTT = R ja RTTVAR = R/2. Jokaisen seuraavan mittauksen
+    jälkeen
+        RTTVAR = (1 - BETA) * RTTVAR + BETA * |SRTT - R|
+        SRTT = (1 - ALFA) * SRTT + ALFA * R,
+    ja kummassakin tapauksessa RTO = SRTT + max(G, K * RTTVAR), missä G on
+    kellon tarkkuus. RTO rajataan välille [minimi, maksimi].
+
+    Aikakatkaisun jälkeen RTO kaksinkertaistetaan (exponential backoff).
+    Karnin säännön mukaisesti uudelleen lähetetyistä paketeista ei mitata
+    kiertoviivettä. Siitä huolehtii mittauksia tekevä lähettäjä. Kun
+    uudelleen lähetetty paketti kuitataan, kaksinkertaistukset perutaan
+    (metodi kuitattu()) kuten esim. Linuxissa. Muuten RTO voisi jäädä
+    pitkäksi aikaa suureksi, jos kaikki kuittaukset koskevat uudelleen
+    lähetettyjä paketteja.
+    '''
+    ALFA = 1/8
+    BETA = 1/4
+    K = 4
+
+    def __init__(self, alku=1.0, minimi=0.2, maksimi=60.0, tarkkuus=0.001):
+        self.srtt = None  # Tasoitettu kiertoviive sekunteina.
+        self.rttvar = None  # Kiertoviiveen vaihtelu sekunteina.
+        self.rto = alku  # Ajastimen aika sekunteina.
+        self.minimi = minimi
+        self.maksimi = maksimi
+        self.tarkkuus = tarkkuus
+
+
+    def mittaus(self, rtt):
+        '''Päivittää arvion uudella kiertoviiveen mittauksella (s).'''
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar +\
+                          self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALFA) * self.srtt + self.ALFA * rtt
+        self.rto = self.rajaa(self.srtt + max(self.tarkkuus,
+                                              self.K * self.rttvar))
+
+
+    def kuitattu(self):
+        '''Palauttaa RTO:n kaksinkertaistuksia edeltävään arvoon, kun
+        uutta dataa kuitataan mutta mittausta ei saada.'''
+        if self.srtt is not None:
+            self.rto = self.rajaa(self.srtt + max(self.tarkkuus,
+                                                  self.K * self.rttvar))
+
+
+    def aikakatkaisu(self):
+        '''Kaksinkertaistaa RTO:n aikakatkaisun jälkeen.'''
+        self.rto = self.rajaa(2 * self.rto)
+
+
+    def rajaa(self, rto):
+        '''Palauttaa RTO:n rajattuna välille [minimi, maksimi].'''
+        return min(self.maksimi, max(self.minimi, rto))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import contextlib
+import eraio
+import luotettavuus_lah
+import luotettavuus_vastott
+import multiprocessing as mp
+import os
+import socket as s
+import time
+
+AIKARAJA = 60  # Yhden mittauksen enimmäiskesto sekunteina.
+
+
+def vastaanottaja(osoite, puskurin_koko, gro, viesteja, valmis):
+    '''Vastaanottajaprosessi: ottaa vastaan viesteja viestiä ja asettaa
+    sitten tapahtuman valmis.'''
+    soketti = s.socket(s.AF_INET, s.SOCK_DGRAM)
+    soketti.bind(osoite)
+    luottokrs = luotettavuus_vastott.Luottovastaanottaja(
+        soketti, puskurin_koko, 'crc32', ikkuna=64, maksimi=1024,
+        jonon_koko=128)
+    if gro:
+        luottokrs.kayta_gro()
+    saapuneet = 0
+    while saapuneet < viesteja:
+        for viesti in luottokrs.ota_vastaan_bytes() or ():
+            luottokrs.vapauta(viesti)
+            saapuneet += 1
+    valmis.set()
+    # Prosessi lopetetaan, kun mittaus on valmis.
+    time.sleep(3600)
+
+
+def mittaa(gso, gro, viesteja, koko, puskurin_koko):
+    '''Palauttaa lähetettyjen datapakettien määrän sekunnissa ja
+    hyötydatan siirtonopeuden (Mt/s).'''
+    with contextlib.closing(s.socket(s.AF_INET, s.SOCK_DGRAM)) as vapaa:
+        vapaa.bind(('127.0.0.1', 0))
+        osoite = vapaa.getsockname()
+    valmis = mp.Event()
+    soketti = s.socket(s.AF_INET, s.SOCK_DGRAM)
+    # Prosessien tulosteet ohjataan pois. Lapsiprosessi perii korvatun
+    # sys.stdout-olion (fork).
+    with open(os.devnull, 'w') as tyhja, contextlib.redirect_stdout(tyhja):
+        prosessi = mp.Process(target=vastaanottaja, daemon=True,
+                              args=(osoite, puskurin_koko, gro, viesteja,
+                                    valmis))
+        prosessi.start()
+        time.sleep(0.2)  # Odotetaan, että vastaanottaja on valmiina.
+        luottokrs = luotettavuus_lah.Luottolahettaja(
+            soketti, puskurin_koko, osoite, 'crc32', ikkuna=64,
+            maksimi=1024)
+        luottokrs.gso = gso
+        luottokrs.aloita()
+        try:
+            viesti = bytes(koko)
+            paketteja = viesteja * len(luottokrs.pilko(viesti))
+            alku = time.perf_counter()
+            for _ in range(viesteja):
+                luottokrs.send(viesti)
+            # Jos vastaanottaja kaatuu, mittaus ei jää odottamaan.
+            if not valmis.wait(AIKARAJA):
+                raise TimeoutError('Vastaanottaja ei saanut kaikkia '
+                                   'viestejä ajoissa.')
+            kesto = time.perf_counter() - alku
+        finally:
+            luottokrs.lopeta()
+            prosessi.terminate()
+            prosessi.join()
+            soketti.close()
+    return paketteja / kesto, viesteja * koko / kesto / 1e6
+
+
+def main():
+    '''Pääohjelma. Vertailee suurten viestien siirtoa silmukkaosoitteessa
+    ilman segmentoinnin siirtoa, pelkällä GSO:lla ja GSO:lla ja GRO:lla.
+    Pakettien määrä sekunnissa kertoo, paljonko järjestelmäkutsujen
+    säästäminen nopeuttaa siirtoa. Tarkistussummana on CRC-32 (zlib),
+    jottei Python-toteutuksen laskenta peitä eroja.'''
+    viesteja = 200
+    koko = 60000  # Viestin koko tavuina.
+    puskurin_koko = 1472
+
+    with contextlib.closing(s.socket(s.AF_INET, s.SOCK_DGRAM)) as koe:
+        if not eraio.tukee_gso(koe):
+            print('(Käyttöjärjestelmä ei tue GSO:ta, joten kaikki '
+                  'paketit lähetetään erikseen.)')
+    print('{} viestiä x {} tavua, paketin koko {} tavua.\n'.format(
+        viesteja, koko, puskurin_koko))
+    print('{:>10}{:>14}{:>10}'.format('tila', 'paketit/s', 'Mt/s'))
+    for nimi, gso, gro in [('ei', False, False), ('GSO', True, False),
+                           ('GSO+GRO', True, True)]:
+        pps, nopeus = mittaa(gso, gro, viesteja, koko, puskurin_koko)
+        print('{:>10}{:>14.0f}{:>10.2f}'.format(nimi, pps, nopeus))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+
+class Lahetys:
+    '''Lähetysikkunan yhden paikan tiedot. Paikalla on oma valmiiksi
+    varattu puskuri, johon paketti kirjoitetaan. __slots__ pitää oliot
+    pieninä, ja attribuuttien käsittely on nopeampaa kuin tavallisella
+    oliolla.'''
+    __slots__ = ('puskuri', 'sekvno', 'paketti', 'lahetetty', 'uudelleen',
+                 'kuitattu', 'ajastin')
+
+    def __init__(self, puskurin_koko):
+        self.puskuri = bytearray(puskurin_koko)
+        self.sekvno = None
+        self.paketti = None  # Lähetetty paketti: näkymä puskuriin.
+        self.lahetetty = None  # Lähetyshetki (time.monotonic()). Uudelleen
+                               # lähetetyn paketin kohdalla on None, koska
+                               # sen kuittauksesta ei tiedetä, kumpaan
+                               # lähetykseen se vastaa (Karnin sääntö).
+        self.uudelleen = 0  # Uudelleenlähetysten määrä.
+        self.kuitattu = False
+        self.ajastin = None  # Paketin oma ajastin (selective repeat).
+
+
+class Lahetysikkuna:
+    '''Kuittaamattomien pakettien rengaspuskuri.
+
+    Renkaassa on kapasiteetti paikkaa (Lahetys-olioita), joten muistia
+    kuluu lähetysikkunan eikä sekvenssinumeroiden määrän mukaan. Paketit
+    ovat renkaassa lähetysjärjestyksessä: ikkuna[0] on vanhin
+    kuittaamaton paketti ja ikkuna[i] paketti, jonka sekvenssinumero on
+    i suurempi (modulo maksimi). Paikat käytetään kiertäen, joten paikan
+    puskuri vapautuu uudelleenkäyttöön vasta, kun sen paketti on
+    poistettu ikkunasta.
+    '''
+
+    def __init__(self, kapasiteetti, maksimi, puskurin_koko):
+        self.paikat = [Lahetys(puskurin_koko) for _ in range(kapasiteetti)]
+        self.kapasiteetti = kapasiteetti
+        self.max = maksimi  # Sekvenssinumeroiden lukumäärä.
+        self.alku = 0  # Vanhimman paketin paikka.
+        self.vapaa = 0  # Seuraavaksi lisättävän paketin paikka.
+        self.maara = 0  # Ikkunassa olevien pakettien määrä.
+
+
+    def __len__(self):
+        return self.maara
+
+
+    def __getitem__(self, i):
+        '''Palauttaa paketin, jonka etäisyys vanhimmasta on i.'''
+        if not 0 <= i < self.maara:
+            raise IndexError('Paketti ei ole lähetysikkunassa.')
+        return self.paikat[(self.alku + i) % self.kapasiteetti]
+
+
+    def __iter__(self):
+        '''Käy läpi ikkunan paketit vanhimmasta uusimpaan.'''
+        paikat = self.paikat
+        kapasiteetti = self.kapasiteetti
+        for i in range(self.alku, self.alku + self.maara):
+            yield paikat[i % kapasiteetti]
+
+
+    def hae(self, sekvno):
+        '''Palauttaa sekvenssinumeroa vastaavan paketin tai None, jos se ei
+        ole ikkunassa.'''
+        if not self.maara:
+            return None
+        i = (sekvno - self.paikat[self.alku].sekvno) % self.max
+        if i >= self.maara:
+            return None
+        return self.paikat[(self.alku + i) % self.kapasiteetti]
+
+
+    def seuraava(self, i=0):
+        '''Palauttaa paikan, johon i+1. seuraavaksi lisättävä paketti
+        kirjoitetaan. Jos ikkunassa ei ole sille tilaa, nostaa
+        IndexError-poikkeuksen, jottei ikkunassa vielä olevaa pakettia
+        kirjoiteta yli.'''
+        if self.maara + i >= self.kapasiteetti:
+            raise IndexError('Lähetysikkuna on täynnä.')
+        return self.paikat[(self.vapaa + i) % self.kapasiteetti]
+
+
+    def lisaa(self, sekvno, paketti, lahetetty):
+        '''Lisää ikkunan loppuun paketin, joka on kirjoitettu metodin
+        seuraava() palauttaman paikan puskuriin. Palauttaa paikan.'''
+        lahetys = self.seuraava()
+        lahetys.sekvno = sekvno
+        lahetys.paketti = paketti
+        lahetys.lahetetty = lahetetty
+        lahetys.uudelleen = 0
+        lahetys.kuitattu = False
+        lahetys.ajastin = None
+        self.vapaa = (self.vapaa + 1) % self.kapasiteetti
+        self.maara += 1
+        return lahetys
+
+
+    def varaa(self, sekvno):
+        '''Lisää ikkunan loppuun paikan sekvenssinumerolle ja palauttaa
+        sen. Paketti kirjoitetaan paikan puskuriin vasta varauksen
+        jälkeen. Siihen asti attribuutti paketti on None, eikä paikkaa
+        lähetetä uudelleen.'''
+        return self.lisaa(sekvno, None, None)
+
+
+    def poista(self, maara):
+        '''Poistaa ikkunasta maara vanhinta pakettia.'''
+        for _ in range(min(maara, self.maara)):
+            lahetys = self.paikat[self.alku]
+            lahetys.paketti = None
+            lahetys.ajastin = None
+            self.alku = (self.alku + 1) % self.kapasiteetti
+            self.maara -= 1
@@ -1,6 +1,37 @@
 #!/usr/bin/env python3
 
+import eraio
 import math
+import struct
+import tarkistussumma
+
+
+# Paketin otsake: versio, liput, tarkistussumma-algoritmin tunnus,
+# sekvenssinumero (32 bittiä) ja datakentän pituus tavuina. Otsakkeen perään
+# tulee datakenttä ja sen perään tarkistussumma, joka lasketaan otsakkeesta
+# ja datakentästä.
+OTSAKE = struct.Struct('!BBBIH')
+VERSIO = 1
+MAKSIMI = 2**32  # Sekvenssinumeroiden suurin mahdollinen lukumäärä.
+
+# Liput.
+LIPPU_ACK = 0b00000001  # Paketti on kuittaus.
+LIPPU_JATKUU = 0b00000010  # Paketti on viestin osa, ja viesti jatkuu
+                           # seuraavassa paketissa.
+LIPPU_KOOTTU = 0b00000100  # Paketin datakentässä on useita viestejä
+                           # tietueina (ks. TIETUE).
+LIPPU_SACK = 0b00001000  # Valikoiva kuittaus: sekvenssinumeroon asti
+                         # kaikki on vastaanotettu, ja datakentän bittikartta
+                         # kertoo, mitkä sen jälkeiset on vastaanotettu.
+LIPPU_IKKUNA = 0b00010000  # Kuittauksen datakentän alussa on
+                           # vastaanottajan ilmoittama ikkuna (ks. IKKUNA).
+
+# Kootussa paketissa jokaista viestiä edeltää sen pituus tavuina.
+TIETUE = struct.Struct('!H')
+
+# Vastaanottajan ilmoittama ikkuna eli kuinka monta uutta pakettia
+# kumulatiivisesti kuitatun jälkeen vastaanottaja ottaa vastaan.
+IKKUNA = struct.Struct('!H')
 
 
 class Luottokerros:
@@ -9,79 +40,241 @@ class Luottokerros:
     Luottokerros mahdollistaa luotettavan tiedonsiirron toteuttamisen.
 
     Luottokerros sisältää sekä lähettämisessä että vastaanottamisessa
-    tarvittavia metodeita ja CRC 8 -algoritmin toteutuksen.
-    Polynomina on x**8 + x**3 + x**2 + x + 1, 
-    bittimuodossa 100000111.
+    tarvittavia metodeita. Tarkistussumma-algoritmi valitaan moduulista
+    tarkistussumma. Oletuksena on CRC 8, jonka polynomina on
+    x**8 + x**3 + x**2 + x + 1, bittimuodossa 100000111.
     '''
 
-    def __init__(self, soketti, puskurin_koko):
+    def __init__(self, soketti, puskurin_koko, tarkistus='crc8', ikkuna=4,
+                 maksimi=9):
         self.soketti = soketti
         self.puskurin_koko = puskurin_koko
-        self.rek = 0  # Siirtorekisterin sisältö.
+        # Tarkistussumma-algoritmi, oletuksena CRC 8. Vaihtoehdot
+        # löytyvät moduulista tarkistussumma.
+        self.tarkistus = tarkistussumma.hae(tarkistus)
+        # Vastaanotettaessa hyväksytään muutkin algoritmit kuin oma, jotta
+        # vastaanottaja voi käyttää samaa algoritmia kuin lähettäjä.
+        # Tarkistamatonta algoritmia ei kuitenkaan hyväksytä, ellei sitä
+        # ole itse valittu, koska bittivirhe tunnuksessa voisi muuten
+        # ohittaa tarkastuksen.
+        self.sallitut = set(tarkistussumma.TARKISTUKSET) - {'ei'}
+        self.sallitut.add(self.tarkistus.nimi)
+        # Lähetetäänkö ja luetaanko useita paketteja kerralla, kun se on
+        # mahdollista (moduuli eraio).
+        self.erasiirto = True
+        # Segmentoinnin siirto (GSO, ks. eraio.laheta_gso()): useat
+        # samankokoiset paketit lähetetään yhtenä puskurina. Tämä on
+        # tarkoitettu suurille siirroille, joten se otetaan käyttöön
+        # asettamalla arvoksi True.
+        self.gso = False
+        # Jos True, lähetys- tai vastaanottoikkuna tulostetaan jokaisen
+        # paketin ja kuittauksen kohdalla (ks. tulosta_ikkuna()). Tulostus
+        # hidastaa siirtoa, joten se on oletuksena pois päältä.
+        self.testaus = False
+
+        # Selective repeat toimii vain, jos ikkuna on enintään puolet
+        # sekvenssinumeroiden lukumäärästä.
+        if not (0 < ikkuna and 2*ikkuna <= maksimi <= MAKSIMI):
+            raise ValueError('Pitää olla 0 < 2*ikkuna <= maksimi <= {}.'.\
+                             format(MAKSIMI))
 
         # Luotettavan tiedonsiirron toteutukseen liittyviä:
         self.vanhin = 0  
-        self.ikkuna = 4  
-        self.max = 9  # Sekvenssinumeroiden lukumäärä. Suurin sekvenssinumero
-                      # on siis self.max - 1. Tässä voisi olla 256, mutta
-                      # käytetään pienempää numeroa harjoituksen vuoksi,
-                      # jotta nähdään, miten modulo-aritmetiikka toimii.
-                      # Jotta selective repeat toimii, on oltava
-                      # ikkuna <= max / 2.
-
-
-    #############################
-    # Muut kuin CRC 8 -metodit. #
-    #############################
+        self.ikkuna = ikkuna
+        self.max = maksimi  # Sekvenssinumeroiden lukumäärä. Suurin
+                            # sekvenssinumero on siis self.max - 1. Otsakkeen
+                            # 32-bittinen kenttä sallisi suurenkin arvon,
+                            # mutta oletuksena käytetään pientä numeroa
+                            # harjoituksen vuoksi, jotta nähdään, miten
+                            # modulo-aritmetiikka toimii.
+
+
+    ####################################
+    # Muut kuin tarkistussummametodit. #
+    ####################################
         
     def laheta(self, lahteva, vastott):
-        '''Tavujonomuotoisen datan lähetys.'''
-        self.soketti.sendto(lahteva, (vastott[0], vastott[1]))        
+        '''Tavujonomuotoisen datan lähetys. Jos soketti on estämätön ja sen
+        lähetyspuskuri on täynnä, paketti hylätään kuten ruuhkautuneessa
+        verkossa. Uudelleenlähetys korjaa tilanteen.'''
+        try:
+            self.soketti.sendto(lahteva, (vastott[0], vastott[1]))
+        except BlockingIOError:
+            print('(Lähetyspuskuri täynnä, paketti hylättiin.)')
+
+
+    def laheta_monta(self, paketit, vastott):
+        '''Lähettää useita paketteja samaan osoitteeseen. Eräsiirrolla
+        (moduuli eraio) kaikki lähetetään yhdellä järjestelmäkutsulla.
+        Muuten jokainen lähetetään metodilla laheta(). Paketit, jotka
+        eivät mahdu lähetyspuskuriin, hylätään kuten metodissa laheta().
+        Jos self.gso on True, samankokoiset paketit lähetetään GSO:lla.'''
+        if self.gso and eraio.tukee_gso(self.soketti):
+            try:
+                eraio.laheta_gso(self.soketti, paketit, vastott)
+                return
+            except BlockingIOError:
+                print('(Lähetyspuskuri täynnä, paketteja hylättiin.)')
+                return
+            # Esim. verkkokortti ei tue GSO:ta. Jatketaan ilman.
+            except OSError as virhe:
+                print('(GSO ei toimi: {}. Se poistetaan käytöstä.)'.\
+                      format(virhe))
+                self.gso = False
+        if not (self.erasiirto and eraio.tukee(self.soketti, 'sendto')):
+            for paketti in paketit:
+                self.laheta(paketti, vastott)
+            return
+        try:
+            lahetetty = eraio.laheta_monta(self.soketti, paketit, vastott)
+        except BlockingIOError:
+            lahetetty = 0
+        if lahetetty < len(paketit):
+            print('(Lähetyspuskuri täynnä, {} pakettia hylättiin.)'.\
+                  format(len(paketit) - lahetetty))
     
 
     def laheta_mjono(self, sekvno, lahteva, vastott):
-        '''Paketoi merkkijonomuotoisen datan oikeaan kehysrakenteeseen
-        ja lähettää paketin.
+        '''Paketoi merkkijonomuotoisen tai tavumuotoisen datan oikeaan
+        kehysrakenteeseen ja lähettää paketin.
         '''
         lahteva = self.valm_paketti(sekvno, lahteva)
         self.laheta(lahteva, vastott)
 
         
-    def valm_paketti(self, sekvno, lahteva):
-        '''Valmistelee paketin: lahteva koodataan ja muodostetaan
-        kehysrakenteen muotoinen paketti: itse viesti keskelle,
-        alkuun sekvenssinumero, loppuun tarkistussumma.
+    def valm_paketti(self, sekvno, lahteva, liput=0):
+        '''Valmistelee paketin: muodostetaan kehysrakenteen muotoinen
+        paketti: alkuun otsake (ks. OTSAKE), keskelle itse viesti, loppuun
+        tarkistussumma. Viesti voi olla tavumuotoinen (bytes, bytearray,
+        memoryview) tai merkkijono, joka koodataan.
         '''
-        # Kasataan paketti: keskelle itse viesti, alkuun sekvenssinumero,
-        # loppuun tarkistussumma.
-        #
-        # Käytännön ongelma on kuitenkin, että jos sekvenssinumero on 0,
-        # niin se häviää, kun tavujono muunnetaan kokonaisluvuksi.
-        # Se pitää siis lisätä pakettiin uudestaan. Toisaalta pitää
-        # varoa, ettei pakettiin lisätä kahta ykköstä.
-        #
-        # Muodostetaan sekvenssinumerollinen paketti ja lasketaan
-        # siitä tarkistussumma:
-        lahteva = lahteva.encode('utf8')
-        nro = sekvno.to_bytes(length=1, byteorder='big')        
-        lahteva_numerollinen = nro + lahteva
-        tark = self.laske_tark(lahteva_numerollinen)
-        #
-        # Sitten liitetään numero, itse viesti ja sekvenssinumerollisesta
-        # paketista laskettu tarkistussumma yhteen.
-        lahteva = nro + lahteva + tark
-        # Välitetään paketti.
-        return lahteva
+        if isinstance(lahteva, str):
+            lahteva = lahteva.encode('utf8')
+        paikka = bytearray(OTSAKE.size + len(lahteva) +
+                           self.tarkistus.pituus)
+        self.kirjoita_paketti(paikka, sekvno, lahteva, liput)
+        return paikka
+
+
+    def kirjoita_paketti(self, paikka, sekvno, lahteva, liput=0):
+        '''Kirjoittaa paketin valmiiksi varattuun puskuriin paikka
+        (bytearray) ja palauttaa paketin memoryview-näkymänä puskurin
+        alkuun. Otsake, viesti ja tarkistussumma kirjoitetaan suoraan
+        oikeille kohdilleen, joten välivaiheen tavujonoja ei synny.
+        '''
+        nakyma, loppu = self.kirjoita_runko(paikka, sekvno, lahteva, liput)
+        # Tarkistussumma lasketaan otsakkeesta ja viestistä ja kirjoitetaan
+        # niiden perään.
+        tark = self.laske_tark(nakyma[:loppu])
+        nakyma[loppu:loppu+len(tark)] = tark
+        return nakyma[:loppu+len(tark)]
+
+
+    def kirjoita_paketit(self, paikat, sekvnot, lahtevat, liput):
+        '''Kirjoittaa useita paketteja kerralla kuten kirjoita_paketti():
+        paketti i kirjoitetaan puskuriin paikat[i] sekvenssinumerolla
+        sekvnot[i] ja lipuilla liput[i]. Tarkistussummat lasketaan
+        kaikille paketeille yhdellä laske_monta()-kutsulla. Palauttaa
+        listan pakettien memoryview-näkymiä.
+        '''
+        rungot = [self.kirjoita_runko(paikka, sekvno, lahteva, lippu)
+                  for paikka, sekvno, lahteva, lippu in
+                  zip(paikat, sekvnot, lahtevat, liput)]
+        tarkistukset = self.tarkistus.laske_monta(
+            [nakyma[:loppu] for nakyma, loppu in rungot])
+        paketit = []
+        for (nakyma, loppu), tark in zip(rungot, tarkistukset):
+            nakyma[loppu:loppu+len(tark)] = tark
+            paketit.append(nakyma[:loppu+len(tark)])
+        return paketit
+
+
+    def kirjoita_runko(self, paikka, sekvno, lahteva, liput):
+        '''Kirjoittaa puskuriin paikka paketin otsakkeen ja viestin
+        ilman tarkistussummaa. Palauttaa memoryview-näkymän puskuriin ja
+        kohdan, johon tarkistussumma kuuluu.'''
+        if isinstance(lahteva, str):
+            lahteva = lahteva.encode('utf8')
+        pituus = len(lahteva)
+        loppu = OTSAKE.size + pituus
+        if loppu + self.tarkistus.pituus > len(paikka):
+            raise ValueError('Viesti on liian pitkä: paketti ei mahdu ' +\
+                             '{} tavun puskuriin.'.format(len(paikka)))
+        nakyma = memoryview(paikka)
+        OTSAKE.pack_into(paikka, 0, VERSIO, liput, self.tarkistus.tunnus,
+                         sekvno, pituus)
+        nakyma[OTSAKE.size:loppu] = lahteva
+        return nakyma, loppu
+
+
+    def valm_paketit(self, sekvno_alku, lahtevat, liput=0):
+        '''Valmistelee listan paketteja kerralla. Ensimmäinen paketti saa
+        sekvenssinumeron sekvno_alku ja jokainen seuraava yhtä suuremman.
+        Tarkistussummat lasketaan kaikille paketeille yhdellä kutsulla
+        (ks. kirjoita_paketit()).
+        '''
+        lahtevat = [lahteva.encode('utf8') if isinstance(lahteva, str)
+                    else lahteva for lahteva in lahtevat]
+        paikat = [bytearray(OTSAKE.size + len(lahteva) +
+                            self.tarkistus.pituus) for lahteva in lahtevat]
+        sekvnot = [(sekvno_alku + i) % self.max
+                   for i in range(len(lahtevat))]
+        self.kirjoita_paketit(paikat, sekvnot, lahtevat,
+                              len(lahtevat) * [liput])
+        return paikat
+
+
+    def kuorman_koko(self):
+        '''Palauttaa, kuinka monta tavua dataa yhteen pakettiin mahtuu,
+        kun paketin on mahduttava puskurin_koko-tavuiseen puskuriin.'''
+        return self.puskurin_koko - OTSAKE.size - self.tarkistus.pituus
+
+
+    def pilko(self, data):
+        '''Jakaa datan osiin, joista jokainen mahtuu yhteen pakettiin.
+        Osat ovat memoryview-näkymiä dataan. Tyhjästä datasta tulee yksi
+        tyhjä osa.'''
+        koko = self.kuorman_koko()
+        nakyma = memoryview(data)
+        return [nakyma[i:i+koko] for i in range(0, len(nakyma), koko)] or\
+               [nakyma]
+
+
+    def pura_kootut(self, data):
+        '''Purkaa kootun paketin datakentän (ks. LIPPU_KOOTTU) viestien
+        listaksi. Viestit ovat memoryview-näkymiä datan kopioon, joten
+        alkuperäisen datan puskurin voi vapauttaa heti.'''
+        kopio = memoryview(bytearray(data))
+        viestit = []
+        i = 0
+        while i + TIETUE.size <= len(kopio):
+            pituus, = TIETUE.unpack_from(kopio, i)
+            i += TIETUE.size
+            viestit.append(kopio[i:i+pituus])
+            i += pituus
+        return viestit
+
+
+    def lue_otsake(self, paketti):
+        '''Palauttaa paketin otsakkeen kentät monikkona (versio, liput,
+        tarkistussumman tunnus, sekvenssinumero, datakentän pituus).'''
+        return OTSAKE.unpack_from(paketti)
 
 
     def pura(self, paketti):
-        '''Palauttaa sekvenssinumeron ja datakentän dekoodattuina.'''
-        sekvno = paketti[0]  # Kokonaisluku, ei tarvitse enää dekoodata.
-        data = paketti[1:-1]  # Tavujono, pitää dekoodata.
-        data = data.decode('utf8', errors='ignore')
+        '''Palauttaa sekvenssinumeron ja datakentän. Datakenttä on
+        memoryview-näkymä pakettiin, joten sitä ei kopioida eikä
+        dekoodata.'''
+        _, _, _, sekvno, pituus = OTSAKE.unpack_from(paketti)
+        data = memoryview(paketti)[OTSAKE.size:OTSAKE.size+pituus]
         return (sekvno, data)
 
 
+    def dekoodaa(self, data):
+        '''Dekoodaa tavumuotoisen datakentän merkkijonoksi.'''
+        return str(data, 'utf8', errors='ignore')
+
+
     def onko_ikkunassa(self, alaraja, ylaraja, maksimi, luku):
         '''Palauttaa tiedon siitä, onko annettu luku ikkunan sisällä (vähintään
         alaraja, aidosti pienempi kuin ylaraja), kun modulo maksimi 
@@ -104,66 +297,80 @@ class Luottokerros:
 
         
     def tulosta_ikkuna(self):
-        '''Tulostaa vastaanotto-/lähetysikkunan.'''
+        '''Tulostaa vastaanotto-/lähetysikkunan, jos self.testaus on
+        True.'''
+        if not self.testaus:
+            return
         akkuna = []
         for i in range(self.vanhin, self.vanhin+self.ikkuna):
             akkuna.append(i % self.max)
         print('(Ikkuna on nyt {}.)'.format(akkuna))
         
         
-    ##################
-    # CRC 8 -metodit #
-    ##################
-
-    def tarkasta(self, data, testaus=False):
-        '''Suorittaa CRC 8 -tarkastuksen vastaanotetulle datalle.'''
-        data = int.from_bytes(data, byteorder='big')
-        self.crc8(data, testaus)
-        return self.rek == 0
-        
-        
-    def laske_tark(self, data, testaus=False):
-        '''Palauttaa CRC 8 -tarkistussumman tavujonona.'''
-        data = int.from_bytes(data, byteorder='big')
-        data = data << 8  # Kahdeksan nollaa perään.
-        self.crc8(data, testaus)  # Lasketaan tarkistussumma.
-        return self.rek.to_bytes(length=1, byteorder='big')
-        
+    ##########################
+    # Tarkistussummametodit. #
+    ##########################
 
-    def crc8(self, data, testaus=False):
-        '''CRC 8 -algoritmin toteutus kokonaislukumuotoiselle datalle.'''
-        self.rek = 0
+    def tarkasta(self, paketti, testaus=False):
+        '''Tarkastaa vastaanotetun paketin otsakkeen ja tarkistussumman.
+        Tarkistussumma tarkastetaan sillä algoritmilla, jonka tunnus on
+        otsakkeessa.'''
+        tarkistus = self.tarkasta_otsake(paketti)
+        return tarkistus is not None and tarkistus.tarkasta(paketti, testaus)
 
-        # Annetaan jokainen bitti erikseen siirtorekisterille.
-        pituus = data.bit_length()
-        for i in range(pituus, 0, -1):
-            bitti = ((1 << i-1) & data) >> i-1  # Bitti kohdassa i-1.
-            self.siirtorek(bitti, testaus)
-    
 
-    def siirtorek(self, bitti, testaus):
-        '''Suorittaa yhden siirtorekisterin askeleen.'''
-        if testaus:
-            print('Rekisteri ensin: {}\ntuleva bitti: {}'.\
-                  format(bin(self.rek), bitti))
-
-        # Bitit.
-        bitti7 = (self.rek & 0b10000000) >> 7  # Bitti kohdassa 7.
-        bitti1 = (self.rek & 0b10) >> 1  # Bitti kohdassa 1.
-        bitti0 = self.rek & 0b1  # Bitti kohdassa 0.
-
-        # Uudet arvot.
-        bitti2 = bitti7 ^ bitti1
-        bitti1 = bitti7 ^ bitti0
-        bitti0 = bitti7 ^ bitti
-        uudet = (bitti2 << 2) | (bitti1 << 1) | bitti0  # Yhdistelmä.
-
-        # Laitetaan uudet arvot rekisteriin.
-        self.rek = self.rek << 1  # Siirretään bittejä yksi vasemmalle.
-        self.rek = self.rek & 0b11111000  # Nollataan vanhat.
-        self.rek = self.rek | uudet  # Uudet arvot tilalle.
-
-        if testaus:
-            print('Rekisteri jälkeen: {}\n'.format(bin(self.rek)))
-        
-    
+    def tarkasta_otsake(self, paketti):
+        '''Palauttaa paketin tarkastamiseen käytettävän tarkistussumma-
+        olion, jos otsake on kunnossa, muuten None. Otsake on kunnossa, jos
+        versio on oikea, algoritmi on sallittu ja paketin pituus vastaa
+        otsakkeeseen merkittyä.'''
+        if len(paketti) < OTSAKE.size:
+            return None
+        versio, _, tunnus, _, pituus = OTSAKE.unpack_from(paketti)
+        if versio != VERSIO:
+            return None
+        if tunnus == self.tarkistus.tunnus:
+            tarkistus = self.tarkistus
+        else:
+            tarkistus = tarkistussumma.hae_tunnuksella(tunnus)
+            if tarkistus is None or tarkistus.nimi not in self.sallitut:
+                return None
+        # Pituus ei täsmää esim. silloin, kun recvfrom on katkaissut
+        # liian pitkän paketin.
+        if OTSAKE.size + pituus + tarkistus.pituus != len(paketti):
+            return None
+        return tarkistus
+
+
+    def tarkasta_monta(self, paketit):
+        '''Tarkastaa listan paketteja kerralla. Palauttaa listan
+        totuusarvoja samassa järjestyksessä.'''
+        tulokset = len(paketit) * [False]
+        # Ryhmitellään paketit algoritmin mukaan, jotta kunkin ryhmän
+        # tarkistussummat voidaan tarkastaa yhdellä kutsulla.
+        ryhmat = {}
+        for i, paketti in enumerate(paketit):
+            tarkistus = self.tarkasta_otsake(paketti)
+            if tarkistus is not None:
+                ryhmat.setdefault(tarkistus.tunnus, (tarkistus, []))[1].\
+                    append(i)
+        for tarkistus, indeksit in ryhmat.values():
+            ryhma = [paketit[i] for i in indeksit]
+            for i, ok in zip(indeksit, tarkistus.tarkasta_monta(ryhma)):
+                tulokset[i] = ok
+        return tulokset
+
+
+    def sovi_tarkistus(self, paketti):
+        '''Ottaa omaksi algoritmiksi sen tarkistussumma-algoritmin, jota
+        vastaanotetun (jo tarkastetun) paketin lähettäjä käyttää. Näin
+        lähettäjä valitsee algoritmin, ja vastaanottaja kuittaa samalla.'''
+        tunnus = paketti[2]
+        if tunnus != self.tarkistus.tunnus:
+            self.tarkistus = tarkistussumma.hae_tunnuksella(tunnus)
+
+
+    def laske_tark(self, data, testaus=False):
+        '''Palauttaa valitun algoritmin mukaisen tarkistussumman
+        tavujonona.'''
+        return self.tarkistus.laske(data, testaus)
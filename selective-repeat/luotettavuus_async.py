@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+import asyncio
+import luotettavuus
+import luotettavuus_lah
+import luotettavuus_vastott
+import time
+
+
+class Ajastukset:
+    '''Lähettäjän ajastimet asyncio-tapahtumasilmukassa.
+
+    Tarjoaa saman ajasta()-rajapinnan kuin
+    tapahtumasilmukka.Tapahtumasilmukka, mutta käyttää
+    loop.call_later()-ajastuksia, joten ajastimet eivät tarvitse omaa
+    säiettä. call_later() palauttaa olion, jolla on cancel()-metodi kuten
+    ajastin.Ajastin-oliolla.
+    '''
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.loppu = False
+
+
+    def ajasta(self, aika, funktio, args=()):
+        '''Kutsuu funktiota argumenteilla args, kun aika sekuntia on
+        kulunut.'''
+        return self.loop.call_later(aika, self.kutsu, funktio, args)
+
+
+    def lopeta(self):
+        '''Lopettamisen jälkeen lauenneita ajastuksia ei suoriteta.'''
+        self.loppu = True
+
+
+    def kutsu(self, funktio, args):
+        if not self.loppu:
+            funktio(*args)
+
+
+class AsyncLahettaja(luotettavuus_lah.Luottolahettaja,
+                     asyncio.DatagramProtocol):
+    '''Selective repeat -lähettäjä asyncio-protokollana.
+
+    Protokolla- ja ikkunalogiikka peritään luokasta Luottolahettaja.
+    Erona on, että kuittaukset tulevat metodiin datagram_received() ja
+    ajastimet ovat asyncio-ajastuksia, joten yksi asyncio-silmukka voi
+    palvella tuhansia yhteyksiä ilman säikeitä. Olio luodaan korutiinilla
+    luo_lahettaja(), ja viestit lähetetään korutiinilla send().
+    '''
+
+    def __init__(self, puskurin_koko, vastott, **asetukset):
+        super().__init__(None, puskurin_koko, vastott,
+                         silmukka=Ajastukset(asyncio.get_running_loop()),
+                         **asetukset)
+        # Lähettämistä odottava korutiini herätetään, kun kuittaus saapuu.
+        self.vapautui = asyncio.Event()
+        # Yhden viestin osat lähetetään peräkkäin, vaikka send()-kutsuja
+        # olisi käynnissä useita.
+        self.lahetyslukko = asyncio.Lock()
+
+
+    def connection_made(self, kuljetus):
+        # Kuljetuksella on sendto()-metodi kuten soketilla.
+        self.soketti = kuljetus
+
+
+    def datagram_received(self, data, osoite):
+        self.kasittele_kuittaus(memoryview(data))
+
+
+    def error_received(self, poikkeus):
+        print('(Virhe: {}.)'.format(poikkeus))
+
+
+    def connection_lost(self, poikkeus):
+        self.lopeta()
+
+
+    def laheta(self, lahteva, vastott):
+        '''Kuljetus on yhdistetty vastaanottajaan, joten osoitetta ei
+        anneta. Kuljetus kopioi paketin, jos se ei voi lähettää sitä
+        heti.'''
+        self.soketti.sendto(lahteva)
+
+
+    def kasittele_kuittaus(self, kuittaus):
+        super().kasittele_kuittaus(kuittaus)
+        self.vapautui.set()
+
+
+    def lopeta(self):
+        super().lopeta()
+        self.vapautui.set()
+
+
+    def close(self):
+        '''Lopettaa lähettäjän ja sulkee kuljetuksen.'''
+        self.lopeta()
+        if self.soketti is not None:
+            self.soketti.close()
+
+
+    def odota_tilaa(self, aikaraja=None):
+        '''Estävä odottaminen pysäyttäisi koko asyncio-silmukan, joten
+        tilaa ei odoteta. Jos ikkuna on täynnä, aiheutetaan poikkeus.
+        Estäviä lähetysmetodeja (laheta_viesti() ym.) voi siis käyttää
+        vain, kun ikkunassa on tilaa. Muuten käytetään korutiinia send().'''
+        with self.lukko:
+            if self.loppu or self.mahtuuko():
+                return not self.loppu
+        raise RuntimeError('Ikkuna on täynnä. Käytä korutiinia send().')
+
+
+    async def tilaa_vapautuu(self):
+        '''Odottaa, kunnes lähetysikkunassa on tilaa.'''
+        while True:
+            with self.lukko:
+                if self.loppu:
+                    raise ConnectionError('Lähettäjä on lopetettu.')
+                if self.mahtuuko():
+                    return
+            self.vapautui.clear()
+            await self.vapautui.wait()
+
+
+    async def send(self, viesti):
+        '''Lähettää merkkijonon tai tavumuotoisen viestin. Pitkä viesti
+        jaetaan osiin kuten metodissa laheta_viesti(). Korutiini odottaa
+        tarvittaessa tilaa ikkunassa ja palaa, kun viimeinen osa on
+        lähetetty.'''
+        if isinstance(viesti, str):
+            viesti = viesti.encode('utf8')
+        async with self.lahetyslukko:
+            osat = self.pilko(viesti)
+            for i, osa in enumerate(osat):
+                liput = luotettavuus.LIPPU_JATKUU if i < len(osat)-1 else 0
+                await self.tilaa_vapautuu()
+                self.laheta_bytes(osa, liput)
+
+
+class AsyncVastaanottaja(luotettavuus_vastott.Luottovastaanottaja,
+                         asyncio.DatagramProtocol):
+    '''Selective repeat -vastaanottaja asyncio-protokollana.
+
+    Paketit käsitellään perityllä metodilla kasittele_paketti(), ja valmiit
+    viestit (bytes) luetaan asynkronisella iteraattorilla:
+
+        async for viesti in vastaanottaja:
+            ...
+
+    Iteraattorin jonossa olevat viestit pienentävät lähettäjälle
+    ilmoitettavaa ikkunaa, joten hidas kuluttaja hidastaa lähettäjää.
+    Olio luodaan korutiinilla luo_vastaanottaja().
+    '''
+
+    def __init__(self, puskurin_koko, **asetukset):
+        super().__init__(None, puskurin_koko, **asetukset)
+        self.jono = asyncio.Queue()  # Lopussa jonoon laitetaan None.
+        self.viivastysajastin = None  # Viivästetyn kuittauksen ajastin.
+
+
+    def connection_made(self, kuljetus):
+        self.soketti = kuljetus
+
+
+    def datagram_received(self, data, lahettaja):
+        # Paketti kopioidaan altaan puskuriin, jotta sitä voi käsitellä
+        # samalla tavalla kuin soketista luettua.
+        puskuri = self.allas.varaa()
+        pituus = min(len(data), self.puskurin_koko)
+        puskuri[:pituus] = data[:pituus]
+        viestit = self.kasittele_paketti(puskuri, pituus, lahettaja)
+        for viesti in viestit or ():
+            self.jono.put_nowait(bytes(viesti))
+            self.vapauta(viesti)
+        # Viivästetty kuittaus lähetetään ajastimella, koska
+        # lue_paketti()-metodia ei käytetä.
+        if self.kuittaushetki is not None and self.viivastysajastin is None:
+            self.viivastysajastin = asyncio.get_running_loop().call_later(
+                max(0, self.kuittaushetki - time.monotonic()),
+                self.viivastetty_kuittaus)
+
+
+    def error_received(self, poikkeus):
+        print('(Virhe: {}.)'.format(poikkeus))
+
+
+    def connection_lost(self, poikkeus):
+        self.jono.put_nowait(None)
+
+
+    def close(self):
+        '''Sulkee kuljetuksen. Iteraattori päättyy, kun jonossa jo olevat
+        viestit on luettu.'''
+        if self.soketti is not None:
+            self.soketti.close()
+
+
+    def viivastetty_kuittaus(self):
+        self.viivastysajastin = None
+        if self.kuittaushetki is not None:
+            self.kuittaa(self.kuittauksen_vastott)
+
+
+    def ilmoitettava_ikkuna(self):
+        '''Iteraattorin jonossa odottavat viestit vievät tilaa jonosta.'''
+        return max(0, super().ilmoitettava_ikkuna() - self.jono.qsize())
+
+
+    def __aiter__(self):
+        return self
+
+
+    async def __anext__(self):
+        viesti = await self.jono.get()
+        if viesti is None:
+            raise StopAsyncIteration
+        # Jos lähettäjälle on ilmoitettu, että ikkuna on nolla,
+        # ilmoitetaan, että tilaa on taas.
+        if (self.ilmoitettu == 0 and self.ilmoitettava_ikkuna() > 0 and
+            self.vastapuoli is not None):
+            self.kuittaa(self.vastapuoli)
+        return viesti
+
+
+async def luo_lahettaja(vastott, puskurin_koko, **asetukset):
+    '''Luo vastaanottajaan vastott yhdistetyn UDP-päätepisteen ja palauttaa
+    sen AsyncLahettaja-protokollan. Muut asetukset välitetään
+    Luottolahettaja-luokalle (ikkuna, maksimi, tarkistus ym.).'''
+    loop = asyncio.get_running_loop()
+    _, lahettaja = await loop.create_datagram_endpoint(
+        lambda: AsyncLahettaja(puskurin_koko, vastott, **asetukset),
+        remote_addr=vastott)
+    return lahettaja
+
+
+async def luo_vastaanottaja(osoite, puskurin_koko, **asetukset):
+    '''Luo osoitteeseen sidotun UDP-päätepisteen ja palauttaa sen
+    AsyncVastaanottaja-protokollan. Muut asetukset välitetään
+    Luottovastaanottaja-luokalle.'''
+    loop = asyncio.get_running_loop()
+    _, vastaanottaja = await loop.create_datagram_endpoint(
+        lambda: AsyncVastaanottaja(puskurin_koko, **asetukset),
+        local_addr=osoite)
+    return vastaanottaja
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 
+import eraio
+import lahetysikkuna
 import luotettavuus
-import socket as s
+import rtt
+import ruuhka
+import tapahtumasilmukka
 import threading as thrd
+import time
 
 
 class Luottolahettaja(luotettavuus.Luottokerros):
@@ -11,20 +16,20 @@ class Luottolahettaja(luotettavuus.Luottokerros):
     Luottolahettaja vastaa pakettien lähettämisestä Go back N -algoritmia
     käyttäen.
 
-    Bittivirheiden tarkastamisessa käytetään CRC 8 -algoritmia.
+    Bittivirheiden tarkastamisessa käytetään oletuksena CRC 8 -algoritmia.
     Polynomina on x**8 + x**3 + x**2 + x + 1, 
     bittimuodossa 100000111.
     '''
 
     
-    def __init__(self, soketti, puskurin_koko, vastott):
-        super().__init__(soketti, puskurin_koko)
+    def __init__(self, soketti, puskurin_koko, vastott, tarkistus='crc8',
+                 ikkuna=4, maksimi=9, ruuhkanhallinta='newreno',
+                 silmukka=None):
+        super().__init__(soketti, puskurin_koko, tarkistus, ikkuna, maksimi)
         # Koska vastaanottaja on koko ajan sama, se voi
         # ihan hyvin olla attribuutti.
         self.vastott = vastott
         
-        self.lukuaika = 0.5  # Aika, joka kertoo, kuinka kauan kuittausta
-                             # yritetään lukea.
                              
         # self.vanhin,
         # self.ikkuna ja
@@ -32,138 +37,605 @@ class Luottolahettaja(luotettavuus.Luottokerros):
         self.seur = 0   # Seuraavan lähetettävän paketin sekvenssinumero. Tämä
                         # voi olla välillä [0, self.max-1]. 
 
-        # Kun paketti lähtee, se tallentuu tähän listaan, jotta se olisi
-        # helpompi lähettää uudelleen. Indeksi vastaa sekvenssinumeroa.
-        # Kun tietyn paketin kuittaus saapuu, paketin kohdalle
-        # tallennetaan None.
-        self.kuittaamattomat = self.max*[None]
+        # Kun paketti lähtee, se tallentuu lähetysikkunaan (moduuli
+        # lahetysikkuna.py), jotta se olisi helpompi lähettää uudelleen.
+        # Ikkuna on rengaspuskuri, jossa on paikka ja valmiiksi varattu
+        # puskuri jokaista ikkunan pakettia kohti, ja sen indeksi on
+        # etäisyys sekvenssinumerosta self.vanhin. Kun tietyn paketin
+        # kuittaus saapuu, paikka merkitään kuitatuksi, ja se poistuu
+        # ikkunasta, kun kaikki sitä vanhemmat on kuitattu.
+        self.kuittaamattomat = lahetysikkuna.Lahetysikkuna(
+            self.ikkuna, self.max, puskurin_koko)
+        self.lahetetyt = 0  # Lähetettyjen (uusien) pakettien lukumäärä.
 
-        # Jokaista lähetettyä pakettia vastaa ajastin. Ajastimen
-        # indeksi on sama kuin sekvenssinumero.
-        self.ajastimet = self.max*[None]
-        self.aika = 2.0
+        # Jos kootut viestit eivät mahdu ikkunaan kokoamisajan
+        # päättyessä, lähettämistä yritetään uudelleen tämän ajan kuluttua.
+        self.odotusaika = 0.05
+
+        # Pienten viestien kokoaminen samaan pakettiin (ks.
+        # laheta_koottuna()). Kokoamisaika on pisin aika sekunteina, jonka
+        # viestiä pidätetään ennen lähettämistä. Arvolla 0 viestit
+        # lähetetään heti, mikä sopii vuorovaikutteiseen liikenteeseen.
+        self.kokoamisaika = 0.0
+        self.kootut = bytearray()  # Kootut, vielä lähettämättömät viestit.
+        self.kokoamisajastin = None
+        # Kokoamisen lukko on eri kuin self.lukko, koska sitä pidetään
+        # myös silloin, kun odotetaan tilaa ikkunassa.
+        self.kokoamislukko = thrd.Lock()
+
+        # Jokaista lähetettyä pakettia vastaa ajastin, joka on
+        # tallennettu lähetysikkunan paikkaan paketin lähetyshetken
+        # kanssa. Ajastimen aika (RTO) lasketaan mitatusta
+        # kiertoviiveestä. Nykyiset arvot näkyvät attribuuteista
+        # self.rtt.srtt ja self.rtt.rto.
+        self.rtt = rtt.Rttarvio()
+
+        # Valikoivien kuittausten määrä, joiden mukaan vanhin
+        # kuittaamaton paketti puuttuu mutta jokin myöhempi on perillä, ja
+        # määrä, jonka jälkeen vanhin paketti lähetetään uudelleen
+        # odottamatta aikakatkaisua.
+        self.tuplakuittaukset = 0
+        self.tuplaraja = 3
+
+        # Ruuhkanhallinta (moduuli ruuhka.py) rajoittaa lähetysikkunaa
+        # verkon tilanteen mukaan. self.ikkuna on ikkunan yläraja, ja
+        # lähettämiseen käytetään pienempää luvuista self.ikkuna ja
+        # self.ruuhka.ikkuna. Arvolla ruuhkanhallinta='vakio' ikkuna on
+        # aina self.ikkuna.
+        self.ruuhka = ruuhka.hae(ruuhkanhallinta, self.ikkuna)
+
+        # Vuonohjaus: vastaanottaja ilmoittaa kuittauksissa, kuinka monta
+        # uutta pakettia se ottaa vastaan (ks. LIPPU_IKKUNA). Ennen
+        # ensimmäistä kuittausta oletetaan, että koko ikkuna on käytössä.
+        # Kun ikkuna on nolla eikä kuittaamattomia paketteja ole,
+        # vastaanottajaa koetellaan ajoittain (ks. koettele()), jotta
+        # ikkunan avautuminen huomataan, vaikka sitä ilmoittava kuittaus
+        # katoaisi.
+        self.vastott_ikkuna = self.ikkuna
+        self.koetin = None
+        self.koettelut = 0  # Peräkkäisten koettelujen määrä.
 
         # Lukitusta käytetään, jotta toinen säie ei muuttaisi attribuutteja
         # sillä välin kun jokin toinen lukee niitä.
         self.lukko = thrd.Lock()
 
-        # Metodi odota_kuittauksia() lopetetaan asettamalla tämän
-        # attribuutin arvoksi True. Tämä tapahtuu, kun lahett_app-ohjelman
-        # main()-metodi käsittelee KeyboardInterruptia tai muuta poikkeusta.
-        # Ratkaisu on kömpelö, mutta esim. poikkeuskäsittelyn lisääminen
-        # odota_kuittauksia()-metodiin ei toimi halutulla tavalla.
+        # Ehtomuuttuja, jolla odotetaan tilaa lähetysikkunassa (ks.
+        # odota_tilaa()). Se käyttää samaa lukkoa kuin muu tila, ja
+        # kuittausten käsittely herättää odottajat.
+        self.tilaa = thrd.Condition(self.lukko)
+
+        # Lähettäjä on lopetettu (ks. lopeta()).
         self.loppu = False
 
+        # Kuittausten vastaanotto ja kaikki ajastimet hoidetaan yhdessä
+        # tapahtumasilmukan säikeessä (moduuli tapahtumasilmukka.py).
+        # Ajastimen käynnistäminen ei siis luo uutta säiettä, eikä
+        # sokettia tarvitse lukea aikakatkaisun kanssa. Silmukan tilalle
+        # voi antaa muun olion, jolla on metodit ajasta() ja lopeta()
+        # (ks. luotettavuus_async.py).
+        if silmukka is None:
+            silmukka = tapahtumasilmukka.Tapahtumasilmukka()
+        self.silmukka = silmukka
+        # Kuittaukset luetaan aina samaan puskuriin, sillä kuittaus on
+        # käsitelty loppuun ennen seuraavan lukemista.
+        self.kuittauspuskuri = bytearray(puskurin_koko)
+        self.kuittauspuskurit = None  # Eräsiirron puskurit luodaan
+                                      # tarvittaessa.
+
         
     def aloita(self):
         '''Alkaa kuunnella sokettia kuittausten varalta.
         Huom.! Tätä metodia on tarkoitus kutsua vain yhden kerran.'''
-        # Luodaan ja käynnistetään säie, joka odottaa kuittauksia.
-        odotus = thrd.Thread(target=self.odota_kuittauksia)
-        odotus.start()
-
-
-    def odota_kuittauksia(self):
-        kuittaus = ''
-        self.soketti.settimeout(self.lukuaika)
-        # Yritetään lukea sokettia. Sokettia yritetään lukea vain tietyn aikaa
-        # kerrallaan ja suorituskertojen välissä tarkastetaan self_loppu.
-        # Kun self_loppu == True, metodin suoritus päättyy. Näin tehdään,
-        # koska metodin suoritusta (ja sitä kautta säikeen suoritusta)
-        # ei saada muuten KeyboardInterruptilla lopetetuksi.
+        # Tapahtumasilmukka lukee sokettia vain, kun siinä on luettavaa,
+        # ja lukee kerralla kaiken saapuneen. Siksi soketti asetetaan
+        # estämättömäksi.
+        self.soketti.setblocking(False)
+        self.silmukka.rekisteroi(self.soketti, self.lue_kuittaukset)
+
+
+    def lopeta(self):
+        '''Lopettaa kuittausten odottamisen ja pysäyttää ajastimet.
+        Tapahtumasilmukka herätetään, joten lopettaminen on välitöntä.'''
+        self.loppu = True
+        self.silmukka.lopeta()
+        with self.tilaa:
+            self.tilaa.notify_all()
+
+
+    def lue_kuittaukset(self):
+        '''Tapahtumasilmukka kutsuu tätä, kun soketista voi lukea. Lukee
+        ja käsittelee kaikki saapuneet kuittaukset. Muut kuin
+        estämättömän soketin tavalliset poikkeukset välitetään
+        tapahtumasilmukalle, joka tulostaa ne.'''
+        if self.erasiirto and eraio.tukee(self.soketti, 'recvfrom_into'):
+            self.lue_kuittaukset_erissa()
+            return
+        nakyma = memoryview(self.kuittauspuskuri)
         while not self.loppu:
             try:
-                kuittaus, _ = self.soketti.recvfrom(self.puskurin_koko)
-                self.kasittele_kuittaus(kuittaus)
-            except s.timeout:
-                pass
-            # lahett_appin main()-metodi on saattanut jo sulkea soketin.
-            # Siinä tapauksessa pitäisi olla self.loppu == True.
-            except:   
-                continue
+                pituus, _ = self.soketti.recvfrom_into(self.kuittauspuskuri,
+                                                      self.puskurin_koko)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.kasittele_kuittaus(nakyma[:pituus])
 
 
-    def kasittele_kuittaus(self, kuittaus):
+    def lue_kuittaukset_erissa(self):
+        '''Kuten lue_kuittaukset(), mutta kuittauksia luetaan useita
+        yhdellä recvmmsg-kutsulla (moduuli eraio).'''
+        if self.kuittauspuskurit is None:
+            self.kuittauspuskurit = [bytearray(self.puskurin_koko)
+                                     for _ in range(eraio.ERA)]
+        while not self.loppu:
+            saapuneet = eraio.vastaanota_monta(self.soketti,
+                                               self.kuittauspuskurit,
+                                               self.puskurin_koko)
+            kuittaukset = [memoryview(puskuri)[:pituus]
+                           for puskuri, (pituus, _) in
+                           zip(self.kuittauspuskurit, saapuneet)]
+            # Koko erä tarkastetaan yhdellä kutsulla.
+            for kuittaus, oikea in zip(kuittaukset,
+                                       self.tarkasta_monta(kuittaukset)):
+                self.kasittele_kuittaus(kuittaus, oikea)
+            # Vajaa erä tarkoittaa, että soketti on tyhjä.
+            if len(saapuneet) < len(self.kuittauspuskurit):
+                return
+
+
+    def kasittele_kuittaus(self, kuittaus, oikea=None):
         '''Lukee tavujonomuotoisen kuittauksen, tarkastaa sen ja
-        huolehtii kuittauksen aiheuttamista jatkotoimista.'''
+        huolehtii kuittauksen aiheuttamista jatkotoimista. Jos kuittaus
+        on jo tarkastettu (esim. tarkasta_monta()), tulos annetaan
+        parametrina oikea.'''
+        if oikea is None:
+            oikea = self.tarkasta(kuittaus)
         # Jos kuittauksessa on bittivirhe, ei jatketa.
-        if not self.tarkasta(kuittaus):
+        if not oikea:
             print('(Bittivirheellinen kuittaus.)')
             return
 
+        # Jos paketti ei ole kuittaus, ei jatketa.
+        _, liput, _, sekvno, _ = self.lue_otsake(kuittaus)
+        if not liput & luotettavuus.LIPPU_ACK:
+            print('(Vastaanotettiin paketti, joka ei ole kuittaus.)')
+            return
+
         # Muuten:
-        sekvno, _ = self.pura(kuittaus)
         print('(Vastaanotettiin bittivirheetön kuittaus, jonka ' +\
               'sekvenssinumero on {}.)'.format(sekvno))
 
-        # Jos sekvenssinumero ei ole lähetysikkunan sisällä, ei tehdä mitään.
-        # Muussa tapauksessa toimitaan seuraavasti:
+        # Vastaanottajan ilmoittama ikkuna on datakentän alussa, jos
+        # kuittauksessa on sellainen.
+        kartta = self.pura(kuittaus)[1]
+        ikkuna = None
+        if liput & luotettavuus.LIPPU_IKKUNA:
+            # Liian lyhyestä kuittauksesta ikkunaa ei voi lukea, joten
+            # ikkunan päivitys ohitetaan. Bittikarttaa ei silloin ole.
+            if len(kartta) >= luotettavuus.IKKUNA.size:
+                ikkuna = luotettavuus.IKKUNA.unpack_from(kartta)[0]
+            else:
+                print('(Kuittauksen ikkuna puuttuu. Ikkunaa ei päivitetä.)')
+            kartta = kartta[luotettavuus.IKKUNA.size:]
+
+        nopea_uudelleenlahetys = None
         with self.lukko:
-            if self.onko_ikkunassa(self.vanhin, self.vanhin+self.ikkuna,
-                                   self.max, sekvno):
-                # Pysäytetään ajastin ja kirjataan paketti kuitatuksi.
-                self.ajastimet[sekvno].cancel()
-                self.kuittaamattomat[sekvno] = None
-                
-                # Tarvittaessa päivitetään self.vanhin.
-                if sekvno == self.vanhin:
-                    # Kasvatetaan self.vanhin-attribuuttia yhdellä niin
-                    # kauan, että sen kohdalla on kuittaamattomissa jotain
-                    # muuta kuin None TAI self.vanhin on yhtä suuri kuin
-                    # self.seur.
-                    while ((not self.kuittaamattomat[self.vanhin]) and
-                           (self.vanhin != self.seur)):
-                        self.vanhin = (self.vanhin + 1) % self.max
-
-                # Tulostetaan vielä tilanne.
-                self.tulosta_ikkuna()
+            vanhin = self.vanhin
+            # Pelkkä ikkunan muutos ei ole tuplakuittaus.
+            paivitys = ikkuna is not None and ikkuna != self.vastott_ikkuna
+            if ikkuna is not None:
+                self.vastott_ikkuna = ikkuna
+            # Valikoiva kuittaus kuittaa kerralla kaikki paketit, jotka
+            # vastaanottaja on saanut.
+            if liput & luotettavuus.LIPPU_SACK:
+                kuitatut = self.sack_kuitatut(sekvno, kartta)
+            # Tavallinen kuittaus kuittaa yhden paketin. Jos
+            # sekvenssinumero ei ole lähetysikkunan sisällä, ei tehdä
+            # mitään.
+            elif self.onko_ikkunassa(self.vanhin, self.vanhin+self.ikkuna,
+                                     self.max, sekvno):
+                kuitatut = [sekvno]
+            else:
+                kuitatut = []
+            self.merkitse_kuitatuiksi(kuitatut)
+
+            # Jos vanhin paketti on edelleen kuittaamatta, vaikka
+            # vastaanottaja kertoo saaneensa myöhempiä paketteja, se on
+            # luultavasti kadonnut. Tällainen kuittaus vastaa
+            # Go back N:n tuplakuittausta, ja self.tuplaraja kuittauksen
+            # jälkeen vanhin paketti lähetetään uudelleen heti.
+            if self.vanhin != vanhin:
+                self.tuplakuittaukset = 0
+            elif (liput & luotettavuus.LIPPU_SACK and
+                  self.vanhin != self.seur and
+                  sekvno == (self.vanhin - 1) % self.max and
+                  any(kartta) and not paivitys):
+                self.tuplakuittaukset += 1
+                if self.tuplakuittaukset == self.tuplaraja:
+                    self.ruuhka.menetys((self.seur - self.vanhin) % self.max,
+                                        self.lahetetyt)
+                    print('(Tuplakuittauksia {}. Ruuhkaikkuna on nyt {}.)'.\
+                          format(self.tuplakuittaukset, self.ruuhka.ikkuna))
+                    self.kaynnista_ajastin(self.vanhin)
+                    nopea_uudelleenlahetys = self.vanhin
+
+            self.paivita_koetin()
+            # Herätetään lähettämistä odottavat, sillä ikkunassa voi olla
+            # nyt tilaa.
+            self.tilaa.notify_all()
+
+            # Tulostetaan vielä tilanne.
+            self.tulosta_ikkuna()
+
+        # Uudelleenlähetys tehdään lukon ulkopuolella, koska
+        # laheta_uudestaan() ottaa lukon itse.
+        if nopea_uudelleenlahetys is not None:
+            self.laheta_uudestaan(nopea_uudelleenlahetys)
+
+
+    def sack_kuitatut(self, kumulatiivinen, kartta):
+        '''Palauttaa listan lähetysikkunan paketeista, jotka valikoiva
+        kuittaus kuittaa. Kaikki sekvenssinumeroon kumulatiivinen asti on
+        vastaanotettu, ja bittikartan bitti d kertoo, onko numero
+        kumulatiivinen + 1 + d vastaanotettu. Kutsujalla on oltava
+        self.lukko.'''
+        odottavat = (self.seur - self.vanhin) % self.max
+        # Kuinka monta lähetysikkunan alusta kuitataan kumulatiivisesti?
+        kumul = (kumulatiivinen + 1 - self.vanhin) % self.max
+        if kumul > odottavat:
+            # Vanhentunut kuittaus: vastaanottajan ikkuna on lähettäjän
+            # ikkunaa jäljessä.
+            return []
+        bitit = int.from_bytes(kartta, byteorder='big')
+        kuitatut = []
+        for j in range(odottavat):
+            if j < kumul or (bitit >> (j - kumul)) & 1:
+                kuitatut.append((self.vanhin + j) % self.max)
+        return kuitatut
+
+
+    def merkitse_kuitatuiksi(self, kuitatut):
+        '''Pysäyttää kuitattujen pakettien ajastimet, kirjaa paketit
+        kuitatuiksi ja päivittää kiertoviiveen arvion ja self.vanhin-
+        attribuutin. Kutsujalla on oltava self.lukko.'''
+        uusia = 0
+        mitattu = None
+        for sekvno in kuitatut:
+            lahetys = self.kuittaamattomat.hae(sekvno)
+            # Jo aiemmin kuitattu ja varattu mutta vielä lähettämätön
+            # paketti ohitetaan.
+            if lahetys is None or lahetys.kuitattu or lahetys.paketti is None:
+                continue
+            uusia += 1
+            lahetys.ajastin.cancel()
+            lahetys.kuitattu = True
+            # Kiertoviive mitataan uusimmasta kuitatusta paketista, joka on
+            # lähetetty vain kerran. Se on todennäköisimmin paketti, jonka
+            # saapuminen aiheutti kuittauksen.
+            if lahetys.lahetetty is not None:
+                mitattu = lahetys.lahetetty
+                lahetys.lahetetty = None
+        if mitattu is not None:
+            self.rtt.mittaus(time.monotonic() - mitattu)
+        elif uusia:
+            self.rtt.kuitattu()
+        if uusia:
+            self.ruuhka.kuitattu(uusia)
+
+        # Poistetaan lähetysikkunan alusta kuitatut paketit ja kasvatetaan
+        # self.vanhin-attribuuttia yhtä monella, jolloin sen kohdalla on
+        # kuittaamaton paketti TAI self.vanhin on yhtä suuri kuin
+        # self.seur.
+        poistettavat = 0
+        for lahetys in self.kuittaamattomat:
+            if not lahetys.kuitattu:
+                break
+            poistettavat += 1
+        self.kuittaamattomat.poista(poistettavat)
+        self.vanhin = (self.vanhin + poistettavat) % self.max
 
                         
     def voiko_lahettaa(self):
         '''Palauttaa tiedon, onko lähettäminen mahdollista.'''
         with self.lukko:
             self.tulosta_ikkuna()
-            return self.onko_ikkunassa(self.vanhin, self.vanhin+self.ikkuna,
-                                       self.max, self.seur)
+            return self.mahtuuko()
+
+
+    def mahtuuko(self):
+        '''Kuten voiko_lahettaa(), mutta kutsujalla on oltava self.lukko.
+        Tämä ei tulosta ikkunaa, joten sitä voi kutsua toistuvasti.'''
+        ikkuna = min(self.ikkuna, self.ruuhka.ikkuna, self.vastott_ikkuna)
+        return self.onko_ikkunassa(self.vanhin, self.vanhin+ikkuna,
+                                   self.max, self.seur)
+
+
+    def vapaat_paikat(self):
+        '''Palauttaa, montako pakettia ikkunaan vielä mahtuu. Kutsujalla
+        on oltava self.lukko.'''
+        ikkuna = min(self.ikkuna, self.ruuhka.ikkuna, self.vastott_ikkuna)
+        return max(0, ikkuna - (self.seur - self.vanhin) % self.max)
+
+
+    def odota_tilaa(self, aikaraja=None):
+        '''Odottaa, kunnes lähetysikkunassa on tilaa, kuitenkin enintään
+        aikaraja sekuntia (None: rajatta). Palauttaa True, jos tilaa on.
+        Metodi palaa heti, jos tilaa on jo, ja muuten heti, kun kuittaus
+        vapauttaa ikkunasta tilaa. Myös lopeta() herättää odottajan.'''
+        with self.tilaa:
+            self.tilaa.wait_for(lambda: self.loppu or self.mahtuuko(),
+                                aikaraja)
+            return not self.loppu and self.mahtuuko()
+
+
+    def laheta_odottaen(self, data, aikaraja=None):
+        '''Lähettää merkkijonon tai tavumuotoisen viestin kuten
+        laheta_koottuna(), mutta odottaa tilaa ikkunassa enintään
+        aikaraja sekuntia (None: rajatta). Palauttaa True, kun viesti on
+        lähetetty, ja False, jos tilaa ei tullut ajoissa. Silloin mitään
+        ei lähetetty. Kun viestin ensimmäinen osa on lähetetty, muille
+        osille odotetaan tilaa rajatta, jotta viesti ei jää kesken.'''
+        if isinstance(data, str):
+            data = data.encode('utf8')
+        with self.kokoamislukko:
+            if not self.odota_tilaa(aikaraja):
+                return False
+            self.laheta_kootut()
+            self.laheta_viesti(data)
+        return True
+
+
+    # Englanninkielinen nimi sokettien send()-metodin tapaan.
+    send = laheta_odottaen
         
     
     def laheta_sr(self, mjono):
         '''Merkkijonon lähettäminen selective repeat -protokollan mukaisesti.'''
-        # Ennen lähettämistä varaudutaan mahdollisiin uudelleenlähetyksiin:
-        # valmistellaan paketti (sekvenssinumero ja tarkistussumma mukaan)
-        # ja lisätään se kuittaamattomien joukkoon.
+        self.laheta_bytes(mjono.encode('utf8'))
+
+
+    def laheta_viesti(self, viesti):
+        '''Lähettää merkkijonon tai tavumuotoisen viestin, joka voi olla
+        pidempi kuin yhteen pakettiin mahtuu. Viesti jaetaan osiin, ja
+        muissa kuin viimeisessä osassa on lippu LIPPU_JATKUU.
+        Vastaanottaja kokoaa osat takaisin yhdeksi viestiksi. Metodi
+        odottaa tarvittaessa, että ikkunassa on tilaa.'''
+        if isinstance(viesti, str):
+            viesti = viesti.encode('utf8')
+        osat = self.pilko(viesti)
+        if self.gso and len(osat) > 1:
+            self.laheta_erina(osat)
+            return
+        for i, osa in enumerate(osat):
+            liput = luotettavuus.LIPPU_JATKUU if i < len(osat)-1 else 0
+            self.odota_tilaa()
+            self.laheta_bytes(osa, liput)
+
+
+    def laheta_erina(self, osat):
+        '''Lähettää viestin osat kuten laheta_viesti(), mutta kerralla niin
+        monta kuin ikkunaan mahtuu. Erän paketit kirjoitetaan ikkunan
+        paikkoihin ja lähetetään yhdellä laheta_monta()-kutsulla, joten
+        GSO:ta käytettäessä (self.gso) ne kulkevat ytimeen yhtenä
+        puskurina. Kaikki paitsi viimeinen osa ovat täysiä, joten erän
+        paketit ovat yhtä suuria viimeistä lukuun ottamatta.'''
+        i = 0
+        while i < len(osat):
+            if not self.odota_tilaa():
+                return
+            # Sekvenssinumerot ja lähetysikkunan paikat varataan lukon alla
+            # kuten laheta_bytes()-metodissa, ja paketit valmistellaan
+            # varattuihin paikkoihin lukon ulkopuolella.
+            with self.lukko:
+                varatut = []
+                for _ in range(min(self.vapaat_paikat(), len(osat) - i)):
+                    varatut.append(self.kuittaamattomat.varaa(self.seur))
+                    self.seur = (self.seur + 1) % self.max
+                    self.lahetetyt += 1
+            if not varatut:
+                continue
+            # Erän tarkistussummat lasketaan yhdellä kutsulla.
+            liput = [luotettavuus.LIPPU_JATKUU if i + k < len(osat)-1 else 0
+                     for k in range(len(varatut))]
+            era = self.kirjoita_paketit(
+                [lahetys.puskuri for lahetys in varatut],
+                [lahetys.sekvno for lahetys in varatut],
+                osat[i:i+len(varatut)], liput)
+            with self.lukko:
+                nyt = time.monotonic()
+                for lahetys, lahteva in zip(varatut, era):
+                    lahetys.paketti = lahteva
+                    lahetys.lahetetty = nyt
+                    self.kaynnista_ajastin(lahetys.sekvno)
+                self.laheta_monta(era, self.vastott)
+                print('(Lähetetty erä, sekvenssinumerot {}-{}.)\n'.format(
+                    varatut[0].sekvno, varatut[-1].sekvno))
+            i += len(era)
+
+
+    def laheta_koottuna(self, viesti):
+        '''Lähettää merkkijonon tai tavumuotoisen viestin niin, että
+        peräkkäiset pienet viestit kootaan samaan pakettiin. Paketti
+        lähetetään, kun se on täynnä tai kun ensimmäistä viestiä on
+        pidätetty self.kokoamisaika sekuntia. Kokoamista käytettäessä
+        kaikki viestit on lähetettävä tämän metodin kautta, jotta niiden
+        järjestys säilyy.'''
+        if isinstance(viesti, str):
+            viesti = viesti.encode('utf8')
+        tietue = luotettavuus.TIETUE.size + len(viesti)
+        with self.kokoamislukko:
+            # Jos kokoaminen ei ole käytössä tai viesti ei mahdu yhteen
+            # pakettiin, lähetetään ensin jo kootut ja sitten viesti.
+            if not self.kokoamisaika or tietue > self.kuorman_koko():
+                self.laheta_kootut()
+                self.laheta_viesti(viesti)
+                return
+            if len(self.kootut) + tietue > self.kuorman_koko():
+                self.laheta_kootut()
+            self.kootut += luotettavuus.TIETUE.pack(len(viesti))
+            self.kootut += viesti
+            if self.kokoamisajastin is None:
+                self.kokoamisajastin = self.silmukka.ajasta(
+                    self.kokoamisaika, self.kokoamisaika_kulunut)
+
+
+    def kokoamisaika_kulunut(self):
+        '''Tapahtumasilmukka kutsuu tätä, kun kootut viestit on
+        lähetettävä. Silmukan säie ei saa jäädä odottamaan lukkoa eikä
+        tilaa ikkunassa, koska sama säie käsittelee kuittaukset, jotka
+        vapauttavat ikkunaa. Jos lähettäminen ei juuri nyt onnistu,
+        yritetään hetken päästä uudestaan.'''
+        if self.kokoamislukko.acquire(blocking=False):
+            try:
+                with self.lukko:
+                    mahtuu = self.mahtuuko()
+                if not self.kootut or mahtuu:
+                    self.laheta_kootut()
+                    return
+            finally:
+                self.kokoamislukko.release()
+        self.kokoamisajastin = self.silmukka.ajasta(
+            self.odotusaika, self.kokoamisaika_kulunut)
+
+
+    def tyhjenna(self):
+        '''Lähettää kootut viestit odottamatta kokoamisajan päättymistä.'''
+        with self.kokoamislukko:
+            self.laheta_kootut()
+
+
+    def laheta_kootut(self):
+        '''Lähettää kootut viestit yhtenä pakettina. Kutsujalla on oltava
+        self.kokoamislukko.'''
+        if self.kokoamisajastin:
+            self.kokoamisajastin.cancel()
+            self.kokoamisajastin = None
+        if not self.kootut:
+            return
+        self.odota_tilaa()
+        self.laheta_bytes(self.kootut, luotettavuus.LIPPU_KOOTTU)
+        self.kootut = bytearray()
+
+
+    def laheta_bytes(self, data, liput=0):
+        '''Tavumuotoisen datan (bytes, bytearray, memoryview) lähettäminen
+        selective repeat -protokollan mukaisesti. Data kopioidaan
+        pakettiin, joten kutsuja voi käyttää puskuriaan uudelleen heti
+        paluun jälkeen. Jos ikkunassa ei ole tilaa, odotetaan kuten
+        metodissa odota_tilaa(). Jos lähettäjä lopetetaan odotuksen
+        aikana, mitään ei lähetetä.'''
+        # Ennen lähettämistä varaudutaan mahdollisiin uudelleenlähetyksiin.
+        # Ensin varataan lukon alla sekvenssinumero ja lähetysikkunan
+        # paikka, ja vasta sitten paketti valmistellaan (sekvenssinumero
+        # ja tarkistussumma mukaan) paikan puskuriin. Näin täyden ikkunan
+        # vanhinta, ehkä vielä uudelleen lähetettävää pakettia ei
+        # kirjoiteta yli. Valmistelu tehdään lukon ulkopuolella, sillä
+        # varattua paikkaa ei käytä kukaan muu.
+        while True:
+            with self.lukko:
+                if self.loppu:
+                    return
+                if self.mahtuuko():
+                    sekvno = self.seur
+                    lahetys = self.kuittaamattomat.varaa(sekvno)
+                    self.seur = (self.seur + 1) % self.max
+                    self.lahetetyt += 1
+                    break
+            self.odota_tilaa()
+        lahteva = self.kirjoita_paketti(lahetys.puskuri, sekvno, data, liput)
         with self.lukko:
-            lahteva = self.valm_paketti(self.seur, mjono)
-            self.kuittaamattomat[self.seur] = lahteva
+            lahetys.paketti = lahteva
+            lahetys.lahetetty = time.monotonic()
             # Lähetetään ja käynnistetään ajastin.
             self.laheta(lahteva, self.vastott)
-            self.kaynnista_ajastin(self.seur)
-            print('(Lähetetty, sekvenssinumero {}.)\n'.format(self.seur))
-            self.seur = (self.seur + 1) % self.max
+            self.kaynnista_ajastin(sekvno)
+            print('(Lähetetty, sekvenssinumero {}.)\n'.format(sekvno))
 
         
     def kaynnista_ajastin(self, indeksi):
-        '''Nollaa ja käynnistää ajastimen uudestaan.'''
+        '''Nollaa ja käynnistää ajastimen uudestaan. Kutsujalla on oltava
+        self.lukko.'''
+        lahetys = self.kuittaamattomat.hae(indeksi)
+        if lahetys is None or lahetys.kuitattu or lahetys.paketti is None:
+            return
         # Otetaan huomioon, että ensimmäisellä kerralla ajastin on None,
         # jolloin sillä ei ole cancel()-metodia.
-        ajastin = self.ajastimet[indeksi]
-        if ajastin:
-            ajastin.cancel()
-        # Tehdään uusi ajastin ja käynnistetään se.
-        ajastin = thrd.Timer(self.aika, function=self.timeout, args=[indeksi])
-        self.ajastimet[indeksi] = ajastin
-        ajastin.start()
+        if lahetys.ajastin:
+            lahetys.ajastin.cancel()
+        # Ajastetaan uusi aikakatkaisu.
+        lahetys.ajastin = self.silmukka.ajasta(
+            self.rtt.rto, self.timeout, (indeksi,))
 
         
     def timeout(self, indeksi):
         '''Ajastimen aikakatkaisu: ajastin uudelleen käyntiin
         ja paketin uudelleenlähetys.'''
-        print('(Aikakatkaisu!)')
-        self.kaynnista_ajastin(indeksi)
+        # Jokaisella paketilla on oma ajastimensa, mutta RTO on yhteinen.
+        # Jotta yksi katoamisjakso ei kaksinkertaistaisi RTO:ta monta
+        # kertaa, se kaksinkertaistetaan vain vanhimman kuittaamattoman
+        # paketin aikakatkaisussa. Samasta syystä myös ruuhkaikkuna
+        # pienennetään vain silloin.
+        with self.lukko:
+            # Paketti on voitu kuitata sen jälkeen, kun ajastin laukesi
+            # mutta ennen kuin lukko saatiin. Silloin ei tehdä mitään.
+            lahetys = self.kuittaamattomat.hae(indeksi)
+            if lahetys is None or lahetys.kuitattu or lahetys.paketti is None:
+                return
+            if indeksi == self.vanhin:
+                self.rtt.aikakatkaisu()
+                self.ruuhka.aikakatkaisu(
+                    (self.seur - self.vanhin) % self.max, self.lahetetyt)
+            self.kaynnista_ajastin(indeksi)
+            rto, ikkuna = self.rtt.rto, self.ruuhka.ikkuna
+        print('(Aikakatkaisu! Ajastimen aika on nyt {:.3f} s. '.\
+              format(rto) + 'Ruuhkaikkuna on nyt {}.)'.format(ikkuna))
         self.laheta_uudestaan(indeksi)
 
     
     def laheta_uudestaan(self, indeksi):
         '''Lähettää indeksillä varustetun paketin uudestaan.'''
-        print('(Lähetetään uudelleen paketti {}.)'.format(indeksi))
-        self.laheta(self.kuittaamattomat[indeksi], self.vastott)    
+        # Paketti lähetetään lukon alla kuten laheta_bytes()-metodissa,
+        # jotta sen paikkaa ei vapauteta ja käytetä uudelleen kesken
+        # lähettämisen.
+        with self.lukko:
+            lahetys = self.kuittaamattomat.hae(indeksi)
+            if (lahetys is None or lahetys.kuitattu or
+                lahetys.paketti is None):
+                return
+            print('(Lähetetään uudelleen paketti {}.)'.format(indeksi))
+            lahetys.lahetetty = None
+            lahetys.uudelleen += 1
+            self.laheta(lahetys.paketti, self.vastott)
+
+
+    def paivita_koetin(self):
+        '''Käynnistää koettelun, jos vastaanottajan ikkuna on nolla eikä
+        kuittaamattomia paketteja ole, ja muuten pysäyttää sen.
+        Kutsujalla on oltava self.lukko.'''
+        if self.vastott_ikkuna == 0 and self.vanhin == self.seur:
+            if self.koetin is None:
+                self.koetin = self.silmukka.ajasta(self.rtt.rto,
+                                                   self.koettele)
+        elif self.koetin is not None:
+            self.koetin.cancel()
+            self.koetin = None
+            self.koettelut = 0
+
+
+    def koettele(self):
+        '''Lähettää ikkunakoettimen: tyhjän paketin, jonka sekvenssinumero
+        on jo kuitattu. Vastaanottaja kuittaa sen, joten kuittauksesta
+        saadaan ikkunan nykyinen koko. Koettelujen väli kaksinkertaistuu
+        kuten ajastimen aika aikakatkaisuissa.'''
+        with self.lukko:
+            if (self.loppu or self.vastott_ikkuna != 0 or
+                self.vanhin != self.seur):
+                self.koetin = None
+                self.koettelut = 0
+                return
+            koetin = self.valm_paketti((self.vanhin - 1) % self.max, b'')
+            self.koettelut += 1
+            self.koetin = self.silmukka.ajasta(
+                self.rtt.rajaa(self.rtt.rto * 2**self.koettelut),
+                self.koettele)
+        print('(Vastaanottajan ikkuna on nolla. Lähetetään ikkunakoetin.)')
+        self.laheta(koetin, self.vastott)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import collections
+import eraio
+import luotettavuus
+import luotettavuus_vastott
+import puskuriallas
+import socket as s
+import time
+
+
+class Luottopalvelin:
+    '''Usean lähettäjän vastaanottaja.
+
+    Luottovastaanottaja pitää yllä yhden yhteyden tilaa ja kuittaa
+    viimeisimmälle lähettäjälle, joten kahden samaan porttiin lähettävän
+    lähettäjän sekvenssinumerot sotkeutuisivat. Palvelin erottelee paketit
+    lähettäjän osoitteen mukaan ja käsittelee ne osoitekohtaisilla
+    Luottovastaanottaja-olioilla, jotka luodaan ensimmäisen paketin
+    saapuessa. Kaikki yhteydet käyttävät samaa sokettia ja samaa
+    puskuriallasta.
+
+    Yhteys poistetaan, kun siltä ei ole saapunut paketteja joutoaika
+    sekuntiin. Joutoajan on oltava pidempi kuin lähettäjän suurin
+    uudelleenlähetysajastus (rtt.Rttarvio, 60 s), koska poistetun yhteyden
+    tila katoaa eikä kesken jäänyt siirto voi jatkua. Yhteydet pidetään
+    viimeisimmän paketin mukaisessa järjestyksessä (OrderedDict), joten
+    vanhentuneet löytyvät alusta käymättä kaikkia yhteyksiä läpi.
+
+    Puskuroitujen tavujen yhteismäärä (altaasta lainassa olevat puskurit
+    ja koottavina olevat viestit) rajoitetaan tavurajaan. Kun raja on
+    täynnä, hyväksytään vain paketit, joilla on yhteyden odottama
+    sekvenssinumero ja jotka voidaan siis palauttaa sovellukselle heti.
+    Muut hylätään kuittaamatta, ja lähettäjä lähettää ne myöhemmin
+    uudelleen. Muuten ikkunoissa odottavat paketit voisivat täyttää rajan
+    pysyvästi.
+    '''
+
+    def __init__(self, soketti, puskurin_koko, joutoaika=120, tavuraja=2**24,
+                 **asetukset):
+        self.soketti = soketti
+        self.puskurin_koko = puskurin_koko
+        self.joutoaika = joutoaika
+        self.tavuraja = tavuraja
+        # Vastaanottajille välitettävät asetukset (tarkistus, maksimi,
+        # jonon_koko ym.).
+        self.asetukset = asetukset
+        # Altaassa säilytetään enintään 256 vapaata puskuria. Loput
+        # varataan tarvittaessa.
+        self.allas = puskuriallas.Puskuriallas(
+            puskurin_koko, min(256, max(1, tavuraja // puskurin_koko)))
+        self.yhteydet = collections.OrderedDict()  # Osoite ->
+                                                   # Luottovastaanottaja.
+        self.viimeksi = {}  # Osoite -> viimeisimmän paketin hetki.
+        self.kuittaamattomat = set()  # Yhteydet, joilla on viivästetty
+                                      # kuittaus odottamassa.
+        self.koottavana = 0  # Koottavina olevien viestien tavumäärä.
+        # Luetaanko useita paketteja kerralla, kun se on mahdollista
+        # (moduuli eraio), ja näin luetut paketit, joita ei ole vielä
+        # käsitelty.
+        self.erasiirto = True
+        self.saapuneet = collections.deque()
+        # Paketit tarkastetaan ennen kuin ne ohjataan yhteyksille, jotta
+        # virheellinen paketti ei luo uutta yhteyttä. Tarkastus ei riipu
+        # yhteyden tilasta, joten kaikille yhteyksille riittää yksi olio
+        # samalla tarkistussumma-asetuksella.
+        self.tarkastaja = luotettavuus.Luottokerros(
+            soketti, puskurin_koko, asetukset.get('tarkistus', 'crc8'))
+
+
+    def ota_vastaan(self):
+        '''Palauttaa monikon (lähettäjän osoite, lista viestejä
+        merkkijonoina), jos paketti toi valmiita viestejä. Muussa
+        tapauksessa paluuarvo on None.'''
+        tulos = self.ota_vastaan_bytes()
+        if tulos is None:
+            return None
+        lahettaja, datat = tulos
+        yhteys = self.yhteydet[lahettaja]
+        mjonot = []
+        for data in datat:
+            mjonot.append(yhteys.dekoodaa(data))
+            self.vapauta(lahettaja, data)
+        return lahettaja, mjonot
+
+
+    def ota_vastaan_bytes(self):
+        '''Kuten ota_vastaan(), mutta viestit ovat memoryview-näkymiä
+        altaan puskureihin. Kun viestiä ei enää tarvita, se palautetaan
+        metodilla vapauta().'''
+        if not self.saapuneet:
+            puskuri = self.allas.varaa()
+            pituus, lahettaja = self.lue_paketti(puskuri)
+            self.saapuneet.append((puskuri, pituus, lahettaja))
+            if self.erasiirto and eraio.tukee(self.soketti, 'recvfrom_into'):
+                maara = min(eraio.ERA, len(self.allas.vapaat))
+                self.saapuneet.extend(
+                    eraio.lue_altaaseen(self.soketti, self.allas, maara))
+            self.tarkasta_saapuneet()
+        puskuri, pituus, lahettaja, oikea = self.saapuneet.popleft()
+        yhteys = self.yhteydet.get(lahettaja)
+        # Uusi yhteys luodaan vain virheettömästä datapaketista.
+        if yhteys is None and not (
+                oikea and not self.tarkastaja.lue_otsake(puskuri)[1] &
+                luotettavuus.LIPPU_ACK):
+            print('(Virheellinen paketti tuntemattomalta lähettäjältä ' +\
+                  'hylättiin.)')
+            self.allas.vapauta(puskuri)
+            return None
+        if (self.puskuroitu() > self.tavuraja and
+            not self.odotettu(yhteys, puskuri, pituus)):
+            print('(Puskuriraja täynnä, paketti hylättiin.)')
+            self.allas.vapauta(puskuri)
+            return None
+        if yhteys is None:
+            yhteys = luotettavuus_vastott.Luottovastaanottaja(
+                self.soketti, self.puskurin_koko, allas=self.allas,
+                **self.asetukset)
+            self.yhteydet[lahettaja] = yhteys
+            print('(Uusi yhteys {}.)'.format(lahettaja))
+        else:
+            self.yhteydet.move_to_end(lahettaja)
+        self.viimeksi[lahettaja] = time.monotonic()
+
+        ennen = len(yhteys.kokoamaton)
+        viestit = yhteys.kasittele_paketti(puskuri, pituus, lahettaja,
+                                           oikea)
+        self.koottavana += len(yhteys.kokoamaton) - ennen
+        if yhteys.kuittaushetki is not None:
+            self.kuittaamattomat.add(lahettaja)
+        return (lahettaja, viestit) if viestit else None
+
+
+    def tarkasta_saapuneet(self):
+        '''Tarkastaa jonon self.saapuneet paketit yhdellä
+        tarkasta_monta()-kutsulla ja liittää tuloksen jokaisen paketin
+        tietoihin (vrt. Luottovastaanottaja.tarkasta_saapuneet()).'''
+        paketit = [memoryview(puskuri)[:pituus]
+                   for puskuri, pituus, _ in self.saapuneet]
+        oikeat = self.tarkastaja.tarkasta_monta(paketit)
+        self.saapuneet = collections.deque(
+            (puskuri, pituus, lahettaja, oikea)
+            for (puskuri, pituus, lahettaja), oikea
+            in zip(self.saapuneet, oikeat))
+
+
+    def vapauta(self, lahettaja, data):
+        '''Palauttaa lähettäjältä saadun viestin puskurin altaaseen (ks.
+        Luottovastaanottaja.vapauta()). Poistetun yhteyden viestin
+        puskuri palautetaan suoraan altaaseen.'''
+        yhteys = self.yhteydet.get(lahettaja)
+        if yhteys is None:
+            self.allas.vapauta(data.obj)
+        else:
+            yhteys.vapauta(data)
+
+
+    def odotettu(self, yhteys, puskuri, pituus):
+        '''Palauttaa True, jos paketilla on yhteyden odottama
+        sekvenssinumero. Tarkistussummaa ei tässä tarkasteta.'''
+        return (yhteys is not None and pituus >= luotettavuus.OTSAKE.size and
+                yhteys.lue_otsake(puskuri)[3] == yhteys.vanhin)
+
+
+    def puskuroitu(self):
+        '''Palauttaa puskuroitujen tavujen määrän.'''
+        return self.allas.lainassa * self.puskurin_koko + self.koottavana
+
+
+    def lue_paketti(self, puskuri):
+        '''Lukee paketin puskuriin ja palauttaa paketin pituuden ja
+        lähettäjän. Pakettia odotettaessa lähetetään erääntyneet
+        viivästetyt kuittaukset ja poistetaan joutilaat yhteydet.'''
+        aikaraja = self.soketti.gettimeout()
+        try:
+            while True:
+                self.soketti.settimeout(self.hoida_ajastetut())
+                try:
+                    return self.soketti.recvfrom_into(puskuri,
+                                                      self.puskurin_koko)
+                # Aikaraja 0 tekee soketista estämättömän.
+                except (s.timeout, BlockingIOError):
+                    pass
+        finally:
+            self.soketti.settimeout(aikaraja)
+
+
+    def hoida_ajastetut(self):
+        '''Lähettää erääntyneet viivästetyt kuittaukset ja poistaa
+        joutilaat yhteydet. Palauttaa ajan seuraavaan tällaiseen
+        tapahtumaan sekunteina tai None, jos yhteyksiä ei ole.'''
+        nyt = time.monotonic()
+        odotus = None
+        for osoite in list(self.kuittaamattomat):
+            yhteys = self.yhteydet[osoite]
+            if yhteys.kuittaushetki is None:
+                self.kuittaamattomat.discard(osoite)
+            elif yhteys.kuittaushetki <= nyt:
+                yhteys.kuittaa(yhteys.kuittauksen_vastott)
+                self.kuittaamattomat.discard(osoite)
+            elif odotus is None or yhteys.kuittaushetki - nyt < odotus:
+                odotus = yhteys.kuittaushetki - nyt
+        self.karsi(nyt)
+        if self.yhteydet:
+            vanhin = next(iter(self.yhteydet))
+            poisto = self.viimeksi[vanhin] + self.joutoaika - nyt
+            odotus = poisto if odotus is None else min(odotus, poisto)
+        return None if odotus is None else max(0, odotus)
+
+
+    def karsi(self, nyt):
+        '''Poistaa yhteydet, joilta ei ole saapunut paketteja joutoaika
+        sekuntiin.'''
+        while self.yhteydet:
+            osoite = next(iter(self.yhteydet))
+            if nyt - self.viimeksi[osoite] < self.joutoaika:
+                break
+            self.poista(osoite)
+
+
+    def poista(self, osoite):
+        '''Poistaa yhteyden tilan. Sovellukselle jo palautetut viestit
+        vapautetaan edelleen metodilla vapauta().'''
+        yhteys = self.yhteydet.pop(osoite)
+        del self.viimeksi[osoite]
+        self.kuittaamattomat.discard(osoite)
+        self.koottavana -= len(yhteys.kokoamaton)
+        # Vastaanottoikkunassa odottavat paketit palautetaan altaaseen.
+        for saapunut in yhteys.puskuri:
+            if saapunut is not None:
+                self.allas.vapauta(saapunut[0].obj)
+        print('(Yhteys {} poistettu.)'.format(osoite))
@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 
+import collections
+import eraio
 import luotettavuus
+import puskuriallas
+import socket as s
+import time
 
 
 class Luottovastaanottaja(luotettavuus.Luottokerros):
@@ -9,29 +14,174 @@ class Luottovastaanottaja(luotettavuus.Luottokerros):
     Luottovastaanottaja vastaa pakettien vastaanottamisesta
     selective repeat -algoritmin mukaisesti.
 
-    Bittivirheiden tarkastamisessa käytetään CRC 8 -algoritmia.
+    Bittivirheiden tarkastamisessa käytetään oletuksena CRC 8 -algoritmia.
     Polynomina on x**8 + x**3 + x**2 + x + 1, 
     bittimuodossa 100000111.
     '''
 
     
-    def __init__(self, soketti, puskurin_koko):
-        super().__init__(soketti, puskurin_koko)
-        self.kuittaukset = self.max*[None]
-        self.puskuri = self.max*[None]
+    def __init__(self, soketti, puskurin_koko, tarkistus='crc8', ikkuna=4,
+                 maksimi=9, kuittausvali=1, kuittausviive=0.05,
+                 jonon_koko=None, allas=None):
+        super().__init__(soketti, puskurin_koko, tarkistus, ikkuna, maksimi)
+        # Vastaanottopuskuri on rengas, jossa on paikka jokaista
+        # vastaanottoikkunan sekvenssinumeroa kohti. Sekvenssinumeron
+        # paikka riippuu sen etäisyydestä numerosta self.vanhin (ks.
+        # paikka()), joten puskurin koko ei riipu sekvenssinumeroiden
+        # määrästä. Paikassa on pari (data, otsakkeen liput) tai None.
+        self.puskuri = self.ikkuna*[None]
+        self.alku = 0  # Numeron self.vanhin paikka.
+        # Osissa saapuvan viestin jo vastaanotetut osat.
+        self.kokoamaton = bytearray()
+        # Viivästetyt kuittaukset: kuittaus lähetetään vasta joka
+        # self.kuittausvali. järjestyksessä saapuneesta paketista tai
+        # viimeistään self.kuittausviive sekunnin kuluttua. Väärässä
+        # järjestyksessä saapunut paketti kuitataan aina heti. Arvolla
+        # kuittausvali=1 jokainen paketti kuitataan heti.
+        self.kuittausvali = kuittausvali
+        self.kuittausviive = kuittausviive
+        self.kuittaamatta = 0  # Kuittaamattomien pakettien määrä.
+        self.kuittaushetki = None  # Hetki (time.monotonic()), jolloin
+                                   # odottava kuittaus on lähetettävä.
+        self.kuittauksen_vastott = None
+        # Eräsiirrolla luetut paketit, joita ei ole vielä käsitelty.
+        self.saapuneet = collections.deque()
+        # Vastaanoton yhdistäminen (GRO), ks. kayta_gro().
+        self.gro = False
+        self.gro_puskuri = None
+        # Paketit luetaan altaasta otettuihin puskureihin. Hyväksytyn
+        # paketin puskuri palautetaan altaaseen vasta, kun sovellus kutsuu
+        # metodia vapauta(). Vastaanottoikkunassa voi odottaa enintään
+        # self.ikkuna pakettia. Useat vastaanottajat voivat käyttää
+        # yhteistä allasta (ks. luotettavuus_palvelin.py).
+        if jonon_koko is None:
+            jonon_koko = 2*self.ikkuna
+        if allas is None:
+            allas = puskuriallas.Puskuriallas(puskurin_koko, jonon_koko)
+        self.allas = allas
+        # Vuonohjaus: jokaisessa kuittauksessa ilmoitetaan lähettäjälle,
+        # kuinka monta uutta pakettia vastaanottaja ottaa vastaan. Puskureita
+        # on self.jonon_koko, ja niitä käyttävät sekä vastaanottoikkunassa
+        # odottavat paketit että viestit, jotka on palautettu sovellukselle
+        # mutta joita se ei ole vielä vapauttanut. Ikkunassa odottavat
+        # paketit ovat lähettäjän ikkunan sisällä, joten ilmoitettua
+        # ikkunaa pienentävät vain sovelluksella olevat viestit.
+        self.jonon_koko = jonon_koko
+        self.sovelluksella = 0  # Vapauttamattomien viestien määrä.
+        self.ilmoitettu = None  # Viimeksi ilmoitettu ikkuna.
+        self.vastapuoli = None  # Viimeksi kuitattu lähettäjä.
         # self.vanhin,
         # self.ikkuna ja
         # self.max peritään kantaluokasta.
 
 
     def ota_vastaan(self):
-        '''Palauttaa viestin merkkijonona, jos viestillä on oikea
-        sekvenssinumero eikä siinä ole bittivirheitä. Muussa tapauksessa
-        paluuarvo on None.'''
+        '''Palauttaa listan järjestyksessä olevia, kokonaan vastaanotettuja
+        viestejä merkkijonoina, jos viestillä on oikea sekvenssinumero eikä
+        siinä ole bittivirheitä. Muussa tapauksessa paluuarvo on None.'''
+        datat = self.ota_vastaan_bytes()
+        if datat is None:
+            return None
+        mjonot = []
+        for data in datat:
+            mjonot.append(self.dekoodaa(data))
+            self.vapauta(data)
+        return mjonot
+
+
+    def ota_vastaan_bytes(self):
+        '''Kuten ota_vastaan(), mutta viestit ovat memoryview-näkymiä
+        altaan puskureihin. Kun viestiä ei enää tarvita, se palautetaan
+        metodilla vapauta().'''
         self.tulosta_ikkuna()
-        saapunut, lahettaja = self.soketti.recvfrom(self.puskurin_koko)
-        crc_ok = self.tarkasta(saapunut)
+        if not self.saapuneet:
+            if self.gro:
+                self.lue_gro()
+            else:
+                puskuri = self.allas.varaa()
+                pituus, lahettaja = self.lue_paketti(puskuri)
+                self.saapuneet.append((puskuri, pituus, lahettaja))
+                self.lue_lisaa()
+            self.tarkasta_saapuneet()
+        return self.kasittele_paketti(*self.saapuneet.popleft())
+
+
+    def kayta_gro(self):
+        '''Ottaa käyttöön vastaanoton yhdistämisen (GRO, ks.
+        eraio.kayta_gro()): ydin voi yhdistää saman lähettäjän peräkkäiset
+        paketit, jotka luetaan silloin yhdellä järjestelmäkutsulla.
+        Hyödyllinen lähinnä, kun lähettäjä käyttää GSO:ta. Palauttaa
+        False, jos GRO ei ole käytettävissä.'''
+        if not eraio.kayta_gro(self.soketti):
+            return False
+        self.gro_puskuri = memoryview(bytearray(eraio.GRO_PUSKURI))
+        self.gro = True
+        return True
+
+
+    def lue_gro(self):
+        '''Lukee GRO-tilassa soketista yhden, mahdollisesti useasta
+        paketista yhdistetyn puskurillisen ja kopioi sen paketit altaan
+        puskureihin jonoon self.saapuneet. Eräsiirtoa (lue_lisaa()) ei
+        käytetä, koska yhdistetty paketti katkeaisi altaan puskuriin.'''
+        segmentit, lahettaja = self.lue_paketti(
+            self.gro_puskuri,
+            lambda puskuri: eraio.vastaanota_gro(self.soketti, puskuri))
+        for alku, pituus in segmentit:
+            puskuri = self.allas.varaa()
+            pituus = min(pituus, len(puskuri))
+            puskuri[:pituus] = self.gro_puskuri[alku:alku+pituus]
+            self.saapuneet.append((puskuri, pituus, lahettaja))
+
+
+    def lue_lisaa(self):
+        '''Lukee eräsiirrolla (moduuli eraio) soketista jo saapuneet
+        paketit jonoon self.saapuneet, jotta seuraavat
+        ota_vastaan_bytes()-kutsut eivät tarvitse järjestelmäkutsua.
+        Paketteja luetaan enintään niin monta kuin altaassa on vapaita
+        puskureita.'''
+        if self.erasiirto and eraio.tukee(self.soketti, 'recvfrom_into'):
+            maara = min(eraio.ERA, len(self.allas.vapaat))
+            if maara:
+                self.saapuneet.extend(
+                    eraio.lue_altaaseen(self.soketti, self.allas, maara))
+
+
+    def tarkasta_saapuneet(self):
+        '''Tarkastaa kaikki jonossa self.saapuneet olevat paketit yhdellä
+        tarkasta_monta()-kutsulla ja liittää tuloksen jokaisen paketin
+        tietoihin (ks. kasittele_paketti()).'''
+        paketit = [memoryview(puskuri)[:pituus]
+                   for puskuri, pituus, _ in self.saapuneet]
+        oikeat = self.tarkasta_monta(paketit)
+        self.saapuneet = collections.deque(
+            (puskuri, pituus, lahettaja, oikea)
+            for (puskuri, pituus, lahettaja), oikea
+            in zip(self.saapuneet, oikeat))
+
+
+    def kasittele_paketti(self, puskuri, pituus, lahettaja, oikea=None):
+        '''Käsittelee altaan puskuriin luetun paketin, jonka pituus on
+        pituus, ja palauttaa ota_vastaan_bytes()-metodin tavoin listan
+        viestejä tai None. Tämä on erotettu lukemisesta, jotta paketteja
+        voi syöttää myös muualta kuin soketista (esim. asyncio). Jos
+        paketti on jo tarkastettu (ks. tarkasta_saapuneet()), tulos
+        annetaan parametrina oikea.'''
+        saapunut = memoryview(puskuri)[:pituus]
+        if oikea is None:
+            oikea = self.tarkasta(saapunut)
+        crc_ok = (oikea and
+                  not self.lue_otsake(saapunut)[1] & luotettavuus.LIPPU_ACK)
+        # Bittivirheellisen paketin otsakkeeseen ei voi luottaa, joten
+        # sitä ei käsitellä pidemmälle.
+        if not crc_ok:
+            print('(Vastaanotettu virheellinen paketti: bittivirhe.)')
+            self.allas.vapauta(puskuri)
+            return None
         sekvno, data = self.pura(saapunut)
+        # Kuitataan samalla tarkistussumma-algoritmilla, jota lähettäjä
+        # käyttää.
+        self.sovi_tarkistus(saapunut)
 
         # Lasketaan valmiiksi tiedot siitä, onko sekvenssinumero ikkunassa.
         #
@@ -51,45 +201,182 @@ class Luottovastaanottaja(luotettavuus.Luottokerros):
         # Kolme vaihtoehtoa:
         #
         # Ei bittivirhettä, sekvenssinumero vastaanottoikkunan sisällä:
-        # kuitataan, tallennetaan data puskuriin ja palautetaan
-        # puskurin sisältöä, jos sekvno on yhtä suuri kuin self.vanhin.
+        # tallennetaan data puskuriin, palautetaan puskurin sisältöä, jos
+        # sekvno on yhtä suuri kuin self.vanhin, ja kuitataan.
         if (crc_ok and ikkunaehto1):
-            self.kuittaukset[sekvno] = self.valm_paketti(sekvno, 'ACK')
             print('(Vastaanotettu virheetön paketti, jonka ' +\
                   'sekvenssinumero on ikkunan sisällä.)')
-            self.kuittaa(sekvno, lahettaja)
-            self.puskuri[sekvno] = data
+            # Uudelleenlähetetty paketti voi olla jo puskurissa.
+            paikka = self.paikka(sekvno)
+            if self.puskuri[paikka] is None:
+                self.puskuri[paikka] = (data, self.lue_otsake(saapunut)[1])
+            else:
+                self.allas.vapauta(puskuri)
             if sekvno == self.vanhin:
-                return self.palauta_puskurista()
+                palautus = self.palauta_puskurista()
+                self.sovelluksella += len(palautus)
             else:
-                return None
+                palautus = None
+            # Kuittaus lähetetään vasta, kun self.vanhin on päivitetty,
+            # jotta se kattaa myös juuri saapuneen paketin. Jos paketti
+            # saapui väärässä järjestyksessä tai puskurissa on vielä
+            # aukkoja, kuitataan heti, jotta lähettäjä saa tiedon
+            # puuttuvista paketeista mahdollisimman pian.
+            aukko = any(tallennettu is not None
+                        for tallennettu in self.puskuri)
+            if palautus is not None and not aukko:
+                self.kuittaa_viivastetysti(lahettaja)
+            else:
+                self.kuittaa(lahettaja)
+            return palautus
         # Ei bittivrirhettä, mutta täytyy kuitata: kuitataan.
         elif (crc_ok and ikkunaehto2):
             print('Vastaanotettu virheetön paketti, jonka sekvenssinumero '+\
                     'ei ole ikkunan sisällä mutta joka vaatii kuittaamista.')
-            self.kuittaa(sekvno, lahettaja)
+            self.kuittaa(lahettaja)
+            self.allas.vapauta(puskuri)
             return None
         # Muut vaihtoehdot: ei tehdä mitään.
         else:
-            print('(Vastaanotettu virheellinen paketti: bittivirhe tai ' +\
-                  'väärä sekvenssinumero.)')
+            print('(Vastaanotettu paketti, jonka sekvenssinumero on ' +\
+                  'väärä.)')
+            self.allas.vapauta(puskuri)
             return None
 
         
-    def kuittaa(self, sekvno, vastott):
-        '''Lähettää kuittauksen.'''
-        self.laheta(self.kuittaukset[sekvno], vastott)
-        print('(Lähetetty kuittaus, sekvenssinumero {}.)'.format(sekvno))
+    def lue_paketti(self, puskuri, lue=None):
+        '''Lukee paketin puskuriin ja palauttaa paketin pituuden ja
+        lähettäjän. Jos kuittaus odottaa lähettämistä, pakettia odotetaan
+        enintään kuittausviiveen loppuun asti. Sen jälkeen kuittaus
+        lähetetään ja pakettia odotetaan edelleen. Paketti luetaan
+        funktiolla lue(puskuri), jonka paluuarvo palautetaan; oletuksena
+        käytetään soketin recvfrom_into()-metodia.'''
+        if lue is None:
+            lue = lambda puskuri: self.soketti.recvfrom_into(
+                puskuri, self.puskurin_koko)
+        while self.kuittaushetki is not None:
+            odotus = self.kuittaushetki - time.monotonic()
+            if odotus <= 0:
+                self.kuittaa(self.kuittauksen_vastott)
+                break
+            aikaraja = self.soketti.gettimeout()
+            self.soketti.settimeout(odotus)
+            try:
+                return lue(puskuri)
+            except s.timeout:
+                self.kuittaa(self.kuittauksen_vastott)
+            finally:
+                self.soketti.settimeout(aikaraja)
+        return lue(puskuri)
+
+
+    def kuittaa_viivastetysti(self, vastott):
+        '''Kuittaa järjestyksessä saapuneen paketin joko heti tai
+        myöhemmin (ks. self.kuittausvali ja self.kuittausviive).'''
+        self.kuittaamatta += 1
+        if self.kuittaamatta >= self.kuittausvali:
+            self.kuittaa(vastott)
+        elif self.kuittaushetki is None:
+            self.kuittaushetki = time.monotonic() + self.kuittausviive
+            self.kuittauksen_vastott = vastott
+
+
+    def kokoa(self, data, liput):
+        '''Liittää viestin osan koottavaan viestiin. Palauttaa valmiin
+        viestin tai None, jos viestistä puuttuu vielä osia. Yhdessä
+        paketissa tullut viesti palautetaan sellaisenaan, joten sitä ei
+        kopioida.'''
+        if liput & luotettavuus.LIPPU_JATKUU:
+            self.kokoamaton += data
+            self.allas.vapauta(data.obj)
+            return None
+        if not self.kokoamaton:
+            return data
+        self.kokoamaton += data
+        self.allas.vapauta(data.obj)
+        viesti = memoryview(self.kokoamaton)
+        self.kokoamaton = bytearray()
+        return viesti
+
+
+    def vapauta(self, data):
+        '''Palauttaa metodin ota_vastaan_bytes() palauttaman viestin
+        puskurin altaaseen. Jos lähettäjälle on ilmoitettu, että ikkuna
+        on nolla, ilmoitetaan samalla, että tilaa on taas.'''
+        self.allas.vapauta(data.obj)
+        self.sovelluksella = max(0, self.sovelluksella - 1)
+        if (self.ilmoitettu == 0 and self.ilmoitettava_ikkuna() > 0 and
+            self.vastapuoli is not None):
+            self.kuittaa(self.vastapuoli)
+
+
+    def ilmoitettava_ikkuna(self):
+        '''Palauttaa lähettäjälle ilmoitettavan ikkunan.'''
+        return max(0, min(self.ikkuna,
+                          self.jonon_koko - self.sovelluksella))
+
+
+    def kuittaa(self, vastott):
+        '''Lähettää valikoivan kuittauksen (ks. LIPPU_SACK). Yksi kuittaus
+        kertoo koko vastaanottoikkunan tilanteen.'''
+        self.kuittaamatta = 0
+        self.kuittaushetki = None
+        kumulatiivinen = (self.vanhin - 1) % self.max
+        self.ilmoitettu = self.ilmoitettava_ikkuna()
+        self.vastapuoli = vastott
+        # Datakentässä on ensin ikkuna ja sen perässä bittikartta.
+        kuittaus = self.valm_paketti(kumulatiivinen,
+                                     luotettavuus.IKKUNA.pack(self.ilmoitettu)
+                                     + self.sack_kartta(),
+                                     luotettavuus.LIPPU_ACK |
+                                     luotettavuus.LIPPU_SACK |
+                                     luotettavuus.LIPPU_IKKUNA)
+        self.laheta(kuittaus, vastott)
+        print('(Lähetetty kuittaus: kaikki sekvenssinumeroon {} asti'.\
+              format(kumulatiivinen) + ', puskurissa {}, ikkuna {}.)'.\
+              format([(self.vanhin + d) % self.max
+                      for d in range(self.ikkuna)
+                      if self.puskuri[(self.alku + d) % self.ikkuna]
+                      is not None],
+                     self.ilmoitettu))
+
+
+    def sack_kartta(self):
+        '''Palauttaa valikoivan kuittauksen bittikartan tavujonona. Bitti
+        d (vähiten merkitsevästä alkaen) on 1, jos paketti, jonka
+        sekvenssinumero on self.vanhin + d, on puskurissa.'''
+        kartta = 0
+        for d in range(1, self.ikkuna):
+            if self.puskuri[(self.alku + d) % self.ikkuna] is not None:
+                kartta |= 1 << d
+        return kartta.to_bytes(length=(self.ikkuna + 7) // 8,
+                               byteorder='big')
 
 
     def palauta_puskurista(self):
         '''Palauttaa vastaanottopuskurista oikeassa järjestyksessä olevien
-        merkkijonojen listan alkaen indeksistä self.vanhin. Palautettavat
-        merkkijonot poistetaan puskurista. Lisäksi metodi
+        viestien listan alkaen indeksistä self.vanhin. Osissa tulleet
+        viestit kootaan, ja listaan tulevat vain valmiit viestit. Kootun
+        paketin viestit tulevat listaan kukin erikseen.
+        Palautettavat viestit poistetaan puskurista. Lisäksi metodi
         huolehtii self.vanhin-attribuutin päivittämisestä.'''
         palautus = []
-        while self.puskuri[self.vanhin]:
-            palautus.append(self.puskuri[self.vanhin])
-            self.puskuri[self.vanhin] = None
+        # Tyhjäkin viesti on viesti, joten verrataan Noneen.
+        while self.puskuri[self.alku] is not None:
+            data, liput = self.puskuri[self.alku]
+            viesti = self.kokoa(data, liput)
+            if viesti is not None and liput & luotettavuus.LIPPU_KOOTTU:
+                palautus.extend(self.pura_kootut(viesti))
+                self.allas.vapauta(viesti.obj)
+            elif viesti is not None:
+                palautus.append(viesti)
+            self.puskuri[self.alku] = None
+            self.alku = (self.alku + 1) % self.ikkuna
             self.vanhin = (self.vanhin + 1) % self.max
         return palautus
+
+
+    def paikka(self, sekvno):
+        '''Palauttaa vastaanottoikkunan sekvenssinumeron paikan
+        puskurissa.'''
+        return (self.alku + (sekvno - self.vanhin) % self.max) % self.ikkuna
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import luotettavuus_palvelin
+import multiprocessing as mp
+import socket as s
+import threading as thrd
+
+
+def luo_soketti(osoite, sokettiluokka=s.socket):
+    '''Luo UDP-soketin, joka voi jakaa portin muiden prosessien
+    sokettien kanssa (SO_REUSEPORT), ja sitoo sen osoitteeseen.'''
+    if not hasattr(s, 'SO_REUSEPORT'):
+        raise OSError('Käyttöjärjestelmä ei tue SO_REUSEPORT-asetusta.')
+    soketti = sokettiluokka(s.AF_INET, s.SOCK_DGRAM)
+    try:
+        soketti.setsockopt(s.SOL_SOCKET, s.SO_REUSEPORT, 1)
+        soketti.bind(osoite)
+    except OSError:
+        soketti.close()
+        raise
+    return soketti
+
+
+def tyoprosessi(numero, osoite, puskurin_koko, kasittelija, sokettiluokka,
+                valmis, asetukset):
+    '''Työprosessin pääfunktio. Prosessilla on oma soketti ja oma
+    Luottopalvelin eli oma yhteystaulu. Jokainen viesti annetaan
+    funktiolle kasittelija(numero, lahettaja, viesti). Viesti on
+    memoryview-näkymä, joka vapautetaan, kun kasittelija palaa.'''
+    try:
+        soketti = luo_soketti(osoite, sokettiluokka)
+    except OSError:
+        valmis.abort()  # Käynnistäjä ei jää odottamaan.
+        raise
+    palvelin = luotettavuus_palvelin.Luottopalvelin(soketti, puskurin_koko,
+                                                   **asetukset)
+    valmis.wait()
+    try:
+        while True:
+            saapunut = palvelin.ota_vastaan_bytes()
+            if saapunut is None:
+                continue
+            lahettaja, viestit = saapunut
+            for viesti in viestit:
+                kasittelija(numero, lahettaja, viesti)
+                palvelin.vapauta(lahettaja, viesti)
+    except KeyboardInterrupt:  # Käyttäjä painoi Ctrl-C.
+        pass
+    finally:
+        soketti.close()
+
+
+def kaynnista(maara, osoite, puskurin_koko, kasittelija,
+              sokettiluokka=s.socket, **asetukset):
+    '''Käynnistää maara työprosessia, joiden soketit on sidottu samaan
+    osoitteeseen. Palauttaa listan prosesseista (multiprocessing.Process).
+
+    Ydin jakaa saapuvat paketit prosesseille lähettäjän osoitteen ja
+    portin tiivisteen perusteella, joten saman lähettäjän paketit
+    menevät aina samalle prosessille, ja jokainen prosessi pitää yllä
+    vain omien yhteyksiensä tilaa. Prosessit eivät jaa GIL:iä, joten ne
+    voivat käyttää eri suoritinytimiä. Tiiviste riippuu sidottujen
+    sokettien määrästä, joten funktio palaa vasta, kun kaikki soketit on
+    sidottu. Muut asetukset välitetään Luottopalvelin-luokalle.'''
+    valmis = mp.Barrier(maara + 1)
+    prosessit = []
+    for numero in range(maara):
+        prosessi = mp.Process(target=tyoprosessi,
+                              args=(numero, osoite, puskurin_koko,
+                                    kasittelija, sokettiluokka, valmis,
+                                    asetukset),
+                              daemon=True)
+        prosessi.start()
+        prosessit.append(prosessi)
+    try:
+        valmis.wait()
+    except thrd.BrokenBarrierError:
+        for prosessi in prosessit:
+            prosessi.terminate()
+        raise OSError('Työprosessin soketin sitominen epäonnistui.')
+    return prosessit
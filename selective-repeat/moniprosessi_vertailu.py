@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import contextlib
+import luotettavuus_lah
+import moniprosessi
+import multiprocessing as mp
+import os
+import socket as s
+import time
+
+
+class Laskuri:
+    '''Työprosessien käsittelijä, joka laskee vastaanotetut tavut
+    prosessikohtaisesti jaettuun taulukkoon.'''
+
+    def __init__(self, maara):
+        self.tavut = mp.Array('q', maara)
+
+
+    def __call__(self, numero, lahettaja, viesti):
+        # Kukin prosessi kirjoittaa vain omaan alkioonsa.
+        self.tavut[numero] += len(viesti)
+
+
+def lahettaja(vastott, puskurin_koko, viesteja, koko):
+    '''Lähettäjäprosessi: lähettää viesteja viestiä, joiden koko on koko
+    tavua.'''
+    soketti = s.socket(s.AF_INET, s.SOCK_DGRAM)
+    luottokrs = luotettavuus_lah.Luottolahettaja(
+        soketti, puskurin_koko, vastott, ikkuna=64, maksimi=1024)
+    luottokrs.aloita()
+    viesti = bytes(koko)
+    for _ in range(viesteja):
+        luottokrs.send(viesti)
+    # Prosessi lopetetaan, kun kaikki on vastaanotettu.
+    time.sleep(3600)
+
+
+def mittaa(prosesseja, lahettajia, viesteja, koko, puskurin_koko):
+    '''Palauttaa hyötydatan siirtonopeuden (Mt/s) ja työprosessien
+    osuudet vastaanotetuista tavuista.'''
+    laskuri = Laskuri(prosesseja)
+    # Vapaa portti, jonka kaikki työprosessit jakavat.
+    with contextlib.closing(s.socket(s.AF_INET, s.SOCK_DGRAM)) as vapaa:
+        vapaa.bind(('127.0.0.1', 0))
+        osoite = vapaa.getsockname()
+    yhteensa = lahettajia * viesteja * koko
+    # Prosessien tulosteet ohjataan pois. Lapsiprosessit perivät
+    # korvatun sys.stdout-olion (fork).
+    with open(os.devnull, 'w') as tyhja, contextlib.redirect_stdout(tyhja):
+        tyoprosessit = moniprosessi.kaynnista(
+            prosesseja, osoite, puskurin_koko, laskuri,
+            ikkuna=64, maksimi=1024, jonon_koko=128)
+        alku = time.perf_counter()
+        lahettajat = [mp.Process(target=lahettaja, daemon=True,
+                                 args=(osoite, puskurin_koko, viesteja,
+                                       koko))
+                      for _ in range(lahettajia)]
+        for prosessi in lahettajat:
+            prosessi.start()
+    while sum(laskuri.tavut) < yhteensa:
+        time.sleep(0.01)
+    kesto = time.perf_counter() - alku
+    for prosessi in lahettajat + tyoprosessit:
+        prosessi.terminate()
+        prosessi.join()
+    osuudet = [tavut / yhteensa for tavut in laskuri.tavut]
+    return yhteensa / kesto / 1e6, osuudet
+
+
+def main():
+    '''Pääohjelma. Mittaa, miten vastaanoton kokonaisnopeus kasvaa
+    työprosessien määrän mukana, kun usea lähettäjä lähettää samaan
+    porttiin. Kasvua voi odottaa vain, jos suoritinytimiä on useita.'''
+    maarat = [1, 2, 4, 8]
+    lahettajia = 16
+    viesteja = 500  # Viestejä lähettäjää kohti.
+    koko = 1024  # Viestin koko tavuina.
+    puskurin_koko = 1472
+
+    print('Suoritinytimiä {}, lähettäjiä {}, {} x {} tavua lähettäjää '
+          'kohti.\n'.format(os.cpu_count(), lahettajia, viesteja, koko))
+    print('{:>10}{:>10}  {}'.format('prosessit', 'Mt/s', 'osuudet'))
+    for maara in maarat:
+        nopeus, osuudet = mittaa(maara, lahettajia, viesteja, koko,
+                                 puskurin_koko)
+        print('{:>10}{:>10.2f}  {}'.format(
+            maara, nopeus, ' '.join('{:.2f}'.format(osuus)
+                                    for osuus in osuudet)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import abc
+
+
+class Ruuhkanhallinta(abc.ABC):
+    '''Ruuhkanhallinta-algoritmien yhteinen rajapinta.
+
+    Algoritmi pitää yllä ruuhkaikkunaa (cwnd), joka kertoo, kuinka monta
+    kuittaamatonta pakettia lähettäjällä saa enintään olla verkossa.
+    Lähettäjä käyttää ikkunanaan pienempää luvuista self.ikkuna ja
+    vastaanottajan ikkuna.
+
+    Lähettäjä ilmoittaa algoritmille kuittauksista (kuitattu()) ja
+    katoamisista: menetys() tarkoittaa, että katoaminen on päätelty
+    kuittauksista (esim. tuplakuittaukset), ja aikakatkaisu() sitä, että
+    uudelleenlähetysajastin on lauennut. Argumentti lennossa on
+    kuittaamattomien pakettien määrä ja lahetetyt lähetettyjen (uusien)
+    pakettien kokonaismäärä.
+
+    Toisin kuin tarkistussumma-oliot, nämä oliot ovat tilallisia. Jokaisella
+    lähettäjällä on oma olionsa, ja lähettäjä kutsuu metodeja lukko
+    hallussaan.
+
+    Aliluokan on toteutettava metodit kuitattu(), menetys() ja
+    aikakatkaisu() (abc.abstractmethod). Muuten aliluokasta ei voi luoda
+    oliota.
+    '''
+    nimi = None
+
+
+    def __init__(self, ylaraja, alku=1):
+        self.ylaraja = ylaraja  # Ruuhkaikkunaa ei kasvateta tätä
+                                # suuremmaksi, koska lähettäjän ikkuna
+                                # rajoittaa lähettämistä joka tapauksessa.
+        self.cwnd = float(alku)  # Ruuhkaikkuna paketteina.
+        self.kynnys = float(ylaraja)  # Hitaan aloituksen kynnys
+                                      # (ssthresh).
+
+
+    @property
+    def ikkuna(self):
+        '''Ruuhkaikkuna kokonaisina paketteina, kuitenkin vähintään 1.'''
+        return max(1, int(self.cwnd))
+
+
+    @abc.abstractmethod
+    def kuitattu(self, maara):
+        '''Kuittaus kuittasi maara uutta pakettia.'''
+
+
+    @abc.abstractmethod
+    def menetys(self, lennossa, lahetetyt):
+        '''Kuittauksista on päätelty, että paketti on kadonnut.'''
+
+
+    @abc.abstractmethod
+    def aikakatkaisu(self, lennossa, lahetetyt):
+        '''Uudelleenlähetysajastin on lauennut.'''
+
+
+class Vakio(Ruuhkanhallinta):
+    '''Ei ruuhkanhallintaa: ikkuna on aina lähettäjän ikkunan kokoinen.'''
+    nimi = 'vakio'
+
+
+    @property
+    def ikkuna(self):
+        return self.ylaraja
+
+
+    def kuitattu(self, maara):
+        pass
+
+
+    def menetys(self, lennossa, lahetetyt):
+        pass
+
+
+    def aikakatkaisu(self, lennossa, lahetetyt):
+        pass
+
+
+class Aimd(Ruuhkanhallinta):
+    '''Hidas aloitus ja AIMD (additive increase, multiplicative decrease)
+    kuten TCP Renossa.
+
+    Hitaassa aloituksessa ruuhkaikkuna kasvaa yhdellä jokaista kuitattua
+    pakettia kohti eli kaksinkertaistuu joka kiertoviiveellä. Kun
+    ikkuna on saavuttanut kynnyksen, se kasvaa enää noin yhdellä
+    kiertoviivettä kohti (congestion avoidance). Kuittauksista
+    päätellyn katoamisen jälkeen kynnys ja ikkuna puolitetaan. Aikakatkaisun
+    jälkeen kynnys puolitetaan ja ikkuna pienennetään yhteen, jolloin
+    alkaa uusi hidas aloitus.
+    '''
+    nimi = 'aimd'
+
+
+    def kuitattu(self, maara):
+        for _ in range(maara):
+            if self.cwnd < self.kynnys:
+                self.cwnd += 1
+            else:
+                self.cwnd += 1 / self.cwnd
+        self.cwnd = min(self.cwnd, self.ylaraja)
+
+
+    def menetys(self, lennossa, lahetetyt):
+        self.kynnys = max(lennossa / 2, 2)
+        self.cwnd = self.kynnys
+
+
+    def aikakatkaisu(self, lennossa, lahetetyt):
+        self.kynnys = max(lennossa / 2, 2)
+        self.cwnd = 1.0
+
+
+class NewReno(Aimd):
+    '''Aimd, jossa saman ikkunallisen katoamiset käsitellään yhtenä
+    ruuhkatapahtumana (RFC 6582:n palautuspiste).
+
+    Kun katoaminen havaitaan, muistetaan siihen mennessä lähetettyjen
+    pakettien määrä. Ennen kuin niin monta pakettia on kuitattu,
+    uudet katoamiset johtuvat todennäköisesti samasta ruuhkasta, joten
+    ikkunaa ei pienennetä uudestaan. Kuittauksista päätellyn katoamisen
+    jälkeen ikkunaa ei myöskään kasvateta sinä aikana (fast recovery).
+    Aikakatkaisun jälkeen sen sijaan jatketaan heti hitaalla
+    aloituksella.
+    '''
+    nimi = 'newreno'
+
+
+    def __init__(self, ylaraja, alku=1):
+        super().__init__(ylaraja, alku)
+        self.kuitatut = 0  # Kuitattujen pakettien kokonaismäärä.
+        self.palautuspiste = 0
+        self.nopea_palautus = False  # True, jos palautuminen alkoi
+                                     # kuittauksista päätellystä
+                                     # katoamisesta.
+
+
+    def palautumassa(self):
+        '''Palauttaa True, jos edellinen katoaminen on vielä käsittelyssä.'''
+        return self.kuitatut < self.palautuspiste
+
+
+    def kuitattu(self, maara):
+        kasvata = not (self.nopea_palautus and self.palautumassa())
+        self.kuitatut += maara
+        if kasvata:
+            super().kuitattu(maara)
+
+
+    def menetys(self, lennossa, lahetetyt):
+        if not self.palautumassa():
+            super().menetys(lennossa, lahetetyt)
+            self.palautuspiste = lahetetyt
+            self.nopea_palautus = True
+
+
+    def aikakatkaisu(self, lennossa, lahetetyt):
+        super().aikakatkaisu(lennossa, lahetetyt)
+        self.palautuspiste = lahetetyt
+        self.nopea_palautus = False
+
+
+# Käytettävissä olevat algoritmit nimen mukaan.
+RUUHKANHALLINNAT = {luokka.nimi: luokka for luokka in
+                    (Vakio, Aimd, NewReno)}
+
+
+def hae(nimi, ylaraja):
+    '''Palauttaa nimeä vastaavan ruuhkanhallinta-olion.'''
+    try:
+        return RUUHKANHALLINNAT[nimi](ylaraja)
+    except KeyError:
+        raise ValueError('Tuntematon ruuhkanhallinta {}. Vaihtoehdot: {}.'.\
+                         format(nimi, ', '.join(RUUHKANHALLINNAT)))
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+import abc
+import zlib
+
+# Nopea CRC-32C saadaan käyttöön, jos crc32c-paketti on asennettu.
+# Muussa tapauksessa käytetään alla olevaa Python-toteutusta.
+try:
+    import crc32c as crc32c_c
+except ImportError:
+    crc32c_c = None
+
+# NumPyä käytetään CRC 8:n laskemiseen monelle paketille kerralla, jos
+# se on asennettu. Ilman sitä pakettien käsittely tehdään silmukassa.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Tarkistus(abc.ABC):
+    '''Tarkistussumma-algoritmien yhteinen rajapinta.
+
+    Tarkistussumma lisätään paketin loppuun. Attribuutti pituus kertoo,
+    kuinka monta tavua se vie, ja tunnus on algoritmin yhden tavun
+    mittainen tunniste, jonka avulla lähettäjä ja vastaanottaja voivat
+    sopia käytettävästä algoritmista.
+
+    Oliot ovat tilattomia: kaikki laskennan välitulokset ovat paikallisia
+    muuttujia. Samaa oliota voi siis käyttää useasta säikeestä yhtä aikaa
+    ilman lukitusta.
+
+    Aliluokan on toteutettava metodi laske(). Muuten aliluokasta ei voi
+    luoda oliota (abc.abstractmethod), joten puute huomataan jo
+    algoritmia valittaessa eikä vasta kesken siirron.
+    '''
+    nimi = None
+    tunnus = None
+    pituus = 0
+
+
+    @abc.abstractmethod
+    def laske(self, data, testaus=False):
+        '''Palauttaa datan tarkistussumman tavujonona.'''
+
+
+    def tarkasta(self, paketti, testaus=False):
+        '''Palauttaa True, jos paketin lopussa oleva tarkistussumma
+        vastaa paketin muuta sisältöä.'''
+        if len(paketti) < self.pituus:
+            return False
+        raja = len(paketti) - self.pituus
+        return self.laske(paketti[:raja], testaus) == paketti[raja:]
+
+
+    def laske_monta(self, datat):
+        '''Palauttaa listan, jossa on jokaisen datan tarkistussumma.'''
+        laske = self.laske
+        return [laske(data) for data in datat]
+
+
+    def tarkasta_monta(self, paketit):
+        '''Palauttaa listan totuusarvoja: True, jos vastaava paketti
+        läpäisee tarkastuksen.'''
+        tarkasta = self.tarkasta
+        return [tarkasta(paketti) for paketti in paketit]
+
+
+class EiTarkistusta(Tarkistus):
+    '''Ei omaa tarkistussummaa: luotetaan UDP:n omaan tarkistussummaan.'''
+    nimi = 'ei'
+    tunnus = 0
+    pituus = 0
+
+
+    def laske(self, data, testaus=False):
+        return b''
+
+
+    def tarkasta(self, paketti, testaus=False):
+        return True
+
+
+class Crc8(Tarkistus):
+    '''CRC 8 (alkuperäinen algoritmi).
+
+    Polynomina on x**8 + x**3 + x**2 + x + 1,
+    bittimuodossa 100000111. Laskenta tehdään taulukon avulla tavu
+    kerrallaan.
+    '''
+    nimi = 'crc8'
+    tunnus = 1
+    pituus = 1
+    polynomi = 0b00000111  # Ilman korkeinta bittiä, joka putoaa
+                           # rekisteristä joka tapauksessa pois.
+
+
+    def laske(self, data, testaus=False):
+        '''Palauttaa CRC 8 -tarkistussumman tavujonona.'''
+        # Taulukkoversiossa kahdeksaa nollaa ei tarvitse lisätä perään,
+        # koska jokainen tavu kulkee taulukon kautta valmiiksi kahdeksalla
+        # bitillä siirrettynä.
+        return crc8(data, testaus).to_bytes(length=1, byteorder='big')
+
+
+    def tarkasta(self, paketti, testaus=False):
+        '''Suorittaa CRC 8 -tarkastuksen vastaanotetulle datalle.'''
+        # Kun koko paketti tarkistussummineen syötetään rekisteriin,
+        # jakojäännös on nolla, jos bittivirheitä ei ole.
+        return crc8(paketti, testaus) == 0
+
+
+    def laske_monta(self, datat):
+        '''Palauttaa listan, jossa on jokaisen datan CRC 8
+        -tarkistussumma.'''
+        return [rek.to_bytes(length=1, byteorder='big')
+                for rek in crc8_monta(datat)]
+
+
+    def tarkasta_monta(self, paketit):
+        '''Suorittaa CRC 8 -tarkastuksen usealle paketille kerralla.'''
+        return [rek == 0 for rek in crc8_monta(paketit)]
+
+
+class Crc32(Tarkistus):
+    '''CRC-32 zlib-kirjaston (C-toteutus) avulla.'''
+    nimi = 'crc32'
+    tunnus = 2
+    pituus = 4
+
+
+    def laske(self, data, testaus=False):
+        return zlib.crc32(data).to_bytes(length=4, byteorder='big')
+
+
+class Crc32c(Tarkistus):
+    '''CRC-32C (Castagnoli). Sama algoritmi kuin esim. SCTP:ssä ja
+    iSCSI:ssä. Jos crc32c-paketti on asennettu, käytetään sitä.'''
+    nimi = 'crc32c'
+    tunnus = 3
+    pituus = 4
+    polynomi = 0x82F63B78  # Käännetyssä bittijärjestyksessä.
+
+
+    def laske(self, data, testaus=False):
+        if crc32c_c:
+            summa = crc32c_c.crc32c(data)
+        else:
+            rek = 0xFFFFFFFF
+            taulukko = CRC32C_TAULUKKO
+            for tavu in data:
+                rek = taulukko[(rek ^ tavu) & 0xFF] ^ (rek >> 8)
+            summa = rek ^ 0xFFFFFFFF
+        return summa.to_bytes(length=4, byteorder='big')
+
+
+class Adler32(Tarkistus):
+    '''Adler-32 zlib-kirjaston avulla. Nopein, mutta heikoin lyhyillä
+    paketeilla.'''
+    nimi = 'adler32'
+    tunnus = 4
+    pituus = 4
+
+
+    def laske(self, data, testaus=False):
+        return zlib.adler32(data).to_bytes(length=4, byteorder='big')
+
+
+def crc8(data, testaus=False):
+    '''CRC 8 -algoritmin taulukkopohjainen toteutus. Data voi olla bytes,
+    bytearray tai memoryview, ja se käsitellään tavu kerrallaan. Palauttaa
+    rekisterin sisällön kokonaislukuna. Rekisteri on paikallinen muuttuja,
+    joten funktiota voi kutsua useasta säikeestä yhtä aikaa.'''
+    rek = 0
+    taulukko = CRC8_TAULUKKO  # Paikallinen nimi on nopeampi.
+    for tavu in data:
+        rek = taulukko[rek ^ tavu]
+        if testaus:
+            print('Tuleva tavu: {}\nrekisteri jälkeen: {}\n'.\
+                  format(bin(tavu), bin(rek)))
+    return rek
+
+
+def crc8_monta(datat):
+    '''Laskee CRC 8 -rekisterin loppuarvon usealle datalle kerralla ja
+    palauttaa ne listana.
+
+    Jos NumPy on käytettävissä ja datoja on useita, datat pakataan
+    samanpituisiksi riveiksi yhteen taulukkoon ja rekisterit päivitetään
+    sarake kerrallaan kaikille riveille yhtä aikaa. Lyhyemmät datat
+    täytetään alusta nollilla. Se ei muuta tulosta, koska rekisteri on
+    aluksi nolla ja pysyy nollana, kun siihen syötetään nollia.'''
+    if np is None or len(datat) < NUMPY_RAJA:
+        return [crc8(data) for data in datat]
+
+    pisin = max(len(data) for data in datat)
+    taulukko = np.zeros((len(datat), pisin), dtype=np.uint8)
+    for i, data in enumerate(datat):
+        if len(data):
+            rivi = np.frombuffer(data, dtype=np.uint8)
+            taulukko[i, pisin-len(data):] = rivi
+
+    hakutaulukko = np.array(CRC8_TAULUKKO, dtype=np.uint8)
+    rek = np.zeros(len(datat), dtype=np.uint8)
+    for sarake in range(pisin):
+        rek = hakutaulukko[rek ^ taulukko[:, sarake]]
+    return rek.tolist()
+
+
+def crc8_taulukko():
+    '''Muodostaa CRC 8 -laskennan 256-alkioisen hakutaulukon. Kohdassa i on
+    rekisterin sisältö, kun rekisteriin, jonka sisältö on i, on syötetty
+    kahdeksan nollabittiä.'''
+    taulukko = []
+    for tavu in range(256):
+        rek = tavu
+        for _ in range(8):
+            if rek & 0b10000000:
+                rek = ((rek << 1) ^ Crc8.polynomi) & 0b11111111
+            else:
+                rek = (rek << 1) & 0b11111111
+        taulukko.append(rek)
+    return taulukko
+
+
+def crc32c_taulukko():
+    '''Muodostaa CRC-32C-laskennan hakutaulukon (käännetty bittijärjestys).'''
+    taulukko = []
+    for tavu in range(256):
+        rek = tavu
+        for _ in range(8):
+            if rek & 1:
+                rek = (rek >> 1) ^ Crc32c.polynomi
+            else:
+                rek = rek >> 1
+        taulukko.append(rek)
+    return taulukko
+
+
+# Pienemmillä pakettimäärillä NumPy-taulukon kasaaminen maksaa enemmän
+# kuin se säästää.
+NUMPY_RAJA = 256
+
+# Taulukot lasketaan vain kerran, kun moduuli ladataan.
+CRC8_TAULUKKO = crc8_taulukko()
+CRC32C_TAULUKKO = crc32c_taulukko()
+
+# Käytettävissä olevat algoritmit nimen ja tunnuksen mukaan.
+TARKISTUKSET = {luokka.nimi: luokka for luokka in
+                (EiTarkistusta, Crc8, Crc32, Crc32c, Adler32)}
+TUNNUKSET = {luokka.tunnus: luokka for luokka in TARKISTUKSET.values()}
+
+
+def hae(nimi):
+    '''Palauttaa nimeä vastaavan tarkistussumma-olion.'''
+    try:
+        return TARKISTUKSET[nimi]()
+    except KeyError:
+        raise ValueError('Tuntematon tarkistussumma {}. Vaihtoehdot: {}.'.\
+                         format(nimi, ', '.join(TARKISTUKSET)))
+
+
+def hae_tunnuksella(tunnus):
+    '''Palauttaa tunnusta vastaavan tarkistussumma-olion tai None, jos
+    tunnusta ei tunneta.'''
+    luokka = TUNNUKSET.get(tunnus)
+    return luokka() if luokka else None
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import asyncio
+import contextlib
+import io
+import luotettavuus_async
+import unittest
+
+
+class AsyncTesti(unittest.IsolatedAsyncioTestCase):
+    '''Lähettäjä ja vastaanottaja asyncio-protokollina samassa
+    silmukassa.'''
+
+    async def asyncSetUp(self):
+        self.tuloste = contextlib.redirect_stdout(io.StringIO())
+        self.tuloste.__enter__()
+        self.vastott = await luotettavuus_async.luo_vastaanottaja(
+            ('127.0.0.1', 0), 64, jonon_koko=4)
+        self.lahettaja = await luotettavuus_async.luo_lahettaja(
+            self.vastott.soketti.get_extra_info('sockname'), 64)
+        # Katoamisia ei odoteta kauan.
+        self.lahettaja.rtt.minimi = 0.01
+        self.lahettaja.rtt.rto = 0.05
+
+
+    async def asyncTearDown(self):
+        self.lahettaja.close()
+        self.vastott.close()
+        # Annetaan kuljetusten sulkeutua ennen silmukan sulkemista.
+        await asyncio.sleep(0)
+        self.tuloste.__exit__(None, None, None)
+
+
+    async def vastaanota(self, maara):
+        '''Palauttaa maara ensimmäistä viestiä listana.'''
+        viestit = []
+        async for viesti in self.vastott:
+            viestit.append(viesti)
+            if len(viestit) == maara:
+                break
+        return viestit
+
+
+    async def test_viestit_perille(self):
+        # Myös osina lähetettävä pitkä viesti kootaan.
+        viestit = [str(i).encode() for i in range(30)]
+        viestit[10] = bytes(range(200))
+        vastaanotto = asyncio.ensure_future(self.vastaanota(len(viestit)))
+        for viesti in viestit:
+            await self.lahettaja.send(viesti)
+        self.assertEqual(await asyncio.wait_for(vastaanotto, 30), viestit)
+
+
+    async def test_merkkijono(self):
+        vastaanotto = asyncio.ensure_future(self.vastaanota(1))
+        await self.lahettaja.send('äö')
+        self.assertEqual(await asyncio.wait_for(vastaanotto, 30),
+                         ['äö'.encode('utf8')])
+
+
+    async def test_hidas_kuluttaja(self):
+        # Hidas kuluttaja pienentää ilmoitettua ikkunaa, joten
+        # iteraattorin jono ei kasva sovelluksen jonoa suuremmaksi.
+        suurin = 0
+
+        async def vastaanota():
+            nonlocal suurin
+            viestit = []
+            async for viesti in self.vastott:
+                suurin = max(suurin, self.vastott.jono.qsize())
+                viestit.append(viesti)
+                if len(viestit) == 20:
+                    return viestit
+                await asyncio.sleep(0.01)
+        vastaanotto = asyncio.ensure_future(vastaanota())
+        viestit = [str(i).encode() for i in range(20)]
+        for viesti in viestit:
+            await self.lahettaja.send(viesti)
+        self.assertEqual(await asyncio.wait_for(vastaanotto, 30), viestit)
+        self.assertLessEqual(suurin, self.vastott.jonon_koko)
+
+
+    async def test_katoamiset(self):
+        # Paketit, joiden sekvenssinumero on jaollinen neljällä, katoavat
+        # ensimmäisellä lähetyskerralla.
+        laheta = self.lahettaja.laheta
+        kadonneet = set()
+
+        def laheta_katoavasti(lahteva, vastott):
+            sekvno = self.lahettaja.pura(lahteva)[0]
+            if sekvno % 4 or sekvno in kadonneet:
+                laheta(lahteva, vastott)
+            else:
+                kadonneet.add(sekvno)
+        self.lahettaja.laheta = laheta_katoavasti
+        viestit = [str(i).encode() for i in range(20)]
+        vastaanotto = asyncio.ensure_future(self.vastaanota(len(viestit)))
+        for viesti in viestit:
+            await self.lahettaja.send(viesti)
+        self.assertEqual(await asyncio.wait_for(vastaanotto, 30), viestit)
+
+
+    async def test_kootut(self):
+        # Kootun paketin viestit tulevat iteraattorista kukin erikseen.
+        self.lahettaja.kokoamisaika = 0.01
+        viestit = [b'eka', b'toka', b'kolmas']
+        vastaanotto = asyncio.ensure_future(self.vastaanota(len(viestit)))
+        for viesti in viestit:
+            self.lahettaja.laheta_koottuna(viesti)
+        self.assertEqual(await asyncio.wait_for(vastaanotto, 30), viestit)
+
+
+    async def test_estava_lahetys_taydessa_ikkunassa(self):
+        # Estävä lähetys ei saa pysäyttää silmukkaa, joten täyteen
+        # ikkunaan lähettäminen aiheuttaa poikkeuksen.
+        self.lahettaja.laheta = lambda lahteva, vastott: None
+        with self.lahettaja.lukko:
+            vapaat = self.lahettaja.vapaat_paikat()
+        for _ in range(vapaat):
+            self.lahettaja.laheta_bytes(b'x')
+        with self.assertRaises(RuntimeError):
+            self.lahettaja.laheta_bytes(b'x')
+
+
+    async def test_lopetettu_lahettaja(self):
+        self.lahettaja.close()
+        with self.assertRaises(ConnectionError):
+            await self.lahettaja.send(b'x')
+
+
+    async def test_iteraattori_paattyy(self):
+        self.vastott.close()
+        viestit = await asyncio.wait_for(self.vastaanota(1), 5)
+        self.assertEqual(viestit, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import luotettavuus
+import luotettavuus_palvelin
+import socket as s
+import unittest
+
+
+class PalvelinTesti(unittest.TestCase):
+    '''Usean lähettäjän vastaanottaja. Lähettäjinä ovat pelkät soketit,
+    joilla valmistellut paketit lähetetään.'''
+
+    def setUp(self):
+        self.tuloste = contextlib.redirect_stdout(io.StringIO())
+        self.tuloste.__enter__()
+        soketti = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        soketti.bind(('127.0.0.1', 0))
+        soketti.settimeout(5)
+        self.palvelin = luotettavuus_palvelin.Luottopalvelin(soketti, 64)
+        self.lahettajat = []
+        for _ in range(2):
+            lahettaja = s.socket(s.AF_INET, s.SOCK_DGRAM)
+            lahettaja.bind(('127.0.0.1', 0))
+            self.lahettajat.append(lahettaja)
+        self.krs = luotettavuus.Luottokerros(None, 64, maksimi=9)
+
+
+    def tearDown(self):
+        self.palvelin.soketti.close()
+        for lahettaja in self.lahettajat:
+            lahettaja.close()
+        self.tuloste.__exit__(None, None, None)
+
+
+    def laheta(self, lahettaja, paketti):
+        lahettaja.sendto(paketti, self.palvelin.soketti.getsockname())
+
+
+    def test_yhteydet_erillaan(self):
+        # Kummankin lähettäjän sekvenssinumerot alkavat alusta.
+        eka, toka = self.lahettajat
+        self.laheta(eka, self.krs.valm_paketti(0, b'eka 1'))
+        self.laheta(toka, self.krs.valm_paketti(0, b'toka 1'))
+        self.laheta(eka, self.krs.valm_paketti(1, b'eka 2'))
+        tulokset = [self.palvelin.ota_vastaan() for _ in range(3)]
+        self.assertEqual(tulokset,
+                         [(eka.getsockname(), ['eka 1']),
+                          (toka.getsockname(), ['toka 1']),
+                          (eka.getsockname(), ['eka 2'])])
+        self.assertEqual(set(self.palvelin.yhteydet),
+                         {eka.getsockname(), toka.getsockname()})
+
+
+    def test_virheellinen_ei_luo_yhteytta(self):
+        # Bittivirheellinen paketti, kuittaus tai muu kuin protokollan
+        # paketti tuntemattomalta lähettäjältä hylätään luomatta yhteyttä.
+        virheellinen = self.krs.valm_paketti(0, b'data')
+        virheellinen[-1] ^= 1
+        kuittaus = self.krs.valm_paketti(0, b'', luotettavuus.LIPPU_ACK)
+        for paketti in (virheellinen, kuittaus, b'roskaa'):
+            self.laheta(self.lahettajat[0], paketti)
+            self.assertIsNone(self.palvelin.ota_vastaan())
+        self.assertEqual(len(self.palvelin.yhteydet), 0)
+        self.assertEqual(self.palvelin.allas.lainassa, 0)
+        # Virheetön paketti luo yhteyden.
+        self.laheta(self.lahettajat[0], self.krs.valm_paketti(0, b'data'))
+        self.assertEqual(self.palvelin.ota_vastaan(),
+                         (self.lahettajat[0].getsockname(), ['data']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import contextlib
+import functools
+import io
+import luotettavuus
+import moniprosessi
+import multiprocessing as mp
+import queue
+import socket as s
+import unittest
+
+
+def kirjaa(jono, numero, lahettaja, viesti):
+    '''Työprosessien käsittelijä: välittää viestin testille.'''
+    jono.put((numero, lahettaja, bytes(viesti)))
+
+
+@unittest.skipUnless(hasattr(s, 'SO_REUSEPORT'),
+                     'SO_REUSEPORT ei ole käytettävissä.')
+class MoniprosessiTesti(unittest.TestCase):
+    '''Samaan porttiin sidotut työprosessit.'''
+
+    def setUp(self):
+        # Työprosessit perivät tulosteen ohjauksen.
+        self.tuloste = contextlib.redirect_stdout(io.StringIO())
+        self.tuloste.__enter__()
+        # Vapaa portti haetaan sitomalla soketti porttiin 0. Soketti
+        # suljetaan, jotta se ei jää jakamaan portin paketteja.
+        soketti = moniprosessi.luo_soketti(('127.0.0.1', 0))
+        self.osoite = soketti.getsockname()
+        soketti.close()
+        self.krs = luotettavuus.Luottokerros(None, 64, maksimi=9)
+
+
+    def tearDown(self):
+        self.tuloste.__exit__(None, None, None)
+
+
+    def test_soketit_jakavat_portin(self):
+        eka = moniprosessi.luo_soketti(self.osoite)
+        self.addCleanup(eka.close)
+        toka = moniprosessi.luo_soketti(self.osoite)
+        self.addCleanup(toka.close)
+        self.assertEqual(eka.getsockname(), toka.getsockname())
+        # Soketti ilman SO_REUSEPORT-asetusta ei saa samaa porttia.
+        tavallinen = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        self.addCleanup(tavallinen.close)
+        with self.assertRaises(OSError):
+            tavallinen.bind(self.osoite)
+
+
+    def test_tyoprosessit(self):
+        # Jokainen viesti käsitellään kerran, ja saman lähettäjän viestit
+        # menevät samalle prosessille.
+        jono = mp.Queue()
+        prosessit = moniprosessi.kaynnista(
+            2, self.osoite, 64, functools.partial(kirjaa, jono))
+        for prosessi in prosessit:
+            self.addCleanup(prosessi.join, 5)
+            self.addCleanup(prosessi.terminate)
+        lahettajat = []
+        for _ in range(8):
+            lahettaja = s.socket(s.AF_INET, s.SOCK_DGRAM)
+            lahettaja.bind(('127.0.0.1', 0))
+            self.addCleanup(lahettaja.close)
+            lahettajat.append(lahettaja)
+        for sekvno in (0, 1):
+            for i, lahettaja in enumerate(lahettajat):
+                viesti = '{} {}'.format(i, sekvno).encode()
+                lahettaja.sendto(self.krs.valm_paketti(sekvno, viesti),
+                                 self.osoite)
+        saapuneet = {}
+        for _ in range(2 * len(lahettajat)):
+            try:
+                numero, lahettaja, viesti = jono.get(timeout=10)
+            except queue.Empty:
+                self.fail('Kaikki viestit eivät saapuneet.')
+            saapuneet.setdefault(tuple(lahettaja), []).append(
+                (numero, viesti))
+        self.assertEqual(len(saapuneet), len(lahettajat))
+        for i, lahettaja in enumerate(lahettajat):
+            viestit = saapuneet[lahettaja.getsockname()]
+            self.assertEqual([viesti for _, viesti in viestit],
+                             ['{} 0'.format(i).encode(),
+                              '{} 1'.format(i).encode()])
+            self.assertEqual(viestit[0][0], viestit[1][0])
+
+
+    def test_sitominen_epaonnistuu(self):
+        # Jos portti on varattu ilman SO_REUSEPORT-asetusta, työprosessit
+        # eivät voi sitoa sokettiaan, eikä käynnistäjä jää odottamaan.
+        varaaja = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        self.addCleanup(varaaja.close)
+        varaaja.bind(self.osoite)
+        with self.assertRaises(OSError), \
+             contextlib.redirect_stderr(io.StringIO()):
+            moniprosessi.kaynnista(2, self.osoite, 64,
+                                   functools.partial(kirjaa, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
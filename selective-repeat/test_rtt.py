@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import rtt
+import unittest
+
+
+class RttarvioTesti(unittest.TestCase):
+    '''Kiertoviiveen arvio ja RTO RFC 6298:n mukaan.'''
+
+    def setUp(self):
+        self.arvio = rtt.Rttarvio(alku=1.0, minimi=0.2, maksimi=60.0,
+                                  tarkkuus=0.001)
+
+
+    def test_alkuarvo(self):
+        self.assertIsNone(self.arvio.srtt)
+        self.assertIsNone(self.arvio.rttvar)
+        self.assertEqual(self.arvio.rto, 1.0)
+
+
+    def test_ensimmainen_mittaus(self):
+        # SRTT = R, RTTVAR = R/2 ja RTO = SRTT + 4 * RTTVAR = 3R.
+        self.arvio.mittaus(0.5)
+        self.assertAlmostEqual(self.arvio.srtt, 0.5)
+        self.assertAlmostEqual(self.arvio.rttvar, 0.25)
+        self.assertAlmostEqual(self.arvio.rto, 1.5)
+
+
+    def test_seuraavat_mittaukset(self):
+        self.arvio.mittaus(0.5)
+        self.arvio.mittaus(0.1)
+        # RTTVAR päivitetään vanhalla SRTT:llä.
+        rttvar = 3/4 * 0.25 + 1/4 * abs(0.5 - 0.1)
+        srtt = 7/8 * 0.5 + 1/8 * 0.1
+        self.assertAlmostEqual(self.arvio.rttvar, rttvar)
+        self.assertAlmostEqual(self.arvio.srtt, srtt)
+        self.assertAlmostEqual(self.arvio.rto, srtt + 4 * rttvar)
+
+
+    def test_tasainen_viive(self):
+        # Kun viive ei vaihtele, RTTVAR pienenee kohti nollaa ja RTO
+        # lähestyy SRTT:tä. Kellon tarkkuus on kuitenkin alaraja
+        # vaihtelun osuudelle.
+        arvio = rtt.Rttarvio(minimi=0, tarkkuus=0.01)
+        for _ in range(200):
+            arvio.mittaus(1.0)
+        self.assertAlmostEqual(arvio.srtt, 1.0)
+        self.assertLess(arvio.rttvar, 0.0025)
+        self.assertAlmostEqual(arvio.rto, 1.01)
+
+
+    def test_rajat(self):
+        self.arvio.mittaus(0.001)
+        self.assertEqual(self.arvio.rto, 0.2)
+        self.arvio.mittaus(100)
+        self.assertEqual(self.arvio.rto, 60.0)
+
+
+    def test_aikakatkaisu_kaksinkertaistaa(self):
+        self.arvio.mittaus(0.5)
+        self.arvio.aikakatkaisu()
+        self.assertAlmostEqual(self.arvio.rto, 3.0)
+        self.arvio.aikakatkaisu()
+        self.assertAlmostEqual(self.arvio.rto, 6.0)
+        for _ in range(10):
+            self.arvio.aikakatkaisu()
+        self.assertEqual(self.arvio.rto, 60.0)
+        # Aikakatkaisu ei muuta arviota.
+        self.assertAlmostEqual(self.arvio.srtt, 0.5)
+
+
+    def test_kuitattu_peruu_kaksinkertaistukset(self):
+        self.arvio.mittaus(0.5)
+        self.arvio.aikakatkaisu()
+        self.arvio.aikakatkaisu()
+        self.arvio.kuitattu()
+        self.assertAlmostEqual(self.arvio.rto, 1.5)
+
+
+    def test_kuitattu_ilman_mittausta(self):
+        # Ilman mittauksia kaksinkertaistettu alkuarvo säilyy.
+        self.arvio.aikakatkaisu()
+        self.arvio.kuitattu()
+        self.assertEqual(self.arvio.rto, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
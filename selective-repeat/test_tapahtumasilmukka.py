@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import socket as s
+import tapahtumasilmukka
+import threading as thrd
+import time
+import unittest
+import unittest.mock
+
+
+class TapahtumasilmukkaTesti(unittest.TestCase):
+    '''Ajastukset keossa ja sokettien luettavuus samassa säikeessä.'''
+
+    def setUp(self):
+        self.silmukka = tapahtumasilmukka.Tapahtumasilmukka()
+        self.kutsut = []
+        self.valmis = thrd.Event()
+
+
+    def tearDown(self):
+        self.silmukka.lopeta()
+        self.silmukka.saie.join(5)
+
+
+    def kirjaa(self, nimi):
+        self.kutsut.append(nimi)
+
+
+    def test_laukeamisjarjestys(self):
+        # Ajastukset laukeavat laukeamishetken mukaan eivätkä
+        # lisäysjärjestyksessä.
+        for aika, nimi in ((0.06, 'c'), (0.02, 'a'), (0.04, 'b')):
+            self.silmukka.ajasta(aika, self.kirjaa, (nimi,))
+        self.silmukka.ajasta(0.08, self.valmis.set)
+        self.assertTrue(self.valmis.wait(5))
+        self.assertEqual(self.kutsut, ['a', 'b', 'c'])
+
+
+    def test_samanaikaiset_lisaysjarjestyksessa(self):
+        # Ajastuksia ei voi verrata keskenään, joten samanaikaiset
+        # ajastukset järjestetään lisäysjärjestyksen mukaan.
+        nyt = time.monotonic()
+        with unittest.mock.patch.object(tapahtumasilmukka.time, 'monotonic',
+                                        return_value=nyt):
+            for nimi in 'abcde':
+                self.silmukka.ajasta(0, self.kirjaa, (nimi,))
+            self.silmukka.ajasta(0, self.valmis.set)
+            self.assertTrue(self.valmis.wait(5))
+        self.assertEqual(self.kutsut, list('abcde'))
+
+
+    def test_peruttu_ei_laukea(self):
+        peruttu = self.silmukka.ajasta(0.02, self.kirjaa, ('peruttu',))
+        self.silmukka.ajasta(0.03, self.kirjaa, ('laukeaa',))
+        peruttu.cancel()
+        # Toinen peruminen ei kasvata laskuria.
+        peruttu.peru()
+        self.assertEqual(self.silmukka.perutut, 1)
+        self.silmukka.ajasta(0.06, self.valmis.set)
+        self.assertTrue(self.valmis.wait(5))
+        self.assertEqual(self.kutsut, ['laukeaa'])
+        self.assertEqual(self.silmukka.perutut, 0)
+
+
+    def test_perutut_siivotaan(self):
+        # Kun suurin osa keosta on perutuja ajastuksia, ne poistetaan
+        # seuraavan lisäyksen yhteydessä.
+        ajastukset = [self.silmukka.ajasta(60, self.kirjaa, ('x',))
+                      for _ in range(100)]
+        for ajastus in ajastukset:
+            ajastus.peru()
+        self.assertEqual(self.silmukka.perutut, 100)
+        self.silmukka.ajasta(60, self.kirjaa, ('y',))
+        with self.silmukka.lukko:
+            self.assertEqual(len(self.silmukka.keko), 1)
+            self.assertEqual(self.silmukka.perutut, 0)
+
+
+    def test_aiempi_ajastus_herattaa(self):
+        # Silmukka odottaa pitkää ajastusta, mutta uusi aiemmin laukeava
+        # ajastus herättää sen.
+        self.silmukka.ajasta(60, self.kirjaa, ('myohassa',))
+        time.sleep(0.05)
+        alku = time.monotonic()
+        self.silmukka.ajasta(0.01, self.valmis.set)
+        self.assertTrue(self.valmis.wait(5))
+        self.assertLess(time.monotonic() - alku, 1)
+        self.assertEqual(self.kutsut, [])
+
+
+    def test_rekisteroi(self):
+        luku, kirj = s.socketpair()
+        self.addCleanup(luku.close)
+        self.addCleanup(kirj.close)
+
+        def lue():
+            self.kutsut.append(luku.recv(16))
+            self.valmis.set()
+        self.silmukka.rekisteroi(luku, lue)
+        kirj.send(b'tavut')
+        self.assertTrue(self.valmis.wait(5))
+        self.assertEqual(self.kutsut, [b'tavut'])
+
+
+    def test_poikkeus_ei_pysayta(self):
+        def virhe():
+            raise RuntimeError('testi')
+        virheet = io.StringIO()
+        with contextlib.redirect_stderr(virheet):
+            self.silmukka.ajasta(0, virhe)
+            self.silmukka.ajasta(0.02, self.valmis.set)
+            self.assertTrue(self.valmis.wait(5))
+        self.assertIn('RuntimeError', virheet.getvalue())
+        self.assertTrue(self.silmukka.saie.is_alive())
+
+
+    def test_lopeta(self):
+        self.silmukka.ajasta(0.05, self.kirjaa, ('ei suoriteta',))
+        self.silmukka.lopeta()
+        self.silmukka.saie.join(5)
+        self.assertFalse(self.silmukka.saie.is_alive())
+        time.sleep(0.1)
+        self.assertEqual(self.kutsut, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import random
+import tarkistussumma
+import unittest
+
+
+def crc8_siirtorekisteri(data):
+    '''Alkuperäinen bitti kerrallaan etenevä CRC 8 -siirtorekisteri, johon
+    taulukkopohjaista toteutusta verrataan. Palauttaa rekisterin
+    sisällön, kun dataan on lisätty perään kahdeksan nollaa.'''
+    rek = 0
+    luku = int.from_bytes(data, byteorder='big') << 8
+    for i in range(luku.bit_length(), 0, -1):
+        bitti = (luku >> i-1) & 1
+        bitti7 = (rek & 0b10000000) >> 7
+        bitti1 = (rek & 0b10) >> 1
+        bitti0 = rek & 0b1
+        uudet = ((bitti7 ^ bitti1) << 2) | ((bitti7 ^ bitti0) << 1) | \
+                (bitti7 ^ bitti)
+        rek = ((rek << 1) & 0b11111000) | uudet
+    return rek
+
+
+class RekisteriTesti(unittest.TestCase):
+    '''Algoritmien haku nimen ja tunnuksen perusteella.'''
+
+    def test_nimi_ja_tunnus(self):
+        for nimi in tarkistussumma.TARKISTUKSET:
+            tark = tarkistussumma.hae(nimi)
+            self.assertEqual(tark.nimi, nimi)
+            toinen = tarkistussumma.hae_tunnuksella(tark.tunnus)
+            self.assertIs(type(toinen), type(tark))
+
+
+    def test_tunnukset_yksikasitteisia(self):
+        tunnukset = [luokka.tunnus for luokka in
+                     tarkistussumma.TARKISTUKSET.values()]
+        self.assertEqual(len(set(tunnukset)), len(tunnukset))
+        for tunnus in tunnukset:
+            self.assertTrue(0 <= tunnus <= 255)
+
+
+    def test_tuntematon(self):
+        with self.assertRaises(ValueError):
+            tarkistussumma.hae('md5')
+        self.assertIsNone(tarkistussumma.hae_tunnuksella(255))
+
+
+    def test_keskenerainen_algoritmi(self):
+        # Aliluokasta, jolta puuttuu laske(), ei voi luoda oliota.
+        class Puutteellinen(tarkistussumma.Tarkistus):
+            nimi = 'puutteellinen'
+        with self.assertRaises(TypeError):
+            Puutteellinen()
+
+
+class AlgoritmiTesti(unittest.TestCase):
+    '''Tarkistussummien laskenta ja tarkastus.'''
+
+    def setUp(self):
+        satunnainen = random.Random(1)
+        self.datat = [b'', b'\x00', b'\x00\x00\x01', b'\xff', b'Hei!',
+                      bytes(range(256))]
+        self.datat += [bytes(satunnainen.getrandbits(8) for _ in range(n))
+                       for n in (1, 7, 64, 500)]
+
+
+    def test_crc8_sama_kuin_siirtorekisteri(self):
+        for data in self.datat:
+            with self.subTest(data=data[:8]):
+                self.assertEqual(tarkistussumma.crc8(data),
+                                 crc8_siirtorekisteri(data))
+                self.assertEqual(tarkistussumma.Crc8().laske(data),
+                                 bytes([crc8_siirtorekisteri(data)]))
+
+
+    def test_crc8_taulukko(self):
+        # Taulukon kohta i on rekisteri, kun tavu i on syötetty tyhjään
+        # rekisteriin.
+        for i in range(256):
+            self.assertEqual(tarkistussumma.CRC8_TAULUKKO[i],
+                             crc8_siirtorekisteri(bytes([i])))
+
+
+    def test_crc32c_tunnettu_arvo(self):
+        # RFC 3720:n tarkistusarvo.
+        self.assertEqual(tarkistussumma.Crc32c().laske(b'123456789'),
+                         (0xE3069283).to_bytes(length=4, byteorder='big'))
+
+
+    def test_tarkasta(self):
+        for nimi in tarkistussumma.TARKISTUKSET:
+            tark = tarkistussumma.hae(nimi)
+            for data in self.datat:
+                with self.subTest(nimi=nimi, data=data[:8]):
+                    paketti = data + tark.laske(data)
+                    self.assertEqual(len(paketti), len(data) + tark.pituus)
+                    self.assertTrue(tark.tarkasta(paketti))
+                    self.assertTrue(tark.tarkasta(memoryview(paketti)))
+                    if tark.pituus and data:
+                        # Yhden bitin virhe huomataan.
+                        virheellinen = bytearray(paketti)
+                        virheellinen[0] ^= 0b100
+                        self.assertFalse(tark.tarkasta(virheellinen))
+
+
+    def test_liian_lyhyt(self):
+        for nimi in ('crc32', 'crc32c', 'adler32'):
+            self.assertFalse(tarkistussumma.hae(nimi).tarkasta(b'\x00'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import luotettavuus
+import luotettavuus_vastott
+import socket as s
+import time
+import unittest
+import unittest.mock
+
+
+class VastaanottajaTesti(unittest.TestCase):
+    '''Vastaanottajan testit. Lähettäjänä on pelkkä soketti, jolla
+    valmistellut paketit lähetetään.'''
+
+    def setUp(self):
+        self.tuloste = contextlib.redirect_stdout(io.StringIO())
+        self.tuloste.__enter__()
+        soketti = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        soketti.bind(('127.0.0.1', 0))
+        soketti.settimeout(5)
+        self.vastott = luotettavuus_vastott.Luottovastaanottaja(soketti, 64)
+        self.lahettaja = s.socket(s.AF_INET, s.SOCK_DGRAM)
+        self.lahettaja.bind(('127.0.0.1', 0))
+        self.lahettaja.settimeout(5)
+        self.krs = luotettavuus.Luottokerros(None, 64,
+                                             maksimi=self.vastott.max)
+
+
+    def tearDown(self):
+        self.vastott.soketti.close()
+        self.lahettaja.close()
+        self.tuloste.__exit__(None, None, None)
+
+
+    def laheta(self, *paketit):
+        for paketti in paketit:
+            self.lahettaja.sendto(paketti, self.vastott.soketti.getsockname())
+
+
+    def ota_vastaan(self):
+        '''Palauttaa seuraavat viestit listana tavujonoja tai None.'''
+        viestit = self.vastott.ota_vastaan_bytes()
+        if viestit is None:
+            return None
+        tulos = [bytes(viesti) for viesti in viestit]
+        for viesti in viestit:
+            self.vastott.vapauta(viesti)
+        return tulos
+
+
+    def test_era_tarkastetaan_kerralla(self):
+        # Saman erän paketit tarkastetaan tarkasta_monta()-metodilla eikä
+        # yksitellen.
+        virheellinen = self.krs.valm_paketti(1, b'toka')
+        virheellinen[-1] ^= 1
+        self.laheta(self.krs.valm_paketti(0, b'eka'), virheellinen,
+                    self.krs.valm_paketti(1, b'toka'))
+        with unittest.mock.patch.object(self.vastott, 'tarkasta') as tarkasta:
+            self.assertEqual(self.ota_vastaan(), [b'eka'])
+            self.assertIsNone(self.ota_vastaan())
+            self.assertEqual(self.ota_vastaan(), [b'toka'])
+        tarkasta.assert_not_called()
+
+
+    def test_osat_kootaan(self):
+        # Osat palautetaan yhtenä viestinä vasta, kun kaikki osat ovat
+        # saapuneet, vaikka ne saapuisivat väärässä järjestyksessä.
+        jatkuu = luotettavuus.LIPPU_JATKUU
+        self.laheta(self.krs.valm_paketti(1, b'BBB', jatkuu))
+        self.assertFalse(self.ota_vastaan())
+        self.laheta(self.krs.valm_paketti(0, b'AAA', jatkuu))
+        self.assertFalse(self.ota_vastaan())
+        self.laheta(self.krs.valm_paketti(2, b'CCC'))
+        self.assertEqual(self.ota_vastaan(), [b'AAABBBCCC'])
+        # Seuraava yhden paketin viesti ei sisällä edellisen osia.
+        self.laheta(self.krs.valm_paketti(3, b'DDD'))
+        self.assertEqual(self.ota_vastaan(), [b'DDD'])
+
+
+    def test_kootut_erikseen(self):
+        # Kootun paketin viestit palautetaan listassa kukin erikseen.
+        kootut = b''.join(luotettavuus.TIETUE.pack(len(viesti)) + viesti
+                          for viesti in (b'eka', b'', b'kolmas'))
+        self.laheta(self.krs.valm_paketti(0, kootut,
+                                          luotettavuus.LIPPU_KOOTTU))
+        self.assertEqual(self.ota_vastaan(), [b'eka', b'', b'kolmas'])
+
+
+    def lue_kuittaus(self):
+        '''Palauttaa lähettäjän sokettiin tulleen kuittauksen
+        sekvenssinumeron, ikkunan ja bittikartan.'''
+        kuittaus = memoryview(self.lahettaja.recv(64))
+        self.assertTrue(self.krs.tarkasta(kuittaus))
+        self.assertEqual(self.krs.lue_otsake(kuittaus)[1],
+                         luotettavuus.LIPPU_ACK | luotettavuus.LIPPU_SACK |
+                         luotettavuus.LIPPU_IKKUNA)
+        sekvno, data = self.krs.pura(kuittaus)
+        ikkuna, = luotettavuus.IKKUNA.unpack_from(data)
+        kartta = int.from_bytes(data[luotettavuus.IKKUNA.size:],
+                                byteorder='big')
+        return sekvno, ikkuna, kartta
+
+
+    def test_valikoiva_kuittaus(self):
+        # Väärässä järjestyksessä saapuneet paketit näkyvät
+        # bittikartassa, ja kumulatiivinen kuittaus etenee vasta, kun
+        # aukko täyttyy.
+        edellinen = self.vastott.max - 1
+        self.laheta(self.krs.valm_paketti(2, b'C'))
+        self.assertIsNone(self.ota_vastaan())
+        self.assertEqual(self.lue_kuittaus()[::2], (edellinen, 0b100))
+        self.laheta(self.krs.valm_paketti(1, b'B'))
+        self.assertIsNone(self.ota_vastaan())
+        self.assertEqual(self.lue_kuittaus()[::2], (edellinen, 0b110))
+        self.laheta(self.krs.valm_paketti(0, b'A'))
+        self.assertEqual(self.ota_vastaan(), [b'A', b'B', b'C'])
+        self.assertEqual(self.lue_kuittaus()[::2], (2, 0))
+
+
+    def test_sack_kartta(self):
+        # Bittikartassa on bitti jokaista vastaanottoikkunan paikkaa
+        # kohti. Ikkunan ensimmäinen paikka on aina tyhjä.
+        self.assertEqual(len(self.vastott.sack_kartta()),
+                         (self.vastott.ikkuna + 7) // 8)
+        self.laheta(self.krs.valm_paketti(3, b'D'))
+        self.ota_vastaan()
+        self.assertEqual(int.from_bytes(self.vastott.sack_kartta(),
+                                        byteorder='big'), 0b1000)
+
+
+    def ei_kuittausta(self):
+        aikaraja = self.lahettaja.gettimeout()
+        self.lahettaja.settimeout(0.05)
+        try:
+            with self.assertRaises(s.timeout):
+                self.lahettaja.recv(64)
+        finally:
+            self.lahettaja.settimeout(aikaraja)
+
+
+    def test_viivastettu_kuittaus_kuittausvali(self):
+        # Joka toinen järjestyksessä saapunut paketti kuitataan heti.
+        self.vastott.kuittausvali = 2
+        self.vastott.kuittausviive = 60
+        self.laheta(self.krs.valm_paketti(0, b'eka'))
+        self.ota_vastaan()
+        self.ei_kuittausta()
+        self.laheta(self.krs.valm_paketti(1, b'toka'))
+        self.ota_vastaan()
+        self.assertEqual(self.lue_kuittaus()[0], 1)
+        self.assertIsNone(self.vastott.kuittaushetki)
+
+
+    def test_viivastettu_kuittaus_kuittausviive(self):
+        # Yksittäinen paketti kuitataan kuittausviiveen kuluttua, vaikka
+        # uutta pakettia ei tule.
+        self.vastott.kuittausvali = 2
+        self.vastott.kuittausviive = 0.05
+        self.laheta(self.krs.valm_paketti(0, b'eka'))
+        self.ota_vastaan()
+        self.ei_kuittausta()
+        self.vastott.soketti.settimeout(0.2)
+        alku = time.monotonic()
+        with self.assertRaises(s.timeout):
+            self.ota_vastaan()
+        self.assertEqual(self.lue_kuittaus()[0], 0)
+        self.assertLess(time.monotonic() - alku, 5)
+        # Lukemisen aikaraja palautetaan ennalleen.
+        self.assertEqual(self.vastott.soketti.gettimeout(), 0.2)
+
+
+    def test_vaara_jarjestys_kuitataan_heti(self):
+        # Väärässä järjestyksessä saapunut paketti kuitataan heti, ja
+        # kuittaus kattaa myös viivästetyn kuittauksen.
+        self.vastott.kuittausvali = 2
+        self.vastott.kuittausviive = 60
+        self.laheta(self.krs.valm_paketti(0, b'eka'))
+        self.ota_vastaan()
+        self.ei_kuittausta()
+        self.laheta(self.krs.valm_paketti(2, b'kolmas'))
+        self.assertFalse(self.ota_vastaan())
+        self.assertEqual(self.lue_kuittaus()[0], 0)
+        self.assertIsNone(self.vastott.kuittaushetki)
+
+
+    def test_ikkuna_avautuu(self):
+        # Kun sovelluksen jono on täynnä, ilmoitetaan nollaikkuna. Kun
+        # sovellus vapauttaa viestin, ikkunan avautumisesta kuitataan
+        # heti.
+        self.vastott.jonon_koko = 1
+        self.laheta(self.krs.valm_paketti(0, b'eka'))
+        viesti = self.vastott.ota_vastaan_bytes()
+        self.assertEqual(self.lue_kuittaus()[1], 0)
+        self.vastott.vapauta(viesti[0])
+        self.assertEqual(self.lue_kuittaus()[:2], (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import moniprosessi
+import os
+import sys
+
+
+def tulosta(numero, lahettaja, viesti):
+    '''Työprosessien käsittelijä: tulostaa saapuneen viestin.'''
+    print('Prosessi {}: saapunut viesti osoitteesta {}: "{}".\n'.format(
+        numero, lahettaja, bytes(viesti).decode('utf8', 'replace')))
+
+
+def main():
+    '''Pääohjelma. Kuten vastott_app.py palvelintilassa, mutta
+    vastaanottajia on usea prosessi, jotka jakavat saman portin.'''
+    palvelin = 'localhost'
+    portti = 9999
+    prosesseja = os.cpu_count() or 1
+    puskurin_koko = 1472  # Oltava sama kuin lähettäjällä.
+
+    try:
+        prosessit = moniprosessi.kaynnista(prosesseja, (palvelin, portti),
+                                           puskurin_koko, tulosta)
+    except OSError:
+        sys.exit('Virhe: {}.'.format(sys.exc_info()[1]))
+
+    print('Palvelin valmiina portissa {} ({} prosessia).'.format(
+        portti, prosesseja))
+    print('Paina Ctrl-C lopettaaksesi.\n')
+
+    try:
+        for prosessi in prosessit:
+            prosessi.join()
+    except KeyboardInterrupt:  # Käyttäjä painoi Ctrl-C.
+        pass
+    for prosessi in prosessit:
+        prosessi.join()
+    input('\n------------' +\
+          '\nSoketit suljettu.' +\
+          '\nPaina Enter.')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,10 +10,10 @@ class Virtuaalisoketti(s.socket):
     '''Virtuaalinen soketti simuloi ei-luotettavaa tiedonsiirtoa.
 
     Virtuaalisoketti on toteutettu perimällä se normaalista soketista.
-    Uudestaan on toteutettu (init-metodin lisäksi) ainoastaan recvfrom-metodi.
-    Näin ollen virtuaalista sokettia käytettäessä on tarkoitus kutsua vain
-    edellä mainittua metodia, sillä muut soketin metodit toimivat kuten
-    tavallisessa soketissa.
+    Uudestaan on toteutettu (init-metodin lisäksi) ainoastaan recvfrom- ja
+    recvfrom_into-metodit. Näin ollen virtuaalista sokettia käytettäessä on
+    tarkoitus kutsua vain edellä mainittuja metodeita, sillä muut soketin
+    metodit toimivat kuten tavallisessa soketissa.
     '''
     tn_pudotus = .0  # Millä todennäköisyydellä paketti pudotetaan?
 
@@ -41,6 +41,23 @@ class Virtuaalisoketti(s.socket):
                 saapunut = self.virhe(saapunut)
                 return saapunut
 
+
+    def recvfrom_into(self, puskuri, nbytes=0):
+        '''Toimii kuten tavallisen soketin recvfrom_into-metodi, mutta
+        mukana on myös ei-luotettavan tiedonsiirron simulointi.'''
+        while True:
+            saapunut = super().recvfrom_into(puskuri, nbytes)
+
+            if rand.random() < self.tn_pudotus:
+                print('(Virtuaalisoketti hukkasi paketin.)')
+            else:
+                self.viive()
+                pituus, _ = saapunut
+                if pituus and rand.random() < self.tn_virhe:
+                    nakyma = memoryview(puskuri)[:pituus]
+                    nakyma[:] = self.bittivirhe(nakyma)
+                return saapunut
+
             
     def viive(self):
         '''Keskeyttää satunnaisesti ohjelman suorituksen satunnaisen